@@ -80,13 +80,30 @@ admin.site.register(SpotImage, SpotImageAdmin)
 
 class SpotAvailableHoursAdmin(admin.ModelAdmin):
     """ The admin model for SpotAvailableHours.
+    Hours are deleted one at a time, so each spot's open intervals are rebuilt.
     """
     list_filter = ('day', 'spot')
+    actions = ['delete_model']
+
+    def get_actions(self, request):
+        actions = super(SpotAvailableHoursAdmin, self).get_actions(request)
+        del actions['delete_selected']
+        return actions
+
+    def delete_model(self, request, queryset):
+        if type(queryset) is SpotAvailableHours:
+            queryset.delete()
+        else:
+            with batched_saves():
+                for hours in queryset.all():
+                    hours.delete()
+    delete_model.short_description = "Delete selected spot available hours"
 admin.site.register(SpotAvailableHours, SpotAvailableHoursAdmin)
 
 
 class SpotExtendedInfoAdmin(admin.ModelAdmin):
     """ The admin model for SpotExtendedInfo.
+    Extended info is deleted one at a time, so the search index and each spot's ETag are updated.
     """
     if hasattr(settings, 'SPOTSEEKER_EXTENDEDINFO_FORM'):
         module, attr = settings.SPOTSEEKER_EXTENDEDINFO_FORM.rsplit('.', 1)
@@ -103,6 +120,21 @@ class SpotExtendedInfoAdmin(admin.ModelAdmin):
     list_display = ("spot", "key", "value")
     list_editable = ["key", "value"]
     list_filter = ["key", "spot"]
+    actions = ['delete_model']
+
+    def get_actions(self, request):
+        actions = super(SpotExtendedInfoAdmin, self).get_actions(request)
+        del actions['delete_selected']
+        return actions
+
+    def delete_model(self, request, queryset):
+        if type(queryset) is SpotExtendedInfo:
+            queryset.delete()
+        else:
+            with batched_saves():
+                for info in queryset.all():
+                    info.delete()
+    delete_model.short_description = "Delete selected spot extended info"
 admin.site.register(SpotExtendedInfo, SpotExtendedInfoAdmin)
 
 
@@ -0,0 +1,129 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+
+Geohash encoding, used as a spatial index for Spot locations.
+
+A geohash interleaves longitude and latitude bits into a base32 string, so
+every spot inside a geohash cell shares that cell's hash as a prefix.  A
+bounding box can then be answered with a handful of index range scans on
+the Spot.geohash column instead of a full scan on latitude/longitude.
+"""
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Longest hash stored on a Spot - about 3.7cm x 1.9cm, well past the
+# precision of the latitude/longitude columns.
+MAX_PRECISION = 12
+
+# Upper bound on the number of cells used to cover a search bounding box.
+MAX_COVERING_CELLS = 16
+
+# Sorts after every character in BASE32, so "<prefix>" <= hash < "<prefix>~"
+# holds for exactly the hashes that start with prefix.
+PREFIX_END = "~"
+
+
+def encode(latitude, longitude, precision=MAX_PRECISION):
+    """ Returns the geohash of the given point, precision characters long.
+    """
+    latitude = float(latitude)
+    longitude = float(longitude)
+
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(geohash) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits = bits << 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits = bits << 1
+                lat_range[1] = mid
+
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(geohash)
+
+
+def cell_size(precision):
+    """ Returns the (latitude, longitude) size in degrees of a geohash cell.
+    """
+    total_bits = precision * 5
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def covering_prefixes(south, west, north, east, max_cells=MAX_COVERING_CELLS):
+    """ Returns a list of geohash prefixes whose cells together cover the
+    bounding box.  Uses the longest precision that needs no more than
+    max_cells cells, so the prefixes are as selective as possible.  A box
+    with west > east is one that crosses the antimeridian.
+    """
+    south = max(float(south), -90.0)
+    north = min(float(north), 90.0)
+    west = max(float(west), -180.0)
+    east = min(float(east), 180.0)
+
+    if south > north:
+        return []
+
+    if west > east:
+        # The box crosses the antimeridian - cover the part on each side of it
+        half = max(max_cells // 2, 1)
+        return sorted(set(covering_prefixes(south, west, north, 180.0, half) +
+                          covering_prefixes(south, -180.0, north, east, half)))
+
+    for precision in range(MAX_PRECISION, 0, -1):
+        lat_step, lon_step = cell_size(precision)
+        lat_cells = int((north - south) / lat_step) + 2
+        lon_cells = int((east - west) / lon_step) + 2
+        if lat_cells * lon_cells <= max_cells:
+            break
+
+    lat_step, lon_step = cell_size(precision)
+    prefixes = set()
+    latitude = south
+    while True:
+        longitude = west
+        while True:
+            prefixes.add(encode(latitude, longitude, precision))
+            if longitude >= east:
+                break
+            longitude = min(longitude + lon_step, east)
+        if latitude >= north:
+            break
+        latitude = min(latitude + lat_step, north)
+
+    return sorted(prefixes)
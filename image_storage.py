@@ -0,0 +1,260 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+
+Spot images are stored by content, as space_images/<ab>/<sha256>.<ext>.  An
+upload with the same bytes as an image that's already stored shares its
+file, and the file is only removed once no image uses it any more.
+
+Uploads to the image views are hashed as they stream in.  Images saved any
+other way are hashed when they're saved.
+
+Uploads are checked as they stream in too.  The format and size of the image
+are read from its header, and an upload that's too big, has too many pixels
+or isn't an accepted image is turned away without storing any more of it.
+Images with too many pixels are also refused when they're saved, before PIL
+decodes them.  The limits can be set in your settings.py:
+
+SPOTSEEKER_MAX_IMAGE_BYTES = 20 * 1024 * 1024
+SPOTSEEKER_MAX_IMAGE_PIXELS = 40 * 1000 * 1000
+
+Large JPEG and PNG images can be scaled down when they're saved, so nothing
+bigger than the apps show is stored or thumbnailed.  It's off by default:
+
+SPOTSEEKER_MAX_IMAGE_DIMENSION = 2048  # Pixels, for the longer side
+"""
+
+from django.core.files.uploadhandler import FileUploadHandler, MemoryFileUploadHandler, TemporaryFileUploadHandler, SkipFile
+from django.core.files.base import ContentFile
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+from django.conf import settings
+from cStringIO import StringIO
+from PIL import Image
+from functools import wraps
+import hashlib
+
+IMAGE_DIRECTORY = "space_images"
+
+CONTENT_TYPES = {
+    "JPEG": "image/jpeg",
+    "GIF": "image/gif",
+    "PNG": "image/png",
+}
+
+EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "image/png": ".png",
+}
+
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024
+DEFAULT_MAX_PIXELS = 40 * 1000 * 1000
+
+# How much of an upload is read looking for the image header, which for a
+# JPEG can come after a lot of EXIF data
+SNIFF_LIMIT = 256 * 1024
+
+# Room in the request body for the other form fields along with the image
+FORM_ALLOWANCE = 64 * 1024
+
+# Formats that can be scaled down without losing anything but pixels - not animated GIFs
+NORMALIZED_FORMATS = ["JPEG", "PNG"]
+
+
+def max_image_bytes():
+    return getattr(settings, 'SPOTSEEKER_MAX_IMAGE_BYTES', DEFAULT_MAX_BYTES)
+
+
+def max_image_pixels():
+    return getattr(settings, 'SPOTSEEKER_MAX_IMAGE_PIXELS', DEFAULT_MAX_PIXELS)
+
+
+class ImageRejected(Exception):
+    """ Raised for an image that can't be stored, with the HTTP status to give the client.
+    """
+    def __init__(self, message, status=400):
+        super(ImageRejected, self).__init__(message)
+        self.message = message
+        self.status = status
+
+
+def check_image(image_format, size):
+    """ Raises ImageRejected for an image of a format or size that isn't accepted.
+    """
+    if image_format not in CONTENT_TYPES:
+        raise ImageRejected("Not an accepted image format")
+    if size[0] * size[1] > max_image_pixels():
+        raise ImageRejected("Image has more than {0} pixels".format(max_image_pixels()), 413)
+
+
+def sniff_image(head):
+    """ Returns the (format, size) of an image from the start of its file, or None
+    if the header isn't all there yet.  Only the header is read, nothing is decoded.
+    """
+    try:
+        im = Image.open(StringIO(head))
+        return im.format, im.size
+    except Exception:
+        return None
+
+
+class ImageCheckUploadHandler(FileUploadHandler):
+    """ Checks uploaded images as they stream in, ahead of the handlers that store
+    them.  The first problem found is kept as request.upload_error, an ImageRejected,
+    and the file is skipped.
+    """
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request.upload_error = None
+        if content_length > max_image_bytes() + FORM_ALLOWANCE:
+            # Don't read any of it
+            self.request.upload_error = self.too_big()
+            return QueryDict('', encoding=encoding), MultiValueDict()
+
+    def new_file(self, *args, **kwargs):
+        super(ImageCheckUploadHandler, self).new_file(*args, **kwargs)
+        self.head = ""
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > max_image_bytes():
+            self.reject(self.too_big())
+
+        if self.head is not None:
+            self.head += raw_data
+            sniffed = sniff_image(self.head)
+            if sniffed:
+                self.head = None
+                try:
+                    check_image(*sniffed)
+                except ImageRejected as e:
+                    self.reject(e)
+            elif len(self.head) > SNIFF_LIMIT:
+                self.reject(ImageRejected("Not an accepted image format"))
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+    def too_big(self):
+        return ImageRejected("Image is larger than {0} bytes".format(max_image_bytes()), 413)
+
+    def reject(self, error):
+        if self.request.upload_error is None:
+            self.request.upload_error = error
+        raise SkipFile()
+
+
+class ContentHashMixin(object):
+    """ Makes an upload handler hash the chunks it's given, and put the hash on
+    the file it returns as content_hash.
+    """
+    def new_file(self, *args, **kwargs):
+        self.sha = hashlib.sha256()
+        return super(ContentHashMixin, self).new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha.update(raw_data)
+        return super(ContentHashMixin, self).receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super(ContentHashMixin, self).file_complete(file_size)
+        if upload is not None:
+            upload.content_hash = self.sha.hexdigest()
+        return upload
+
+
+class HashingMemoryFileUploadHandler(ContentHashMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(ContentHashMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def prepare_uploads(request):
+    """ Has the images uploaded with a request checked and hashed as they're read.
+    Does nothing if the request body has already been read.
+    """
+    if hasattr(request, '_files'):
+        return
+    request.upload_handlers = [ImageCheckUploadHandler(request),
+                               HashingMemoryFileUploadHandler(request),
+                               HashingTemporaryFileUploadHandler(request)]
+
+
+def prepares_uploads(func):
+    """ Decorates a view method to call prepare_uploads before anything else reads
+    the request body.  Put it above user_auth_required - an auth module that
+    reads request.POST would otherwise have the uploads stored unchecked.
+    """
+    @wraps(func)
+    def inner(self, request, *args, **kwargs):
+        prepare_uploads(request)
+        return func(self, request, *args, **kwargs)
+    return inner
+
+
+def upload_error(request):
+    """ Returns the ImageRejected for an upload turned away by prepare_uploads, or None.
+    The request body is read, if it hasn't been already.
+    """
+    request.FILES
+    return getattr(request, 'upload_error', None)
+
+
+def normalized_image(img, upload):
+    """ Returns a ContentFile of the image scaled down to SPOTSEEKER_MAX_IMAGE_DIMENSION,
+    or None if it doesn't need to be, or can't be.  img is the upload opened with PIL.
+    """
+    limit = getattr(settings, 'SPOTSEEKER_MAX_IMAGE_DIMENSION', None)
+    if not limit or max(img.size) <= limit or img.format not in NORMALIZED_FORMATS:
+        return None
+
+    image_format = img.format
+    scale = float(limit) / max(img.size)
+    size = (max(int(img.size[0] * scale), 1), max(int(img.size[1] * scale), 1))
+    # Fine to decode a JPEG at a reduced scale, it's being scaled down anyway
+    img.draft(img.mode, size)
+    img = img.resize(size, Image.ANTIALIAS)
+    data = StringIO()
+    if image_format == "JPEG":
+        img.save(data, image_format, quality=90)
+    else:
+        img.save(data, image_format, optimize=True)
+
+    normalized = ContentFile(data.getvalue())
+    normalized.name = upload.name
+    return normalized
+
+
+def content_hash(upload):
+    """ Returns the sha256 of a file, using the one worked out while it was uploaded if there is one.
+    """
+    if getattr(upload, 'content_hash', None):
+        return upload.content_hash
+    sha = hashlib.sha256()
+    for chunk in upload.chunks():
+        sha.update(chunk)
+    return sha.hexdigest()
+
+
+def content_path(sha, content_type):
+    # Split up, so no one directory gets every image
+    return "{0}/{1}/{2}{3}".format(IMAGE_DIRECTORY, sha[:2], sha, EXTENSIONS.get(content_type, ""))
+
+
+def image_upload_path(instance, filename):
+    """ The upload_to of SpotImage.image - where the image's bytes are stored, whatever the upload was called.
+    """
+    return content_path(instance.content_hash, instance.content_type)
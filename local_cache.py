@@ -0,0 +1,102 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+
+A small in-process LRU cache, used in front of django's cache for spot JSON.
+
+Every entry is stored with a version - for spots, the ETag and last_modified
+- and is only returned to a caller asking for that same version, so an entry
+left over from before a change is never served, even though other processes
+can't tell this one about the change.
+
+Configure it in your settings.py with:
+
+SPOTSEEKER_LOCAL_CACHE_SIZE = 1000  # Entries kept per process, 0 turns it off
+SPOTSEEKER_LOCAL_CACHE_TIMEOUT = 60  # Seconds an entry is kept
+"""
+
+from django.conf import settings
+from collections import OrderedDict
+import threading
+import time
+
+DEFAULT_SIZE = 1000
+DEFAULT_TIMEOUT = 60
+
+
+class LocalCache(object):
+    """ A bounded, thread safe LRU cache of versioned values, with hit and miss counters.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def max_size(self):
+        return getattr(settings, 'SPOTSEEKER_LOCAL_CACHE_SIZE', DEFAULT_SIZE)
+
+    def timeout(self):
+        return getattr(settings, 'SPOTSEEKER_LOCAL_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+    def get(self, key, version):
+        """ Returns the value cached for key at version, or None.
+        """
+        if not self.max_size():
+            return None
+
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None or entry[0] != version or entry[1] < time.time():
+                self.misses += 1
+                return None
+
+            # Back on the end, as the most recently used
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, version, value):
+        max_size = self.max_size()
+        if not max_size:
+            return
+
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (version, time.time() + self.timeout(), value)
+            while len(self.entries) > max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.entries),
+                "max_size": self.max_size(),
+            }
+
+
+# Spot JSON, keyed by spot id and versioned by the spot's ETag
+spot_cache = LocalCache()
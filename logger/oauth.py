@@ -34,10 +34,12 @@ class LogMiddleware:
         response_status = response.status_code
 
         # response.content will empty out the FileWrapper object on file downloads -
-        # those views need to correctly set their own content length
+        # those views need to correctly set their own content length.  Streamed
+        # responses are logged once they've been sent, when their size is known
+        streaming = getattr(response, 'streaming', False)
         if 'Content-Length' in response:
             response_length = response["Content-Length"]
-        else:
+        elif not streaming:
             response_length = len(response.content)
 
         oauth_app_pk = "-"
@@ -53,8 +55,13 @@ class LogMiddleware:
 
         timestamp = datetime.now().strftime("%d/%b/%Y %H:%M:%S")
 
-        log_message = "[{0}] {1}\t\"{2}\"\t{3}\t\"{4} {5}\" {6} {7}".format(timestamp, oauth_app_pk, oauth_app_name, oauth_user, request_method, request_uri, response_status, response_length)
+        def log(response_length):
+            log_message = "[{0}] {1}\t\"{2}\"\t{3}\t\"{4} {5}\" {6} {7}".format(timestamp, oauth_app_pk, oauth_app_name, oauth_user, request_method, request_uri, response_status, response_length)
+            self.logger.info(log_message)
 
-        self.logger.info(log_message)
+        if streaming and 'Content-Length' not in response:
+            response.on_complete(log)
+        else:
+            log(response_length)
 
         return response
@@ -0,0 +1,131 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+
+This provides a management command to django's manage.py called
+benchmark_spatial_search that compares distance searches on the plain
+latitude/longitude columns with searches through the geohash index.
+
+The sample spots are created inside a transaction that is rolled back, so
+existing data is left alone.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from optparse import make_option
+from spotseeker_server.models import Spot
+from spotseeker_server.views.search import SearchView
+from spotseeker_server import geohash
+from pyproj import Geod
+from decimal import *
+import random
+import time
+
+
+class Command(BaseCommand):
+    help = 'Times distance searches with and without the geohash spatial index'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--spots',
+                    dest='spots',
+                    default='10000,100000',
+                    help='Comma separated list of spot counts to benchmark'),
+
+        make_option('--queries',
+                    dest='queries',
+                    default=200,
+                    type='int',
+                    help='Number of searches to time for each spot count'),
+
+        make_option('--distance',
+                    dest='distance',
+                    default=500,
+                    type='int',
+                    help='Search radius in meters'),
+        )
+
+    # Roughly a 20km square around the UW Seattle campus
+    CENTER_LATITUDE = 47.6550
+    CENTER_LONGITUDE = -122.3080
+    SPREAD = 0.1
+
+    def handle(self, *args, **options):
+        try:
+            counts = [int(count) for count in options['spots'].split(',')]
+        except ValueError:
+            raise CommandError("--spots must be a comma separated list of numbers")
+
+        for count in counts:
+            self.benchmark(count, options['queries'], options['distance'])
+
+    @transaction.commit_manually
+    def benchmark(self, count, queries, distance):
+        try:
+            self.create_spots(count)
+
+            g = Geod(ellps='clrk66')
+            view = SearchView()
+            random.seed(count)
+            boxes = []
+            for i in range(queries):
+                lat, lon = self.random_point()
+                top = g.fwd(lon, lat, 0, distance)
+                right = g.fwd(lon, lat, 90, distance)
+                bottom = g.fwd(lon, lat, 180, distance)
+                left = g.fwd(lon, lat, 270, distance)
+                boxes.append((bottom[1], left[0], top[1], right[0]))
+
+            def range_query(south, west, north, east):
+                return Spot.objects.filter(longitude__gte="%.8f" % west, longitude__lte="%.8f" % east,
+                                           latitude__gte="%.8f" % south, latitude__lte="%.8f" % north)
+
+            def geohash_query(south, west, north, east):
+                return range_query(south, west, north, east).filter(view.geohash_filter(south, west, north, east))
+
+            range_time, range_found = self.time_queries(range_query, boxes)
+            geohash_time, geohash_found = self.time_queries(geohash_query, boxes)
+
+            if range_found != geohash_found:
+                raise CommandError("The geohash search found %s spots, the range search found %s" % (geohash_found, range_found))
+
+            self.stdout.write("%s spots, %s searches of %sm, %s spots found\n" % (count, queries, distance, range_found))
+            self.stdout.write("  lat/long range:  %.2fms per search\n" % (range_time * 1000 / queries))
+            self.stdout.write("  geohash index:   %.2fms per search\n" % (geohash_time * 1000 / queries))
+        finally:
+            transaction.rollback()
+
+    def create_spots(self, count):
+        batch = []
+        for i in range(count):
+            lat, lon = self.random_point()
+            latitude = Decimal("%.8f" % lat)
+            longitude = Decimal("%.8f" % lon)
+            # bulk_create skips Spot.save, so the geohash is filled in here
+            batch.append(Spot(name="Benchmark spot %s" % i, latitude=latitude, longitude=longitude,
+                              geohash=geohash.encode(latitude, longitude)))
+            if len(batch) == 500:
+                Spot.objects.bulk_create(batch)
+                batch = []
+        Spot.objects.bulk_create(batch)
+
+    def random_point(self):
+        return (self.CENTER_LATITUDE + random.uniform(-self.SPREAD, self.SPREAD),
+                self.CENTER_LONGITUDE + random.uniform(-self.SPREAD, self.SPREAD))
+
+    def time_queries(self, build_query, boxes):
+        found = 0
+        start = time.time()
+        for box in boxes:
+            found += len(list(build_query(*box).values_list('id', flat=True)))
+        return time.time() - start, found
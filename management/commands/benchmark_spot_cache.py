@@ -0,0 +1,88 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+
+This provides a management command to django's manage.py called
+benchmark_spot_cache that compares the CPU time of building an all spots
+response with spots cached as dicts and as encoded JSON - the two values of
+SPOTSEEKER_SPOT_CACHE_FORMAT.
+
+It uses the configured cache backend.  The sample spots are created inside a
+transaction that is rolled back, and their cache entries are removed.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from optparse import make_option
+from spotseeker_server.models import Spot, SpotExtendedInfo, SpotAvailableHours
+from spotseeker_server import models
+from decimal import *
+import time
+
+
+class Command(BaseCommand):
+    help = 'Times all spots responses with spots cached as dicts and as JSON'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--spots',
+                    dest='spots',
+                    default=1000,
+                    type='int',
+                    help='Number of spots in the response'),
+
+        make_option('--requests',
+                    dest='requests',
+                    default=20,
+                    type='int',
+                    help='Number of responses to time in each mode'),
+        )
+
+    @transaction.commit_manually
+    def handle(self, *args, **options):
+        spots = []
+        try:
+            spots = self.create_spots(options['spots'])
+            self.stdout.write("%s spots, %s requests per mode, warm cache\n" % (len(spots), options['requests']))
+            for cache_format in ['dict', 'json']:
+                with override_settings(SPOTSEEKER_SPOT_CACHE_FORMAT=cache_format):
+                    models.cache.delete_many([spot.pk for spot in spots])
+                    # The first request fills the cache
+                    self.render(spots)
+
+                    start = time.clock()
+                    for i in range(options['requests']):
+                        content = self.render(spots)
+                    cpu_time = time.clock() - start
+
+                    self.stdout.write("  %-5s %.2fms CPU per request, %s bytes\n" % (cache_format, cpu_time * 1000 / options['requests'], len(content)))
+        finally:
+            models.cache.delete_many([spot.pk for spot in spots])
+            transaction.rollback()
+
+    def render(self, spots):
+        # What AllSpotsView does with each format
+        return "[{0}]".format(",".join(Spot.bulk_json_fragments(spots)))
+
+    def create_spots(self, count):
+        spots = []
+        for i in range(count):
+            spot = Spot.objects.create(name="Benchmark spot %s" % i, capacity=20,
+                                       latitude=Decimal('47.653811'), longitude=Decimal('-122.307815'),
+                                       building_name="Benchmark Building", floor="%s" % (i % 5))
+            SpotExtendedInfo.objects.create(spot=spot, key="has_outlets", value="true")
+            SpotExtendedInfo.objects.create(spot=spot, key="noise_level", value="quiet")
+            for day in ["m", "t", "w", "th", "f"]:
+                SpotAvailableHours.objects.create(spot=spot, day=day, start_time="08:00", end_time="17:00")
+            spots.append(spot)
+        return spots
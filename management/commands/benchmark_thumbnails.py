@@ -0,0 +1,113 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+
+This provides a management command to django's manage.py called
+benchmark_thumbnails that compares the latency and peak memory of rendering
+thumbnails with each resize mode, over the images in test/resources and
+large generated JPEGs.
+
+Each mode runs in a process of its own, so the peak RSS of one doesn't
+hide the other's.  The generated images are removed afterwards.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+from spotseeker_server.views.thumbnail import render_thumbnail, RESIZE_MODES
+from multiprocessing import Process, Queue
+from os.path import abspath, dirname, join
+from PIL import Image
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+
+RESOURCES = join(dirname(dirname(dirname(abspath(__file__)))), "test", "resources")
+
+
+class Command(BaseCommand):
+    help = 'Times thumbnail rendering with each resize mode'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--sizes',
+                    dest='sizes',
+                    default="2000x1500,4000x3000",
+                    help='Sizes of the generated JPEGs, comma separated'),
+
+        make_option('--thumbnail',
+                    dest='thumbnail',
+                    default="100x100",
+                    help='Size of the thumbnails'),
+
+        make_option('--requests',
+                    dest='requests',
+                    default=10,
+                    type='int',
+                    help='Number of thumbnails rendered per image in each mode'),
+        )
+
+    def handle(self, *args, **options):
+        try:
+            thumb_width, thumb_height = [int(value) for value in options['thumbnail'].split("x")]
+            sizes = [[int(value) for value in size.split("x")] for size in options['sizes'].split(",") if size]
+        except ValueError:
+            raise CommandError("Sizes look like 100x100")
+
+        directory = tempfile.mkdtemp()
+        try:
+            paths = sorted(join(RESOURCES, name) for name in os.listdir(RESOURCES) if self.is_image(join(RESOURCES, name)))
+            for width, height in sizes:
+                paths.append(self.generate_jpeg(directory, width, height))
+
+            self.stdout.write("%sx%s thumbnails, %s per image\n" % (thumb_width, thumb_height, options['requests']))
+            for resize_mode in RESIZE_MODES:
+                results = Queue()
+                worker = Process(target=self.time_mode, args=(results, paths, thumb_width, thumb_height, resize_mode, options['requests']))
+                worker.start()
+                timings, peak_rss = results.get()
+                worker.join()
+
+                self.stdout.write("%s: peak RSS %.1fMB\n" % (resize_mode, peak_rss / 1024.0))
+                for path, milliseconds in timings:
+                    self.stdout.write("  %-24s %8.2fms per thumbnail\n" % (os.path.basename(path), milliseconds))
+        finally:
+            shutil.rmtree(directory)
+
+    def time_mode(self, results, paths, thumb_width, thumb_height, resize_mode, requests):
+        timings = []
+        for path in paths:
+            start = time.time()
+            for i in range(requests):
+                render_thumbnail(path, thumb_width, thumb_height, False, resize_mode)
+            timings.append((path, (time.time() - start) * 1000 / requests))
+
+        # Kilobytes, on Linux
+        results.put((timings, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+    def is_image(self, path):
+        try:
+            Image.open(path).verify()
+            return True
+        except Exception:
+            return False
+
+    def generate_jpeg(self, directory, width, height):
+        """ Writes a photo-sized JPEG, with enough detail that it doesn't compress away to nothing.
+        """
+        tile = Image.new("RGB", (64, 48))
+        tile.putdata([(random.randint(0, 255), random.randint(0, 255), random.randint(0, 255)) for i in range(64 * 48)])
+        path = join(directory, "generated_%sx%s.jpg" % (width, height))
+        tile.resize((width, height), Image.BICUBIC).save(path, "JPEG", quality=90)
+        return path
@@ -0,0 +1,54 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+
+This provides a management command to django's manage.py called
+materialize_spots that stores the SpotDocument of every spot.  Run it after
+turning on SPOTSEEKER_MATERIALIZED_SPOTS, so spots that haven't been saved
+since then have a document too.  It can be run again safely at any time.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from optparse import make_option
+from spotseeker_server.models import Spot
+
+
+class Command(BaseCommand):
+    help = 'Stores the JSON document of every spot'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+                    dest='batch_size',
+                    default=200,
+                    type='int',
+                    help='Number of spots stored per transaction'),
+        )
+
+    def handle(self, *args, **options):
+        count = 0
+        last_pk = 0
+        while True:
+            spots = list(Spot.objects.filter(pk__gt=last_pk).order_by('pk')[:options['batch_size']])
+            if not spots:
+                break
+            self.store_documents(spots)
+            count += len(spots)
+            last_pk = spots[-1].pk
+
+        self.stdout.write("Stored %s spot documents\n" % count)
+
+    @transaction.commit_on_success
+    def store_documents(self, spots):
+        for spot in spots:
+            spot.save_document()
@@ -13,17 +13,29 @@
     limitations under the License.
 """
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
 from django.core.exceptions import ValidationError
+from django.utils.encoding import smart_str
 import hashlib
 import datetime
 import time
 from wsgiref.handlers import format_date_time
-import random
 from PIL import Image
 from cStringIO import StringIO
 import oauth_provider.models
+import simplejson as json
 from django.core.cache import cache
+from django.conf import settings
+from spotseeker_server import geohash
+from spotseeker_server import local_cache
+from spotseeker_server.thumbnail_cache import thumbnail_cache
+from spotseeker_server.image_storage import image_upload_path, content_hash, content_path, normalized_image, check_image, ImageRejected, CONTENT_TYPES
+from contextlib import contextmanager
+from functools import wraps
+import threading
+import sys
 
 
 class SpotType(models.Model):
@@ -42,6 +54,7 @@ class Spot(models.Model):
     spottypes = models.ManyToManyField(SpotType, max_length=50, related_name='spots')
     latitude = models.DecimalField(max_digits=11, decimal_places=8, null=True)
     longitude = models.DecimalField(max_digits=11, decimal_places=8, null=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True)
     height_from_sea_level = models.DecimalField(max_digits=11, decimal_places=8, null=True, blank=True)
     building_name = models.CharField(max_length=100, blank=True)
     floor = models.CharField(max_length=50, blank=True)
@@ -51,93 +64,636 @@ class Spot(models.Model):
     organization = models.CharField(max_length=50, blank=True)
     manager = models.CharField(max_length=50, blank=True)
     etag = models.CharField(max_length=40)
-    last_modified = models.DateTimeField(auto_now=True, auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True, auto_now_add=True, db_index=True)
 
     def __unicode__(self):
         return self.name
 
     def save(self, *args, **kwargs):
-        if cache.get(self.pk):
-            cache.delete(self.pk)
-        self.etag = hashlib.sha1("{0} - {1}".format(random.random(), time.time())).hexdigest()
-        super(Spot, self).save(*args, **kwargs)
+        """ Saves the spot as its next version.  With expected_etag, the save only
+        happens if the stored spot still has that ETag, otherwise ETagConflict is raised.
+        """
+        expected_etag = kwargs.pop('expected_etag', None)
+        self.update_geohash()
+        save_next_version(self, expected_etag, lambda: super(Spot, self).save(*args, **kwargs))
+        after_commit(cache.delete, self.pk)
+        if materialized_documents():
+            self.save_document()
+        bump_data_version()
+
+    def update_geohash(self):
+        """ Keeps the geohash spatial index in step with latitude and longitude.
+        """
+        try:
+            self.geohash = geohash.encode(self.latitude, self.longitude)
+        except (TypeError, ValueError):
+            self.geohash = ''
 
     def rest_url(self):
         return "/api/v1/spot/{0}".format(self.pk)
 
     def json_data_structure(self):
-        spot_json = cache.get(self.pk)
-        if not spot_json:
-            extended_info = {}
-            info = SpotExtendedInfo.objects.filter(spot=self)
-            for attr in info:
-                extended_info[attr.key] = attr.value
-
-            available_hours = {
-                'monday': [],
-                'tuesday': [],
-                'wednesday': [],
-                'thursday': [],
-                'friday': [],
-                'saturday': [],
-                'sunday': [],
-            }
-
-            hours = SpotAvailableHours.objects.filter(spot=self).order_by('start_time')
-            for window in hours:
-                available_hours[window.get_day_display()].append([window.start_time.strftime("%H:%M"), window.end_time.strftime("%H:%M")])
-
-            images = []
-            spot_images = SpotImage.objects.filter(spot=self)
-            for img in spot_images:
-                images.append({
-                    "id": img.pk,
-                    "url": img.rest_url(),
-                    "content-type": img.content_type,
-                    "width": img.width,
-                    "height": img.height,
-                    "creation_date": format_date_time(time.mktime(img.creation_date.timetuple())),
-                    "modification_date": format_date_time(time.mktime(img.modification_date.timetuple())),
-                    "upload_user": img.upload_user,
-                    "upload_application": img.upload_application,
-                    "thumbnail_root": "{0}/thumb".format(img.rest_url()),
-                    "description": img.description
-                })
-            types = []
-            spot_types = self.spottypes.all()
-            for t in spot_types:
-                types.append(t.name)
-
-            spot_json = {
-                "id": self.pk,
-                "uri": self.rest_url(),
-                "name": self.name,
-                "type": types,
-                "location": {
-                    # If any changes are made to this location dict, MAKE SURE to reflect those changes in the
-                    # location_descriptors list in views/schema_gen.py
-                    "latitude": self.latitude,
-                    "longitude": self.longitude,
-                    "height_from_sea_level": self.height_from_sea_level,
-                    "building_name": self.building_name,
-                    "floor": self.floor,
-                    "room_number": self.room_number,
-                },
-                "capacity": self.capacity,
-                "display_access_restrictions": self.display_access_restrictions,
-                "images": images,
-                "available_hours": available_hours,
-                "organization": self.organization,
-                "manager": self.manager,
-                "extended_info": extended_info,
-                "last_modified": self.last_modified.isoformat()
-            }
-            cache.add(self.pk, spot_json)
+        spot_json = self.cached_json()
+        if isinstance(spot_json, basestring):
+            spot_json = json.loads(spot_json, use_decimal=True)
         return spot_json
 
+    def json_fragment(self):
+        """ Returns the spot's json_data_structure, encoded as JSON.
+        """
+        spot_json = self.cached_json()
+        if not isinstance(spot_json, basestring):
+            spot_json = json.dumps(spot_json)
+        return spot_json
+
+    def cached_json(self):
+        """ Returns the spot's json_data_structure, either as a dict or encoded as
+        JSON, from the first of the per-process cache, django's cache, the spot's
+        document and its rows that has it.  Each is read at most once, and the
+        caches that didn't have it are filled in.
+        """
+        spot_json = local_cache.spot_cache.get(self.pk, self.local_cache_version())
+        if spot_json is None:
+            spot_json = cache.get(self.pk)
+            if not spot_json:
+                spot_json = self.stored_document()
+                if spot_json is None:
+                    spot_json = self.query_json_data_structure()
+                cache.add(self.pk, spot_cache_value(spot_json))
+            self.set_local_cache(spot_json)
+        return spot_json
+
+    def set_local_cache(self, spot_json):
+        """ Puts the spot's json in the per-process cache, always as a JSON string so
+        callers can't change the cached copy.  Returns the string.
+        """
+        if not isinstance(spot_json, basestring):
+            spot_json = json.dumps(spot_json)
+        local_cache.spot_cache.set(self.pk, self.local_cache_version(), spot_json)
+        return spot_json
+
+    def local_cache_version(self):
+        # last_modified as well, for a spot changed without a new ETag
+        return (self.etag, self.last_modified)
+
+    @classmethod
+    def bulk_json_fragments(cls, spots):
+        """ Returns the JSON encoded json_data_structure of each spot, in the same order.
+        Spots in the per-process cache, or cached as JSON, need no encoding at all.
+        """
+        return cls.bulk_json_data_structure(spots, decode=False)
+
+    @classmethod
+    def bulk_json_data_structure(cls, spots, decode=True):
+        """ Returns the json_data_structure of each spot, in the same order.  Spots
+        that aren't cached are built together, with one query per related table
+        for every BULK_JSON_BATCH_SIZE spots, and then cached in one go.
+
+        With decode=False the structures are returned encoded as JSON.
+        """
+        spots = list(spots)
+        cached = {}
+        for spot in spots:
+            spot_json = local_cache.spot_cache.get(spot.pk, spot.local_cache_version())
+            if spot_json is not None:
+                cached[spot.pk] = spot_json
+
+        remote = [spot for spot in spots if spot.pk not in cached]
+        if remote:
+            from_cache = cache.get_many([spot.pk for spot in remote])
+            for spot in remote:
+                spot_json = from_cache.get(spot.pk)
+                if spot_json:
+                    cached[spot.pk] = spot.set_local_cache(spot_json)
+        missing = [spot for spot in spots if spot.pk not in cached]
+
+        if missing and materialized_documents():
+            stored = {}
+            for offset in range(0, len(missing), BULK_JSON_BATCH_SIZE):
+                batch = dict((spot.pk, spot) for spot in missing[offset:offset + BULK_JSON_BATCH_SIZE])
+                for spot_id, etag, content in SpotDocument.objects.filter(spot__in=batch.keys()).values_list('spot', 'etag', 'content'):
+                    if etag == batch[spot_id].etag:
+                        stored[spot_id] = content
+            if stored:
+                cache.set_many(dict((spot_id, spot_cache_value(content)) for spot_id, content in stored.items()))
+                for spot in missing:
+                    if spot.pk in stored:
+                        cached[spot.pk] = spot.set_local_cache(stored[spot.pk])
+            missing = [spot for spot in missing if spot.pk not in stored]
+
+        built = {}
+        for offset in range(0, len(missing), BULK_JSON_BATCH_SIZE):
+            batch = dict((spot.pk, spot) for spot in missing[offset:offset + BULK_JSON_BATCH_SIZE])
+            info = dict((spot_id, []) for spot_id in batch)
+            hours = dict((spot_id, []) for spot_id in batch)
+            images = dict((spot_id, []) for spot_id in batch)
+            types = dict((spot_id, []) for spot_id in batch)
+
+            for attr in SpotExtendedInfo.objects.filter(spot__in=batch.keys()):
+                info[attr.spot_id].append(attr)
+            for window in SpotAvailableHours.objects.filter(spot__in=batch.keys()).order_by('start_time'):
+                hours[window.spot_id].append(window)
+            for img in SpotImage.objects.filter(spot__in=batch.keys()):
+                img.spot = batch[img.spot_id]  # Saves a query in img.rest_url()
+                images[img.spot_id].append(img)
+            for spot_type in cls.spottypes.through.objects.filter(spot__in=batch.keys()).select_related('spottype'):
+                types[spot_type.spot_id].append(spot_type.spottype)
+
+            for spot_id, spot in batch.items():
+                built[spot_id] = spot.build_json_data_structure(info[spot_id], hours[spot_id], images[spot_id], types[spot_id])
+
+        if built:
+            cache.set_many(dict((spot_id, spot_cache_value(spot_json)) for spot_id, spot_json in built.items()))
+            for spot in missing:
+                cached[spot.pk] = spot.set_local_cache(built[spot.pk])
+
+        structures = [cached[spot.pk] for spot in spots]
+        if decode:
+            structures = [json.loads(spot_json, use_decimal=True) for spot_json in structures]
+        return structures
+
+    def query_json_data_structure(self):
+        """ Builds the spot's json_data_structure from the database, without any caching.
+        """
+        return self.build_json_data_structure(SpotExtendedInfo.objects.filter(spot=self),
+                                              SpotAvailableHours.objects.filter(spot=self).order_by('start_time'),
+                                              SpotImage.objects.filter(spot=self),
+                                              self.spottypes.all())
+
+    def stored_document(self):
+        """ Returns the spot's SpotDocument content, encoded as JSON, if documents are on
+        and the stored one is for this version of the spot.  Otherwise returns None.
+        """
+        if not materialized_documents():
+            return None
+        try:
+            document = SpotDocument.objects.get(spot=self)
+        except SpotDocument.DoesNotExist:
+            return None
+        if document.etag != self.etag:
+            return None
+        return document.content
+
+    def save_document(self):
+        """ Rebuilds the spot's SpotDocument from its rows.  Spot.save does this, so it
+        only needs calling for changes that don't save the spot.
+        """
+        content = json.dumps(self.query_json_data_structure())
+        if not SpotDocument.objects.filter(spot=self).update(etag=self.etag, content=content):
+            SpotDocument.objects.create(spot=self, etag=self.etag, content=content)
+
+    def build_json_data_structure(self, info, hours, spot_images, spot_types):
+        """ Assembles the spot's json_data_structure from its related rows.
+        """
+        extended_info = {}
+        for attr in info:
+            extended_info[attr.key] = attr.value
+
+        available_hours = {
+            'monday': [],
+            'tuesday': [],
+            'wednesday': [],
+            'thursday': [],
+            'friday': [],
+            'saturday': [],
+            'sunday': [],
+        }
+
+        for window in hours:
+            available_hours[window.get_day_display()].append([window.start_time.strftime("%H:%M"), window.end_time.strftime("%H:%M")])
+
+        images = []
+        for img in spot_images:
+            images.append({
+                "id": img.pk,
+                "url": img.rest_url(),
+                "content-type": img.content_type,
+                "width": img.width,
+                "height": img.height,
+                "creation_date": format_date_time(time.mktime(img.creation_date.timetuple())),
+                "modification_date": format_date_time(time.mktime(img.modification_date.timetuple())),
+                "upload_user": img.upload_user,
+                "upload_application": img.upload_application,
+                "thumbnail_root": "{0}/thumb".format(img.rest_url()),
+                "description": img.description
+            })
+        types = []
+        for t in spot_types:
+            types.append(t.name)
+
+        spot_json = {
+            "type": types,
+            "images": images,
+            "available_hours": available_hours,
+            "extended_info": extended_info,
+        }
+        spot_json.update(self.json_fields())
+        return spot_json
+
+    def json_fields(self):
+        """ Returns the parts of the spot's json_data_structure that come from the spot itself.
+        """
+        return {
+            "id": self.pk,
+            "uri": self.rest_url(),
+            "name": self.name,
+            "location": {
+                # If any changes are made to this location dict, MAKE SURE to reflect those changes in the
+                # location_descriptors list in views/schema_gen.py
+                "latitude": self.latitude,
+                "longitude": self.longitude,
+                "height_from_sea_level": self.height_from_sea_level,
+                "building_name": self.building_name,
+                "floor": self.floor,
+                "room_number": self.room_number,
+            },
+            "capacity": self.capacity,
+            "display_access_restrictions": self.display_access_restrictions,
+            "organization": self.organization,
+            "manager": self.manager,
+            "last_modified": self.last_modified.isoformat()
+        }
+
+    def update_cached_json(self, spot_json):
+        """ Caches a json_data_structure for the spot that was updated in place, instead
+        of leaving it to be built again from all the spot's rows.  Call it once the write
+        is committed - nothing is cached if the stored spot isn't this version any more.
+        """
+        if not Spot.objects.filter(pk=self.pk, etag=self.etag).exists():
+            return
+        cache.set(self.pk, spot_cache_value(spot_json))
+        self.set_local_cache(spot_json)
+
     def delete(self, *args, **kwargs):
-        cache.delete(self.pk)
+        """ Deletes the spot.  With expected_etag, only if the stored spot still has
+        that ETag, otherwise ETagConflict is raised.  Call it in a transaction then.
+        """
+        expected_etag = kwargs.pop('expected_etag', None)
+        if expected_etag is not None:
+            claim_version(self, expected_etag)
+        after_commit(cache.delete, self.pk)
+        after_commit(local_cache.spot_cache.delete, self.pk)
+        info_keys = list(SpotExtendedInfo.objects.filter(spot=self).values_list('key', flat=True))
+        spot_id = self.pk
         super(Spot, self).delete(*args, **kwargs)
+        SpotTombstone.objects.create(spot_id=spot_id)
+        SpotExtendedInfo.invalidate_index(*info_keys)
+        bump_data_version()
+
+    def rebuild_open_intervals(self):
+        """ Regenerates the SpotOpenInterval index from this spot's available hours.
+        """
+        SpotOpenInterval.objects.filter(spot=self).delete()
+        intervals = open_intervals(SpotAvailableHours.objects.filter(spot=self))
+        SpotOpenInterval.objects.bulk_create([SpotOpenInterval(spot=self, start=start, end=end) for start, end in intervals])
+
+
+# Cache key of a counter that goes up whenever any spot data changes.  Cached
+# search results include it in their keys, so a write makes them all stale.
+DATA_VERSION_KEY = "spot_data_version"
+DATA_VERSION_TIMEOUT = 60 * 60 * 24
+
+
+def data_version():
+    """ Returns the current spot data version.
+    """
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        # Start from the clock, so a counter lost from the cache never goes back to a version that's been used
+        cache.add(DATA_VERSION_KEY, int(time.time() * 1000), DATA_VERSION_TIMEOUT)
+        version = cache.get(DATA_VERSION_KEY, int(time.time() * 1000))
+    return version
+
+
+def bump_data_version():
+    """ Marks all spot data derived from the current version as out of date, once
+    the write_transaction it's called in is over.
+    """
+    after_commit(increment_data_version)
+
+
+def increment_data_version():
+    try:
+        cache.incr(DATA_VERSION_KEY)
+    except ValueError:
+        cache.add(DATA_VERSION_KEY, int(time.time() * 1000), DATA_VERSION_TIMEOUT)
+
+
+_transactions = threading.local()
+
+
+class write_transaction(object):
+    """ transaction.commit_on_success, for views that write spots and images.  The
+    caches the writes make out of date are only cleared, and image files no one
+    uses any more only removed, once the transaction is over.  Cleared any
+    sooner, a request that can't see the new rows yet could fill a cache again
+    from the old ones.  Use it as a decorator, or as a with block.
+    """
+    def __call__(self, func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            with write_transaction():
+                return func(*args, **kwargs)
+        return inner
+
+    def __enter__(self):
+        depth = getattr(_transactions, 'depth', 0)
+        if depth == 0:
+            _transactions.pending = []
+        _transactions.depth = depth + 1
+        self.transaction = transaction.commit_on_success()
+        self.transaction.__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            return self.transaction.__exit__(exc_type, exc_value, traceback)
+        finally:
+            _transactions.depth -= 1
+            if _transactions.depth == 0:
+                # Run after a rollback too - each one checks what's really there, or only clears a cache
+                pending, _transactions.pending = _transactions.pending, None
+                for func, args in pending:
+                    func(*args)
+
+
+def after_commit(func, *args):
+    """ Calls func(*args) once the write_transaction it's called in is over, or
+    straight away outside one.  The same call queued twice is only made once.
+    """
+    pending = getattr(_transactions, 'pending', None)
+    if pending is None:
+        func(*args)
+    elif (func, args) not in pending:
+        pending.append((func, args))
+
+
+class ETagConflict(Exception):
+    """ Raised by a save or delete with an expected_etag, when the stored row has
+    another ETag - someone else changed it first.
+    """
+    pass
+
+
+def conditional_update(instance, expected_etag):
+    """ Saves an existing spot or image with UPDATE ... WHERE id = <pk> AND etag = <expected_etag>,
+    so a write that another one got in before fails with ETagConflict, without locking the row first.
+    """
+    values = {}
+    for field in instance._meta.local_fields:
+        if not field.primary_key:
+            values[field.name] = field.pre_save(instance, False)
+    if not type(instance).objects.filter(pk=instance.pk, etag=expected_etag).update(**values):
+        raise ETagConflict(instance.pk)
+
+
+def claim_version(instance, expected_etag):
+    """ Moves a spot or image on to its next ETag, if it still has expected_etag, or raises ETagConflict.
+    Until the transaction ends, other writes expecting the same ETag will fail.
+    """
+    if not type(instance).objects.filter(pk=instance.pk, etag=expected_etag).update(etag=next_etag(expected_etag)):
+        raise ETagConflict(instance.pk)
+
+
+def save_next_version(instance, expected_etag, insert):
+    """ Saves an existing spot or image with the ETag after the stored one, not the one
+    it was loaded with, so saves from two stale copies of a row can't give out the same
+    ETag.  The ETag is claimed the same way as with expected_etag, and if another save
+    gets in between reading it and writing, it's read again.  A new row is saved with insert.
+    """
+    if expected_etag is not None:
+        instance.etag = next_etag(expected_etag)
+        conditional_update(instance, expected_etag)
+        return
+
+    while instance.pk is not None:
+        # A locking read sees the latest ETag, even in a repeatable read transaction
+        stored = list(type(instance).objects.select_for_update().filter(pk=instance.pk).values_list('etag', flat=True))
+        if not stored:
+            break
+        instance.etag = next_etag(stored[0])
+        try:
+            conditional_update(instance, stored[0])
+            return
+        except ETagConflict:
+            pass
+
+    instance.etag = next_etag(instance.etag)
+    insert()
+
+
+def lock_version(instance, expected_etag):
+    """ Locks the row of a spot or image until the transaction ends, if it still has
+    expected_etag, or raises ETagConflict.  A save expecting that ETag can't then fail.
+    """
+    if not type(instance).objects.filter(pk=instance.pk, etag=expected_etag).update(etag=expected_etag):
+        raise ETagConflict(instance.pk)
+
+
+def next_etag(etag):
+    """ Returns the ETag for the next version of a spot or image.  ETags count
+    versions up from 1, so every server gives the same ETag for the same version,
+    after a mark of when the row was made.  A row made again with the id of a
+    deleted one (SQLite can do that) doesn't get the deleted row's ETags.
+    An ETag from before that starts over at 1.
+    """
+    try:
+        version, made = etag.split(".")
+        return "{0}.{1}".format(int(version) + 1, made)
+    except (AttributeError, ValueError):
+        return "1.{0:x}".format(int(time.time() * 1000000))
+
+
+class SpotSaveBatch(object):
+    """ The spots touched by hours, extended info and image changes inside batched_saves,
+    and what needs refreshing for them once the batch ends.
+    """
+    def __init__(self):
+        self.spots = {}
+        self.hours_changed = set()
+        self.info_keys = set()
+
+    def add(self, spot, hours_changed=False, info_keys=()):
+        self.spots[spot.pk] = spot
+        if hours_changed:
+            self.hours_changed.add(spot.pk)
+        self.info_keys.update(info_keys)
+
+    def finish(self):
+        SpotExtendedInfo.invalidate_index(*self.info_keys)
+        for pk, spot in self.spots.items():
+            if pk in self.hours_changed:
+                spot.rebuild_open_intervals()
+            spot.save()
+
+    def close(self):
+        """ Finishes the batch, or if the spots can't be saved, drops what's cached for them.
+        """
+        try:
+            self.finish()
+        except Exception:
+            # The database may not take any more writes, but nothing cached should outlive what was written
+            self.invalidate()
+            raise
+
+    def invalidate(self):
+        SpotExtendedInfo.invalidate_index(*self.info_keys)
+        after_commit(cache.delete_many, tuple(sorted(self.spots.keys())))
+        for pk in self.spots:
+            after_commit(local_cache.spot_cache.delete, pk)
+        bump_data_version()
+
+
+_save_batches = threading.local()
+
+
+@contextmanager
+def batched_saves():
+    """ Puts off the updates to the parent spot when hours, extended info or images
+    are saved or deleted, until the end of the block.  Then each spot that was
+    touched is saved once, for one new ETag and last_modified, and its open
+    intervals and extended info indexes are rebuilt once:
+
+    with batched_saves():
+        for day in ["m", "t", "w", "th", "f"]:
+            SpotAvailableHours.objects.create(spot=spot, day=day, start_time="08:00", end_time="17:00")
+
+    A batch inside another batch is part of the outer one.
+    """
+    if getattr(_save_batches, 'batch', None) is not None:
+        yield _save_batches.batch
+        return
+
+    batch = SpotSaveBatch()
+    _save_batches.batch = batch
+    try:
+        yield batch
+    except Exception:
+        # What was written before the error still needs a new ETag
+        error = sys.exc_info()
+        _save_batches.batch = None
+        try:
+            batch.close()
+        except Exception:
+            pass
+        raise error[0], error[1], error[2]
+    finally:
+        _save_batches.batch = None
+    batch.close()
+
+
+def spot_changed(spot, hours_changed=False, info_keys=()):
+    """ Saves a spot after a change to its hours, extended info, images or types, so it gets a
+    new ETag and last_modified, or inside batched_saves, records it for the end of the batch.
+    """
+    batch = getattr(_save_batches, 'batch', None)
+    if batch is None:
+        batch = SpotSaveBatch()
+        batch.add(spot, hours_changed, info_keys)
+        batch.finish()
+    else:
+        batch.add(spot, hours_changed, info_keys)
+
+
+@receiver(m2m_changed, sender=Spot.spottypes.through)
+def spot_types_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Saves the spots whose types were changed through the relation, like the admin
+    does, so their cached json and stored documents don't keep the old types.
+    """
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            spot_changed(instance)
+    elif action == "pre_clear":
+        # Which spots had the type is gone after the clear
+        instance._cleared_spots = list(instance.spots.all())
+    elif action == "post_clear":
+        for spot in instance.__dict__.pop('_cleared_spots', []):
+            spot_changed(spot)
+    elif action in ("post_add", "post_remove"):
+        for spot in Spot.objects.filter(pk__in=pk_set):
+            spot_changed(spot)
+
+
+def spot_cache_value(spot_json):
+    """ Returns what gets cached for a spot's json_data_structure - the dict itself,
+    or with SPOTSEEKER_SPOT_CACHE_FORMAT = "json", the dict already encoded as JSON.
+    spot_json can be either.
+    """
+    if getattr(settings, 'SPOTSEEKER_SPOT_CACHE_FORMAT', 'dict') == 'json':
+        if isinstance(spot_json, basestring):
+            return spot_json
+        return json.dumps(spot_json)
+    if isinstance(spot_json, basestring):
+        return json.loads(spot_json, use_decimal=True)
+    return spot_json
+
+
+def materialized_documents():
+    """ True if every spot's json_data_structure is also kept in a SpotDocument.
+    Turn it on in your settings.py with:
+
+    SPOTSEEKER_MATERIALIZED_SPOTS = True
+
+    and fill in the documents for the spots that are already there with
+    manage.py materialize_spots.
+    """
+    return getattr(settings, 'SPOTSEEKER_MATERIALIZED_SPOTS', False)
+
+
+# Number of spots bulk_json_data_structure builds per set of queries, kept
+# under the limit some databases put on the size of an IN clause
+BULK_JSON_BATCH_SIZE = 500
+
+SECONDS_PER_DAY = 24 * 60 * 60
+SECONDS_PER_WEEK = 7 * SECONDS_PER_DAY
+
+# Offsets into the week used by SpotOpenInterval, which starts on Sunday
+DAY_OFFSETS = {"su": 0, "m": 1, "t": 2, "w": 3, "th": 4, "f": 5, "sa": 6}
+
+
+def seconds_into_day(value):
+    """ Returns the whole seconds since midnight for a time, or for a "HH:MM[:SS]" string.
+    """
+    if isinstance(value, basestring):
+        parts = value.split(':')
+        value = datetime.time(int(parts[0]), int(parts[1]), int(float(parts[2])) if len(parts) > 2 else 0)
+    return value.hour * 60 * 60 + value.minute * 60 + value.second
+
+
+def open_intervals(available_hours):
+    """ Turns a spot's available hours into [start, end] intervals in seconds from
+    the start of Sunday, merging windows that carry on past midnight.
+    """
+    windows = []
+    for hours in available_hours:
+        day_start = DAY_OFFSETS[hours.day] * SECONDS_PER_DAY
+        windows.append([day_start + seconds_into_day(hours.start_time), day_start + seconds_into_day(hours.end_time)])
+    windows.sort()
+
+    intervals = []
+    for start, end in windows:
+        if intervals and (start <= intervals[-1][1] or runs_past_midnight(intervals[-1][1], start)):
+            intervals[-1][1] = max(intervals[-1][1], end)
+        else:
+            intervals.append([start, end])
+
+    # Hours that run from Saturday night into Sunday morning are one interval,
+    # stored in both the week it starts in and the week it ends in
+    if intervals and runs_past_midnight(intervals[-1][1], intervals[0][0] + SECONDS_PER_WEEK):
+        if len(intervals) == 1:
+            intervals = [[-SECONDS_PER_WEEK, 2 * SECONDS_PER_WEEK]]
+        else:
+            first = intervals.pop(0)
+            intervals[-1][1] = first[1] + SECONDS_PER_WEEK
+            intervals.append([intervals[-1][0] - SECONDS_PER_WEEK, first[1]])
+
+    return intervals
+
+
+def runs_past_midnight(end, next_start):
+    """ True if a window ending at end carries on into a window starting at
+    next_start - i.e. it ends at 23:59 and the other starts at 00:00 the next day.
+    """
+    return end % SECONDS_PER_DAY >= SECONDS_PER_DAY - 60 and next_start == end - end % SECONDS_PER_DAY + SECONDS_PER_DAY
 
 
 class SpotAvailableHours(models.Model):
@@ -168,14 +724,59 @@ class SpotAvailableHours(models.Model):
 
         if self.start_time >= self.end_time:
             raise Exception("Invalid time range - start time must be before end time")
-        other_hours = SpotAvailableHours.objects.filter(spot=self.spot, day=self.day).exclude(id=self.id)
-        for h in other_hours:
-            if h.start_time <= self.start_time <= h.end_time or self.start_time <= h.start_time <= self.end_time:
-                self.start_time = min(h.start_time, self.start_time)
-                self.end_time = max(h.end_time, self.end_time)
-                h.delete()
-        self.spot.save()  # Update the spot's last_modified
-        super(SpotAvailableHours, self).save(*args, **kwargs)
+        with batched_saves():
+            if self.pk:
+                # Hours moved to another spot, in the admin say, leave the old spot's intervals out of date too
+                for old_spot in Spot.objects.filter(spotavailablehours__pk=self.pk).exclude(pk=self.spot_id):
+                    spot_changed(old_spot, hours_changed=True)
+            other_hours = SpotAvailableHours.objects.filter(spot=self.spot, day=self.day).exclude(id=self.id)
+            for h in other_hours:
+                if h.start_time <= self.start_time <= h.end_time or self.start_time <= h.start_time <= self.end_time:
+                    self.start_time = min(h.start_time, self.start_time)
+                    self.end_time = max(h.end_time, self.end_time)
+                    h.delete()
+            super(SpotAvailableHours, self).save(*args, **kwargs)
+            spot_changed(self.spot, hours_changed=True)  # Update the spot's last_modified and open intervals
+
+    def delete(self, *args, **kwargs):
+        super(SpotAvailableHours, self).delete(*args, **kwargs)
+        spot_changed(self.spot, hours_changed=True)
+
+
+class SpotTombstone(models.Model):
+    """ Records a deleted Spot, so clients syncing changes since a time before it was deleted can drop their copy.  Written by Spot.delete.
+    """
+    spot_id = models.IntegerField()
+    deleted = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __unicode__(self):
+        return "%s: %s" % (self.spot_id, self.deleted)
+
+
+class SpotDocument(models.Model):
+    """ A Spot's json_data_structure, encoded as JSON, and the ETag of the version it was built from.  Written by Spot.save in the same transaction as the spot, when SPOTSEEKER_MATERIALIZED_SPOTS is on, so a spot that isn't cached is read from one row instead of being built from four tables.
+    """
+    spot = models.OneToOneField(Spot, primary_key=True, related_name='document')
+    etag = models.CharField(max_length=40)
+    content = models.TextField()
+
+    def __unicode__(self):
+        return "%s: %s" % (self.spot_id, self.etag)
+
+
+class SpotOpenInterval(models.Model):
+    """ An index of the times a Spot is open, in seconds from the start of Sunday.  Available hours that run into each other across midnight are merged, so one row answers a search spanning several days.  Rebuilt from SpotAvailableHours by Spot.rebuild_open_intervals.
+    """
+    spot = models.ForeignKey(Spot)
+    start = models.IntegerField(db_index=True)
+    end = models.IntegerField()
+
+    def __unicode__(self):
+        return "%s: %s-%s" % (self.spot.name, self.start, self.end)
+
+
+# A backstop - the indexes are dropped whenever a spot's extended info changes
+EXTENDED_INFO_INDEX_TIMEOUT = 60 * 60
 
 
 class SpotExtendedInfo(models.Model):
@@ -193,15 +794,61 @@ class SpotExtendedInfo(models.Model):
 
     def save(self, *args, **kwargs):
         self.full_clean()
-        self.spot.save()  # Update the last_modified on the spot
+        keys = [self.key]
+        if self.pk:
+            # The key may have been changed, so the old one is out of date too
+            keys.extend(SpotExtendedInfo.objects.filter(pk=self.pk).values_list('key', flat=True))
         super(SpotExtendedInfo, self).save(*args, **kwargs)
+        spot_changed(self.spot, info_keys=keys)  # Update the last_modified on the spot
+
+    def delete(self, *args, **kwargs):
+        super(SpotExtendedInfo, self).delete(*args, **kwargs)
+        spot_changed(self.spot, info_keys=[self.key])
+
+    @classmethod
+    def index(cls, key):
+        """ Returns the inverted index for an extended info key - a dict mapping
+        each value to the set of ids of the spots that have it.
+        """
+        cache_key = cls.index_cache_key(key)
+        index = cache.get(cache_key)
+        if index is None:
+            index = {}
+            for value, spot_id in cls.objects.filter(key=key).values_list('value', 'spot_id'):
+                index.setdefault(value, set()).add(spot_id)
+            cache.set(cache_key, index, EXTENDED_INFO_INDEX_TIMEOUT)
+        return index
+
+    @classmethod
+    def spot_ids(cls, key, values, ignore_case=False):
+        """ Returns the set of ids of spots that have any of the values for key.
+        """
+        index = cls.index(key)
+        if ignore_case:
+            values = set(value.lower() for value in values)
+            matches = [ids for value, ids in index.items() if value.lower() in values]
+        else:
+            matches = [index[value] for value in values if value in index]
+        return set().union(*matches)
+
+    @classmethod
+    def invalidate_index(cls, *keys):
+        """ Drops the indexes of the keys, once the write_transaction it's called in is over.
+        """
+        if keys:
+            after_commit(cache.delete_many, tuple(sorted(cls.index_cache_key(key) for key in set(keys))))
+
+    @staticmethod
+    def index_cache_key(key):
+        # Extended info keys can hold characters memcached won't take in a key
+        return "extended_info_index:{0}".format(hashlib.sha1(smart_str(key)).hexdigest())
 
 
 class SpotImage(models.Model):
     """ An image of a Spot. Multiple images can be associated with a Spot, and Spot objects have a 'Spot.spotimage_set' method that will return all SpotImage objects for the Spot.
     """
     description = models.CharField(max_length=200, blank=True)
-    image = models.ImageField(upload_to="space_images", height_field="height",
+    image = models.ImageField(upload_to=image_upload_path, height_field="height",
                               width_field="width")
     spot = models.ForeignKey(Spot)
     content_type = models.CharField(max_length=40)
@@ -212,6 +859,8 @@ class SpotImage(models.Model):
     etag = models.CharField(max_length=40)
     upload_user = models.CharField(max_length=40)
     upload_application = models.CharField(max_length=100)
+    # The sha256 of the image, blank for images stored before images were stored by content
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
 
     def __unicode__(self):
         if self.description:
@@ -220,28 +869,73 @@ class SpotImage(models.Model):
             return "%s" % self.image.name
 
     def save(self, *args, **kwargs):
-        self.etag = hashlib.sha1("{0} - {1}".format(random.random(),
-                                                    time.time())).hexdigest()
+        """ Saves the image as its next version.  With expected_etag, the save only
+        happens if the stored image still has that ETag, otherwise ETagConflict is raised.
+        """
+        expected_etag = kwargs.pop('expected_etag', None)
 
-        content_types = {"JPEG": "image/jpeg", "GIF": "image/gif",
-                         "PNG": "image/png"}
-        if self.image.file.multiple_chunks():
+        if hasattr(self.image.file, 'temporary_file_path'):
             img = Image.open(self.image.file.temporary_file_path())
         else:
             img = Image.open(self.image)
 
-        if not img.format in content_types:
-            raise ValidationError('Not an accepted image format')
-
-        self.content_type = content_types[img.format]
-
-        super(SpotImage, self).save(*args, **kwargs)
+        # Only the header has been read - check it before anything decodes the image
+        try:
+            check_image(img.format, img.size)
+        except ImageRejected as e:
+            raise ValidationError(e.message)
+
+        self.content_type = CONTENT_TYPES[img.format]
+
+        replaced = None
+        if not self.image._committed:
+            normalized = normalized_image(img, self.image)
+            if normalized is not None:
+                self.image = normalized
+            if self.pk:
+                replaced = SpotImage.objects.filter(pk=self.pk).values_list('image', 'content_hash')[0]
+            self.content_hash = content_hash(self.image.file)
+            stored = content_path(self.content_hash, self.content_type)
+            # Only share a file that a committed image uses.  Locking that image's row holds off
+            # deleting it, and so removing the file, until this save's transaction is over.
+            sharing = SpotImage.objects.select_for_update().filter(image=stored)
+            if sharing.exists() and self.image.storage.exists(stored):
+                # The same bytes are already stored - use that file instead of writing another
+                self.image.name = stored
+                self.image._committed = True
+
+        save_next_version(self, expected_etag, lambda: super(SpotImage, self).save(*args, **kwargs))
+        thumbnail_cache.invalidate(self.pk)
+        if replaced and replaced[0] != self.image.name:
+            self.release_file(*replaced)
+        spot_changed(self.spot)  # Update the spot's last_modified and ETag, the image list has changed
 
     def delete(self, *args, **kwargs):
-        self.etag = hashlib.sha1("{0} - {1}".format(random.random(), time.time())).hexdigest()
-        self.image.delete(save=False)
-
+        """ Deletes the image.  With expected_etag, only if the stored image still has
+        that ETag, otherwise ETagConflict is raised.  Call it in a transaction then.
+        """
+        expected_etag = kwargs.pop('expected_etag', None)
+        if expected_etag is not None:
+            claim_version(self, expected_etag)
+
+        image_id = self.pk
         super(SpotImage, self).delete(*args, **kwargs)
+        thumbnail_cache.invalidate(image_id)
+        self.release_file(self.image.name, self.content_hash)
+        spot_changed(self.spot)  # Update the spot's last_modified and ETag
+
+    def release_file(self, name, sha):
+        """ Removes a stored image file, and the thumbnails of its content, unless another image still uses it.
+        That's decided once the transaction is over, so a file isn't removed for a delete that's rolled back.
+        """
+        after_commit(self.remove_unused_file, name, sha)
+
+    def remove_unused_file(self, name, sha):
+        if SpotImage.objects.filter(image=name).exists():
+            return
+        self.image.storage.delete(name)
+        if sha:
+            thumbnail_cache.invalidate(sha)
 
     def rest_url(self):
         return "{0}/image/{1}".format(self.spot.rest_url(), self.pk)
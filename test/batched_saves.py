@@ -0,0 +1,105 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.db import DatabaseError
+from django.core import cache
+from mock import patch
+from spotseeker_server.models import Spot, SpotAvailableHours, SpotExtendedInfo, batched_saves
+from spotseeker_server import models
+
+
+class SpotBatchedSavesTest(TestCase):
+    """ Tests putting off spot updates from hours and extended info saves until the end of a batch.
+    """
+
+    def setUp(self):
+        self.spot = Spot.objects.create(name="Batched saves spot")
+
+    def test_one_spot_save(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            etag = self.spot.etag
+            with patch.object(Spot, 'save', autospec=True, side_effect=Spot.save) as spot_save:
+                with batched_saves():
+                    for day in ["m", "t", "w", "th", "f", "sa", "su"]:
+                        SpotAvailableHours.objects.create(spot=self.spot, day=day, start_time="08:00", end_time="12:00")
+                        SpotAvailableHours.objects.create(spot=self.spot, day=day, start_time="13:00", end_time="17:00")
+                    SpotExtendedInfo.objects.create(spot=self.spot, key="has_outlets", value="true")
+                    self.assertEquals(spot_save.call_count, 0, "Spot isn't saved inside the batch")
+                    self.assertEquals(self.spot.spotopeninterval_set.count(), 0, "Open intervals aren't rebuilt inside the batch")
+                self.assertEquals(spot_save.call_count, 1, "Spot is saved once")
+
+            self.assertNotEquals(Spot.objects.get(pk=self.spot.pk).etag, etag, "Spot has a new ETag")
+            self.assertEquals(self.spot.spotopeninterval_set.count(), 14, "Open intervals are rebuilt")
+
+    def test_without_batch(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            etag = self.spot.etag
+            hours = SpotAvailableHours.objects.create(spot=self.spot, day="m", start_time="08:00", end_time="12:00")
+            self.assertNotEquals(Spot.objects.get(pk=self.spot.pk).etag, etag, "Saved right away")
+            self.assertEquals(self.spot.spotopeninterval_set.count(), 1, "Open intervals are rebuilt right away")
+
+            etag = Spot.objects.get(pk=self.spot.pk).etag
+            hours.delete()
+            self.assertNotEquals(Spot.objects.get(pk=self.spot.pk).etag, etag, "Deleting hours changes the ETag")
+            self.assertEquals(self.spot.spotopeninterval_set.count(), 0, "Open intervals are rebuilt after a delete")
+
+    def test_nested(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            with patch.object(Spot, 'save', autospec=True, side_effect=Spot.save) as spot_save:
+                with batched_saves():
+                    with batched_saves():
+                        SpotExtendedInfo.objects.create(spot=self.spot, key="has_outlets", value="true")
+                    self.assertEquals(spot_save.call_count, 0, "Inner batch is part of the outer one")
+                self.assertEquals(spot_save.call_count, 1, "Spot is saved once")
+
+    def test_error_in_batch(self):
+        locmem_cache = cache.get_cache('django.core.cache.backends.locmem.LocMemCache')
+        locmem_cache.clear()
+        with patch.object(models, 'cache', locmem_cache):
+            etag = self.spot.etag
+            self.spot.json_data_structure()
+            try:
+                with batched_saves():
+                    SpotExtendedInfo.objects.create(spot=self.spot, key="has_outlets", value="true")
+                    raise ValueError("Something went wrong")
+            except ValueError:
+                pass
+            self.assertIsNone(locmem_cache.get(self.spot.pk), "Cached json is cleared")
+            self.assertEquals(self.spot.json_data_structure()["extended_info"], {"has_outlets": "true"}, "What was written is served")
+            self.assertNotEquals(Spot.objects.get(pk=self.spot.pk).etag, etag, "What was written has a new ETag")
+        locmem_cache.clear()
+
+    def test_error_finishing_batch(self):
+        locmem_cache = cache.get_cache('django.core.cache.backends.locmem.LocMemCache')
+        locmem_cache.clear()
+        with patch.object(models, 'cache', locmem_cache):
+            self.spot.json_data_structure()
+            with patch.object(Spot, 'save', side_effect=DatabaseError("No more writes")):
+                with self.assertRaises(ValueError):
+                    with batched_saves():
+                        SpotExtendedInfo.objects.create(spot=self.spot, key="has_outlets", value="true")
+                        raise ValueError("Something went wrong")
+                self.assertIsNone(locmem_cache.get(self.spot.pk), "Cached json is cleared")
+
+                self.spot.json_data_structure()
+                with self.assertRaises(DatabaseError):
+                    with batched_saves():
+                        SpotExtendedInfo.objects.create(spot=self.spot, key="has_whiteboards", value="true")
+                self.assertIsNone(locmem_cache.get(self.spot.pk), "Cached json is cleared when the spot can't be saved")
+        locmem_cache.clear()
@@ -0,0 +1,142 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.core import cache
+from mock import patch
+from spotseeker_server.models import Spot, SpotExtendedInfo, SpotAvailableHours, SpotType
+from spotseeker_server import models
+import simplejson as json
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok',
+                   SPOTSEEKER_SPOT_FORM='spotseeker_server.default_forms.spot.DefaultSpotForm')
+class SpotBulkImportTest(TestCase):
+    """ Tests creating and updating many spots in one request.
+    """
+
+    def setUp(self):
+        self.spot = Spot.objects.create(name="Existing bulk spot", latitude=55, longitude=30)
+        SpotExtendedInfo.objects.create(spot=self.spot, key="has_outlets", value="true")
+        self.spot = Spot.objects.get(pk=self.spot.pk)
+        SpotType.objects.get_or_create(name="study_room")
+
+    def document(self, name, **values):
+        document = {"name": name, "location": {"latitude": 55, "longitude": 30}}
+        document.update(values)
+        return document
+
+    def test_json_list(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            documents = [
+                self.document("New bulk spot", type=["study_room"], extended_info={"has_whiteboards": "true"},
+                              available_hours={"monday": [["08:00", "17:00"]]}),
+                self.document("Existing bulk spot - renamed", id=self.spot.pk, eTag=self.spot.etag),
+            ]
+            response = Client().post("/api/v1/spot/bulk", json.dumps(documents), content_type="application/json")
+            self.assertEquals(response.status_code, 200, "Bulk import accepted")
+            results = json.loads(response.content)
+
+            self.assertEquals(results[0]["status"], 201, "First spot created")
+            new_spot = Spot.objects.get(pk=results[0]["id"])
+            self.assertEquals(results[0]["eTag"], new_spot.etag, "New ETag is returned")
+            spot_json = new_spot.json_data_structure()
+            self.assertEquals(spot_json["type"], ["study_room"], "Types are saved")
+            self.assertEquals(spot_json["extended_info"], {"has_whiteboards": "true"}, "Extended info is saved")
+            self.assertEquals(spot_json["available_hours"]["monday"], [["08:00", "17:00"]], "Hours are saved")
+            self.assertEquals(new_spot.spotopeninterval_set.count(), 1, "Open intervals are built")
+
+            self.assertEquals(results[1]["status"], 200, "Second spot updated")
+            self.assertEquals(Spot.objects.get(pk=self.spot.pk).name, "Existing bulk spot - renamed", "Update is saved")
+            self.assertEquals(SpotExtendedInfo.objects.filter(spot=self.spot).count(), 0, "Update replaces the extended info")
+
+    def test_json_lines(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            body = "\n".join([json.dumps(self.document("Line spot 1")), "not json", json.dumps(self.document("Line spot 2"))])
+            response = Client().post("/api/v1/spot/bulk", body, content_type="application/x-ndjson")
+            results = json.loads(response.content)
+            self.assertEquals([result["status"] for result in results], [201, 400, 201], "Each line has its own status")
+            self.assertEquals(Spot.objects.filter(name__startswith="Line spot").count(), 2, "Good lines are saved")
+
+    def test_item_errors(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            documents = [
+                {"name": "No location"},
+                self.document("Missing spot", id=self.spot.pk + 1000, eTag="an etag"),
+                self.document("Old ETag", id=self.spot.pk, eTag="not the etag"),
+                self.document("No ETag", id=self.spot.pk),
+                self.document("Bad id", id="not an id", eTag="an etag"),
+                self.document("Good spot"),
+            ]
+            response = Client().post("/api/v1/spot/bulk", json.dumps(documents), content_type="application/json")
+            results = json.loads(response.content)
+            self.assertEquals([result["status"] for result in results], [400, 404, 409, 409, 404, 201], "Per item statuses")
+            self.assertEquals(Spot.objects.get(pk=self.spot.pk).name, "Existing bulk spot", "Conflicting update isn't saved")
+            self.assertTrue(Spot.objects.filter(name="Good spot").exists(), "Other items are still saved")
+
+    def test_write_after_read(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            in_bulk = Spot.objects.in_bulk
+
+            def other_writer(ids):
+                spots = in_bulk(ids)
+                # A PUT that lands after the spots are read
+                spot = Spot.objects.get(pk=self.spot.pk)
+                spot.name = "Changed by someone else"
+                spot.save()
+                return spots
+
+            documents = [
+                self.document("Lost update", id=self.spot.pk, eTag=self.spot.etag),
+                self.document("Good spot"),
+            ]
+            with patch.object(Spot.objects, 'in_bulk', side_effect=other_writer):
+                response = Client().post("/api/v1/spot/bulk", json.dumps(documents), content_type="application/json")
+            results = json.loads(response.content)
+            self.assertEquals([result["status"] for result in results], [409, 201], "Only the late update conflicts")
+            self.assertEquals(Spot.objects.get(pk=self.spot.pk).name, "Changed by someone else", "The other write is kept")
+
+    def test_same_spot_twice(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            documents = [
+                self.document("Existing bulk spot", id=self.spot.pk, eTag=self.spot.etag, available_hours={"monday": [["08:00", "12:00"]]}),
+                self.document("Existing bulk spot", id=self.spot.pk, eTag=self.spot.etag, available_hours={"monday": [["13:00", "17:00"]]}),
+            ]
+            response = Client().post("/api/v1/spot/bulk", json.dumps(documents), content_type="application/json")
+            results = json.loads(response.content)
+            self.assertEquals([result["status"] for result in results], [200, 200], "Both updates saved")
+            hours = SpotAvailableHours.objects.filter(spot=self.spot)
+            self.assertEquals([(h.start_time.hour, h.end_time.hour) for h in hours], [(13, 17)], "The last update wins")
+
+    def test_batches(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            with self.settings(SPOTSEEKER_BULK_IMPORT_BATCH_SIZE=2):
+                documents = [self.document("Batch spot %s" % i) for i in range(5)]
+                response = Client().post("/api/v1/spot/bulk", json.dumps(documents), content_type="application/json")
+                results = json.loads(response.content)
+                self.assertEquals([result["index"] for result in results], range(5), "Statuses are in order")
+                self.assertEquals(Spot.objects.filter(name__startswith="Batch spot").count(), 5, "Every batch is saved")
+
+    def test_bad_json(self):
+        response = Client().post("/api/v1/spot/bulk", "[not json", content_type="application/json")
+        self.assertEquals(response.status_code, 400, "Rejects a list that can't be parsed")
@@ -0,0 +1,80 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.conf import settings
+from django.core.files import File
+from django.test.utils import override_settings
+from django.core import cache
+from mock import patch
+from os.path import abspath, dirname
+from spotseeker_server.models import Spot, SpotType, SpotExtendedInfo, SpotAvailableHours, SpotImage
+from spotseeker_server import models
+import shutil
+import tempfile
+
+TEST_ROOT = abspath(dirname(__file__))
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok')
+class SpotBulkJsonTest(TestCase):
+    """ Tests building the json for many spots at once.
+    """
+
+    def setUp(self):
+        self.TEMP_DIR = tempfile.mkdtemp()
+        self.spots = []
+        study_room = SpotType.objects.get_or_create(name="study_room")[0]
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR):
+            for i in range(3):
+                spot = Spot.objects.create(name="Bulk json spot %s" % i, capacity=i)
+                spot.spottypes.add(study_room)
+                SpotExtendedInfo.objects.create(spot=spot, key="has_outlets", value="true")
+                SpotAvailableHours.objects.create(spot=spot, day="m", start_time="13:00", end_time="17:00")
+                SpotAvailableHours.objects.create(spot=spot, day="m", start_time="08:00", end_time="11:00")
+                f = open("%s/resources/test_gif.gif" % TEST_ROOT)
+                SpotImage.objects.create(description="Bulk json image", spot=spot, image=File(f))
+                f.close()
+                self.spots.append(Spot.objects.get(pk=spot.pk))
+
+    def tearDown(self):
+        shutil.rmtree(self.TEMP_DIR)
+
+    def test_matches_single_spot_json(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            bulk = Spot.bulk_json_data_structure(self.spots)
+            self.assertEquals(len(bulk), 3, "One structure per spot")
+            for spot, spot_json in zip(self.spots, bulk):
+                self.assertEquals(spot_json, spot.json_data_structure(), "Same json as building one spot at a time")
+            self.assertEquals(bulk[0]['available_hours']['monday'], [["08:00", "11:00"], ["13:00", "17:00"]], "Hours in order")
+
+    def test_query_count(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            # One query each for extended info, hours, images and types - however many spots
+            with self.assertNumQueries(4):
+                Spot.bulk_json_data_structure(self.spots)
+
+    def test_cached(self):
+        locmem_cache = cache.get_cache('django.core.cache.backends.locmem.LocMemCache')
+        locmem_cache.clear()
+        with patch.object(models, 'cache', locmem_cache):
+            Spot.bulk_json_data_structure(self.spots)
+            for spot in self.spots:
+                self.assertIsNotNone(locmem_cache.get(spot.pk), "Spot json is cached")
+            with self.assertNumQueries(0):
+                Spot.bulk_json_data_structure(self.spots)
+        locmem_cache.clear()
@@ -16,7 +16,7 @@
 from django.test import TestCase
 from django.conf import settings
 from django.test.client import Client
-from spotseeker_server.models import Spot
+from spotseeker_server.models import Spot, write_transaction
 import simplejson as json
 import random
 from django.test.utils import override_settings
@@ -59,8 +59,22 @@ class JsonCachingTest(TestCase):
             self.assertIsNone(self.cache.get(self.spot1.pk))  # cache should be emptied
             response = client.get(self.url1)
             etag = response['ETag']
-            response1 = client.put(self.url1, '{"name":"whoop whoop changed number 1"}', content_type="application/json", If_Match=etag)
-            self.assertIsNone(self.cache.get(self.spot1.pk))  # cache should be emptied of changed spot
+            response1 = client.put(self.url1, '{"name":"whoop whoop changed number 1", "location": {"latitude": 55, "longitude": 30}}', content_type="application/json", If_Match=etag)
+            self.assertEqual(response1.status_code, 200)
+            cached = self.cache.get(self.spot1.pk)
+            self.assertTrue(cached is None or cached['name'] == "whoop whoop changed number 1")  # cache shouldn't hold the old spot
+
+    def test_cleared_after_commit(self):
+        """tests that the cache is cleared once the change is committed, not before
+        """
+        with patch.object(models, 'cache', self.cache):
+            self.spot1.json_data_structure()
+            with write_transaction():
+                self.spot1.name = "Changed in a transaction"
+                self.spot1.save()
+                self.assertIsNotNone(self.cache.get(self.spot1.pk))  # other requests can't see the change yet
+                self.cache.set(self.spot1.pk, {"name": "Cached by a request that read the old row"})
+            self.assertIsNone(self.cache.get(self.spot1.pk))  # nothing from before the commit is left
 
     def test_delete_spot(self):
         """tests deleting spots through the api
@@ -118,5 +132,22 @@ class JsonCachingTest(TestCase):
             json = self.spot1.json_data_structure()
             self.assertIsNotNone(self.cache.get(self.spot1.pk))
 
+    def test_json_cache_format(self):
+        """tests caching spots as encoded JSON instead of dicts
+        """
+        with self.settings(SPOTSEEKER_SPOT_CACHE_FORMAT='json'):
+            with patch.object(models, 'cache', self.cache):
+                self.cache.clear()
+                client = Client()
+                response = client.get(self.url1)
+                cached = self.cache.get(self.spot1.pk)
+                self.assertTrue(isinstance(cached, basestring), "Spot is cached as a string")
+                self.assertEqual(response.content, cached, "The cached JSON is sent as is")
+                self.assertEqual(self.spot1.json_data_structure()['name'], self.spot1.name, "Cached JSON is decoded for the dict")
+                self.assertEqual(Spot.bulk_json_fragments([self.spot1]), [cached], "Bulk fragments come straight from the cache")
+
+                response = client.get('/api/v1/spot/all')
+                self.assertEqual(json.loads(response.content), [json.loads(cached)], "All spots is a list of the cached JSON")
+
     def tearDown(self):
         self.cache.clear()
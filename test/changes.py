@@ -0,0 +1,79 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.core import cache
+from mock import patch
+from spotseeker_server.models import Spot, SpotTombstone
+from spotseeker_server.views.changes import encode_token
+from spotseeker_server import models
+from datetime import datetime, timedelta
+import simplejson as json
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok',
+                   SPOTSEEKER_CHANGES_OVERLAP=0)
+class SpotChangesTest(TestCase):
+    """ Tests syncing the spots changed since a token.
+    """
+
+    def setUp(self):
+        self.old_spot = Spot.objects.create(name="Unchanged spot")
+        self.changed_spot = Spot.objects.create(name="Changed spot")
+        self.deleted_spot = Spot.objects.create(name="Deleted spot")
+
+    def changes(self, **params):
+        response = Client().get("/api/v1/spot/changes", params)
+        self.assertEquals(response.status_code, 200, "Got changes")
+        return json.loads(response.content)
+
+    def test_changes_since(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            first_sync = self.changes()
+            self.assertEquals(len(first_sync["spots"]), 3, "First sync gets every spot")
+            self.assertEquals(first_sync["deleted"], [], "Nothing to delete on a first sync")
+
+            # Everything so far is from before the token
+            Spot.objects.all().update(last_modified=datetime.now() - timedelta(minutes=5))
+            SpotTombstone.objects.all().update(deleted=datetime.now() - timedelta(minutes=5))
+
+            self.changed_spot.name = "Changed spot - changed"
+            self.changed_spot.save()
+            deleted_id = self.deleted_spot.pk
+            self.deleted_spot.delete()
+            new_spot = Spot.objects.create(name="New spot")
+
+            changes = self.changes(since=first_sync["next"])
+            self.assertEquals(sorted([spot["id"] for spot in changes["spots"]]), [self.changed_spot.pk, new_spot.pk], "Changed and new spots")
+            self.assertEquals(changes["deleted"], [deleted_id], "Deleted spots")
+
+    def test_tombstone(self):
+        deleted_id = self.deleted_spot.pk
+        self.deleted_spot.delete()
+        self.assertEquals(SpotTombstone.objects.filter(spot_id=deleted_id).count(), 1, "Deleting a spot leaves a tombstone")
+
+    def test_overlap(self):
+        with self.settings(SPOTSEEKER_CHANGES_OVERLAP=60):
+            since = encode_token(datetime.now() - timedelta(seconds=30))
+            Spot.objects.filter(pk=self.old_spot.pk).update(last_modified=datetime.now() - timedelta(seconds=45))
+            changes = self.changes(since=since)
+            self.assertIn(self.old_spot.pk, [spot["id"] for spot in changes["spots"]], "Changes from just before the token are sent again")
+
+    def test_bad_token(self):
+        response = Client().get("/api/v1/spot/changes", {"since": "garbage"})
+        self.assertEquals(response.status_code, 400, "Invalid tokens are rejected")
@@ -0,0 +1,159 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TransactionTestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.core.files import File
+from django.core import cache
+from mock import patch
+from os.path import abspath, dirname
+from spotseeker_server.models import Spot, SpotImage, SpotExtendedInfo, ETagConflict, write_transaction
+from spotseeker_server.views.spot import SpotView
+from spotseeker_server.views.image import ImageView
+from spotseeker_server import models
+import os
+import shutil
+import tempfile
+
+TEST_ROOT = abspath(dirname(__file__))
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok',
+                   SPOTSEEKER_SPOT_FORM='spotseeker_server.default_forms.spot.DefaultSpotForm')
+class ConcurrentWritesTest(TransactionTestCase):
+    """ Tests that a write expecting an ETag fails if another write got in first.
+    """
+
+    def setUp(self):
+        self.TEMP_DIR = tempfile.mkdtemp()
+        self.spot = Spot.objects.create(name="Concurrent writes spot")
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR):
+            f = open("%s/resources/test_gif.gif" % TEST_ROOT)
+            self.image = SpotImage.objects.create(description="Concurrent writes image", spot=self.spot, image=File(f))
+            f.close()
+        self.spot = Spot.objects.get(pk=self.spot.pk)
+        self.spot_url = "/api/v1/spot/%s" % self.spot.pk
+        self.image_url = "%s/image/%s" % (self.spot_url, self.image.pk)
+
+    def tearDown(self):
+        shutil.rmtree(self.TEMP_DIR)
+
+    def other_writer(self, request, *args):
+        """ Stands in for validate_etag - the ETag checks out, but another write lands before this one.
+        """
+        spot = Spot.objects.get(pk=self.spot.pk)
+        spot.name = "Changed by someone else"
+        spot.save()
+        image = SpotImage.objects.get(pk=self.image.pk)
+        image.description = "Changed by someone else"
+        image.save()
+
+    def test_model_save(self):
+        first = Spot.objects.get(pk=self.spot.pk)
+        second = Spot.objects.get(pk=self.spot.pk)
+        first.save(expected_etag=first.etag)
+
+        second.name = "Lost update"
+        self.assertRaises(ETagConflict, second.save, expected_etag=second.etag)
+        self.assertEquals(Spot.objects.get(pk=self.spot.pk).name, "Concurrent writes spot", "Conflicting save isn't written")
+
+    def test_stale_saves(self):
+        first = Spot.objects.get(pk=self.spot.pk)
+        second = Spot.objects.get(pk=self.spot.pk)
+        first.name = "First stale save"
+        first.save()
+        second.name = "Second stale save"
+        second.save()
+        self.assertNotEquals(first.etag, second.etag, "Each save is a new version")
+        self.assertEquals(Spot.objects.get(pk=self.spot.pk).etag, second.etag, "The last save's ETag is stored")
+
+        first = SpotImage.objects.get(pk=self.image.pk)
+        second = SpotImage.objects.get(pk=self.image.pk)
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR):
+            first.save()
+            second.save()
+        self.assertNotEquals(first.etag, second.etag, "Each image save is a new version")
+
+    def test_model_delete(self):
+        self.spot.save()
+        self.assertRaises(ETagConflict, self.spot.delete, expected_etag="1")
+        self.assertTrue(Spot.objects.filter(pk=self.spot.pk).exists(), "Conflicting delete doesn't happen")
+
+    def test_spot_put(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            with patch.object(SpotView, 'validate_etag', self.other_writer):
+                response = Client().put(self.spot_url, '{"name":"Lost update", "location": {"latitude": 55, "longitude": 30}, "extended_info": {"has_outlets": "true"}}',
+                                        content_type="application/json", HTTP_IF_MATCH=self.spot.etag)
+            self.assertEquals(response.status_code, 409, "Conflict when another write got in first")
+            self.assertEquals(Spot.objects.get(pk=self.spot.pk).name, "Changed by someone else", "The other write is kept")
+            self.assertEquals(SpotExtendedInfo.objects.filter(spot=self.spot).count(), 0, "None of the conflicting PUT is saved")
+
+    def test_spot_delete(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            with patch.object(SpotView, 'validate_etag', self.other_writer):
+                response = Client().delete(self.spot_url, HTTP_IF_MATCH=self.spot.etag)
+            self.assertEquals(response.status_code, 409, "Conflict when another write got in first")
+            self.assertTrue(Spot.objects.filter(pk=self.spot.pk).exists(), "Spot isn't deleted")
+
+    def test_image_put(self):
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR):
+            with patch.object(ImageView, 'validate_etag', self.other_writer):
+                response = Client().put(self.image_url, {"description": "Lost update"}, If_Match=self.image.etag)
+            self.assertEquals(response.status_code, 409, "Conflict when another write got in first")
+            self.assertEquals(SpotImage.objects.get(pk=self.image.pk).description, "Changed by someone else", "The other write is kept")
+
+    def test_image_delete(self):
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR):
+            with patch.object(ImageView, 'validate_etag', self.other_writer):
+                response = Client().delete(self.image_url, If_Match=self.image.etag)
+            self.assertEquals(response.status_code, 409, "Conflict when another write got in first")
+            self.assertTrue(SpotImage.objects.filter(pk=self.image.pk).exists(), "Image isn't deleted")
+
+    def test_image_file_removed_after_commit(self):
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR):
+            image = SpotImage.objects.get(pk=self.image.pk)
+            path = image.image.path
+            try:
+                with write_transaction():
+                    image.delete()
+                    self.assertTrue(os.path.exists(path), "File is kept until the delete is committed")
+                    raise ValueError("Something went wrong")
+            except ValueError:
+                pass
+            self.assertTrue(SpotImage.objects.filter(pk=self.image.pk).exists(), "Delete is rolled back")
+            self.assertTrue(os.path.exists(path), "File is kept for a rolled back delete")
+
+            with write_transaction():
+                SpotImage.objects.get(pk=self.image.pk).delete()
+            self.assertFalse(os.path.exists(path), "File is removed once the delete is committed")
+
+    def test_unused_file_not_shared(self):
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR):
+            name = self.image.image.name
+            # The row is gone, and the file is waiting to be removed
+            SpotImage.objects.filter(pk=self.image.pk).delete()
+            f = open("%s/resources/test_gif.gif" % TEST_ROOT)
+            image = SpotImage.objects.create(description="Same bytes", spot=self.spot, image=File(f))
+            f.close()
+            self.assertNotEquals(image.image.name, name, "Only a file a stored image uses is shared")
+
+    def test_image_put_description(self):
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR):
+            response = Client().put(self.image_url, {"description": "New description"}, If_Match=self.image.etag)
+            self.assertEquals(response.status_code, 200, "Description PUT accepted")
+            self.assertEquals(SpotImage.objects.get(pk=self.image.pk).description, "New description", "Description is saved")
@@ -0,0 +1,118 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.core.files import File
+from django.core import cache
+from django.utils.http import http_date
+from mock import patch
+from os.path import abspath, dirname
+from spotseeker_server.models import Spot, SpotImage
+from spotseeker_server import models
+import shutil
+import tempfile
+import time
+
+TEST_ROOT = abspath(dirname(__file__))
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok')
+class ConditionalGETTest(TestCase):
+    """ Tests answering GETs for unchanged spots and images with a 304.
+    """
+
+    def setUp(self):
+        self.TEMP_DIR = tempfile.mkdtemp()
+        self.spot = Spot.objects.create(name="Conditional GET spot")
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR):
+            f = open("%s/resources/test_jpeg.jpg" % TEST_ROOT)
+            self.image = SpotImage.objects.create(description="Conditional GET image", spot=self.spot, image=File(f))
+            f.close()
+        self.spot = Spot.objects.get(pk=self.spot.pk)
+
+        self.spot_url = "/api/v1/spot/%s" % self.spot.pk
+        self.image_url = "%s/image/%s" % (self.spot_url, self.image.pk)
+        self.thumb_url = "%s/thumb/10x10" % self.image_url
+
+    def tearDown(self):
+        shutil.rmtree(self.TEMP_DIR)
+
+    def test_etags_count_versions(self):
+        spot = Spot.objects.create(name="Counting ETags")
+        version, made = spot.etag.split(".")
+        self.assertEquals(version, "1", "New spots start at 1")
+        spot.save()
+        self.assertEquals(spot.etag, "2.%s" % made, "Each save is the next version")
+
+    def test_reused_id(self):
+        spot = Spot.objects.create(name="Deleted spot")
+        spot.save()
+        spot_id, etag = spot.pk, spot.etag
+        spot.delete()
+        spot = Spot.objects.create(pk=spot_id, name="Spot with a reused id")
+        spot.save()
+        self.assertNotEquals(spot.etag, etag, "A reused id doesn't get the deleted spot's ETags")
+
+    def test_spot_if_none_match(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            response = Client().get(self.spot_url)
+            etag = response["ETag"]
+            self.assertIn("Last-Modified", response, "Spots have a Last-Modified")
+
+            # Just the query for the spot - the json isn't built
+            with self.assertNumQueries(1):
+                response = Client().get(self.spot_url, HTTP_IF_NONE_MATCH='"%s"' % etag)
+            self.assertEquals(response.status_code, 304, "Unchanged spot is not modified")
+            self.assertEquals(response.content, "", "No body for a 304")
+            self.assertEquals(response["ETag"], etag, "304 has the ETag")
+
+            self.spot.name = "Conditional GET spot - changed"
+            self.spot.save()
+            response = Client().get(self.spot_url, HTTP_IF_NONE_MATCH='"%s"' % etag)
+            self.assertEquals(response.status_code, 200, "Changed spot is sent again")
+            self.assertNotEquals(response["ETag"], etag, "Changed spot has a new ETag")
+
+    def test_spot_if_modified_since(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            response = Client().get(self.spot_url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+            self.assertEquals(response.status_code, 304, "Not modified since a later time")
+            response = Client().get(self.spot_url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() - 60 * 60 * 24))
+            self.assertEquals(response.status_code, 200, "Modified since an earlier time")
+
+    def test_image(self):
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR):
+            response = Client().get(self.image_url)
+            etag = response["ETag"]
+            with self.assertNumQueries(1):
+                response = Client().get(self.image_url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEquals(response.status_code, 304, "Unchanged image is not modified")
+
+            response = Client().get(self.image_url, HTTP_IF_NONE_MATCH="some other etag")
+            self.assertEquals(response.status_code, 200, "Other ETags get the image")
+
+    def test_thumbnail(self):
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR):
+            response = Client().get(self.thumb_url)
+            etag = response["ETag"]
+            with self.assertNumQueries(1):
+                response = Client().get(self.thumb_url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEquals(response.status_code, 304, "Unchanged thumbnail is not modified")
+
+            response = Client().get("%s/thumb/20x20" % self.image_url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEquals(response.status_code, 200, "Other sizes have their own ETag")
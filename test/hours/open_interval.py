@@ -0,0 +1,81 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.contrib import admin
+from spotseeker_server.models import Spot, SpotAvailableHours, SpotOpenInterval, SECONDS_PER_DAY, SECONDS_PER_WEEK
+from spotseeker_server import admin as spot_admin
+
+
+class SpotOpenIntervalTest(TestCase):
+    """ Tests the open hours index used by the open_now, open_at and open_until searches.
+    """
+
+    def intervals(self, spot):
+        return sorted([interval.start, interval.end] for interval in SpotOpenInterval.objects.filter(spot=spot))
+
+    def test_single_window(self):
+        spot = Spot.objects.create(name="Open monday morning")
+        SpotAvailableHours.objects.create(spot=spot, day="m", start_time="09:00", end_time="12:00")
+        self.assertEquals(self.intervals(spot), [[SECONDS_PER_DAY + 9 * 3600, SECONDS_PER_DAY + 12 * 3600]], "Monday 9-12")
+
+    def test_overnight_windows_merge(self):
+        spot = Spot.objects.create(name="Open overnight")
+        SpotAvailableHours.objects.create(spot=spot, day="m", start_time="20:00", end_time="23:59")
+        SpotAvailableHours.objects.create(spot=spot, day="t", start_time="00:00", end_time="02:00")
+        self.assertEquals(self.intervals(spot), [[SECONDS_PER_DAY + 20 * 3600, 2 * SECONDS_PER_DAY + 2 * 3600]], "Monday night runs into Tuesday")
+
+    def test_gap_before_midnight(self):
+        spot = Spot.objects.create(name="Closes before midnight")
+        SpotAvailableHours.objects.create(spot=spot, day="m", start_time="20:00", end_time="22:59")
+        SpotAvailableHours.objects.create(spot=spot, day="t", start_time="00:00", end_time="02:00")
+        self.assertEquals(len(self.intervals(spot)), 2, "Windows with a gap stay separate")
+
+    def test_around_the_weekend(self):
+        spot = Spot.objects.create(name="Open saturday night")
+        SpotAvailableHours.objects.create(spot=spot, day="sa", start_time="20:00", end_time="23:59")
+        SpotAvailableHours.objects.create(spot=spot, day="su", start_time="00:00", end_time="02:00")
+        saturday_night = 6 * SECONDS_PER_DAY + 20 * 3600
+        self.assertEquals(self.intervals(spot), [[saturday_night - SECONDS_PER_WEEK, 2 * 3600],
+                                                 [saturday_night, SECONDS_PER_WEEK + 2 * 3600]], "Stored in both weeks")
+
+    def test_always_open(self):
+        spot = Spot.objects.create(name="Always open")
+        for day in ["su", "m", "t", "w", "th", "f", "sa"]:
+            SpotAvailableHours.objects.create(spot=spot, day=day, start_time="00:00", end_time="23:59")
+        self.assertEquals(self.intervals(spot), [[-SECONDS_PER_WEEK, 2 * SECONDS_PER_WEEK]], "One interval for the whole week")
+
+    def test_delete_hours(self):
+        spot = Spot.objects.create(name="Hours deleted")
+        hours = SpotAvailableHours.objects.create(spot=spot, day="m", start_time="09:00", end_time="12:00")
+        hours.delete()
+        self.assertEquals(self.intervals(spot), [], "Deleting hours updates the index")
+
+    def test_move_hours(self):
+        spot = Spot.objects.create(name="Hours moved away")
+        other = Spot.objects.create(name="Hours moved here")
+        hours = SpotAvailableHours.objects.create(spot=spot, day="m", start_time="09:00", end_time="12:00")
+        hours.spot = other
+        hours.save()
+        self.assertEquals(self.intervals(spot), [], "The old spot's index is rebuilt")
+        self.assertEquals(len(self.intervals(other)), 1, "The new spot's index is rebuilt")
+
+    def test_admin_delete_action(self):
+        spot = Spot.objects.create(name="Hours deleted in the admin")
+        SpotAvailableHours.objects.create(spot=spot, day="m", start_time="09:00", end_time="12:00")
+        SpotAvailableHours.objects.create(spot=spot, day="w", start_time="09:00", end_time="12:00")
+        hours_admin = spot_admin.SpotAvailableHoursAdmin(SpotAvailableHours, admin.site)
+        hours_admin.delete_model(None, SpotAvailableHours.objects.filter(spot=spot))
+        self.assertEquals(self.intervals(spot), [], "Deleting hours in bulk from the admin updates the index")
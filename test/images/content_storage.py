@@ -0,0 +1,101 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.test.client import Client, RequestFactory
+from django.test.utils import override_settings
+from django.core.files.uploadhandler import StopFutureHandlers
+from spotseeker_server.models import Spot, SpotImage
+from spotseeker_server.image_storage import HashingMemoryFileUploadHandler, HashingTemporaryFileUploadHandler
+from spotseeker_server import thumbnail_cache
+from spotseeker_server.views import thumbnail
+from os.path import abspath, dirname
+from mock import patch
+import hashlib
+import os
+import tempfile
+import shutil
+
+TEST_ROOT = abspath(dirname(__file__))
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok')
+class ContentStorageTest(TestCase):
+    """ Tests storing images by the hash of their content.
+    """
+
+    def setUp(self):
+        self.CACHE_DIR = tempfile.mkdtemp()
+        thumbnail_cache.thumbnail_cache.size = None
+        self.spot1 = Spot.objects.create(name="This is to test storing images by content")
+        self.spot2 = Spot.objects.create(name="This is to test storing images by content too")
+        self.path = "%s/../resources/test_png.png" % TEST_ROOT
+        self.sha = hashlib.sha256(open(self.path, 'rb').read()).hexdigest()
+
+    def tearDown(self):
+        shutil.rmtree(self.CACHE_DIR)
+        thumbnail_cache.thumbnail_cache.size = None
+
+    def upload(self, spot):
+        f = open(self.path)
+        response = Client().post("/api/v1/spot/{0}/image".format(spot.pk), {"description": "Same bytes", "image": f})
+        f.close()
+        return SpotImage.objects.get(pk=response["Location"].split("/")[-1])
+
+    def test_shared_file(self):
+        img1 = self.upload(self.spot1)
+        img2 = self.upload(self.spot2)
+
+        self.assertEquals(img1.content_hash, self.sha, "Stored with the hash of its content")
+        self.assertEquals(img1.image.name, "space_images/{0}/{1}.png".format(self.sha[:2], self.sha), "Named for its content")
+        self.assertEquals(img2.image.name, img1.image.name, "The same bytes share a file")
+        path = img1.image.path
+
+        img1.delete()
+        self.assertTrue(os.path.exists(path), "File is kept while another image uses it")
+        response = Client().get("/api/v1/spot/{0}/image/{1}".format(self.spot2.pk, img2.pk))
+        self.assertEquals(response.content, open(self.path, 'rb').read(), "The other image is still there")
+
+        img2.delete()
+        self.assertFalse(os.path.exists(path), "File is removed with the last image using it")
+
+    def test_shared_thumbnails(self):
+        with self.settings(SPOTSEEKER_THUMBNAIL_CACHE_DIR=self.CACHE_DIR):
+            img1 = self.upload(self.spot1)
+            img2 = self.upload(self.spot2)
+            c = Client()
+            first = c.get("{0}/thumb/{1}x{2}".format(img1.rest_url(), 20, 20))
+            with patch.object(thumbnail, 'render_thumbnail') as render:
+                second = c.get("{0}/thumb/{1}x{2}".format(img2.rest_url(), 20, 20))
+                self.assertFalse(render.called, "Thumbnails of the same bytes are shared")
+            self.assertEquals(second.content, first.content, "Same thumbnail")
+            img1.delete()
+            img2.delete()
+
+    def test_upload_hashed_while_read(self):
+        data = open(self.path, 'rb').read()
+        request = RequestFactory().post("/")
+        for handler_class in [HashingMemoryFileUploadHandler, HashingTemporaryFileUploadHandler]:
+            handler = handler_class(request)
+            handler.handle_raw_input(None, request.META, len(data), "boundary")
+            try:
+                handler.new_file("image", "test.png", "image/png", len(data))
+            except StopFutureHandlers:
+                # The memory handler stops later handlers from getting the file
+                pass
+            handler.receive_data_chunk(data[:100], 0)
+            handler.receive_data_chunk(data[100:], 100)
+            upload = handler.file_complete(len(data))
+            self.assertEquals(upload.content_hash, self.sha, "Hashed as the chunks come in")
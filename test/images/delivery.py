@@ -0,0 +1,118 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.test.client import Client
+from django.core.files import File
+from django.test.utils import override_settings
+from spotseeker_server.models import Spot
+from spotseeker_server import thumbnail_cache
+from os.path import abspath, dirname
+import os
+import tempfile
+import shutil
+
+TEST_ROOT = abspath(dirname(__file__))
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok')
+class ImageDeliveryTest(TestCase):
+    """ Tests sending images by the web server, and byte ranges when django sends them.
+    """
+
+    def setUp(self):
+        self.TEMP_DIR = tempfile.mkdtemp()
+        self.CACHE_DIR = tempfile.mkdtemp()
+        thumbnail_cache.thumbnail_cache.size = None
+
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR):
+            self.spot = Spot.objects.create(name="This is to test sending images")
+            f = open("%s/../resources/test_jpeg.jpg" % TEST_ROOT)
+            self.jpeg = self.spot.spotimage_set.create(description="This is the JPEG test", image=File(f))
+            f.close()
+        self.url = "/api/v1/spot/{0}/image/{1}".format(self.spot.pk, self.jpeg.pk)
+        self.data = open("%s/../resources/test_jpeg.jpg" % TEST_ROOT, 'rb').read()
+
+    def tearDown(self):
+        shutil.rmtree(self.TEMP_DIR)
+        shutil.rmtree(self.CACHE_DIR)
+        thumbnail_cache.thumbnail_cache.size = None
+
+    def test_whole_file(self):
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR):
+            response = Client().get(self.url)
+            self.assertEquals(response.status_code, 200, "Whole image")
+            self.assertEquals(response.content, self.data, "Same bytes as the upload")
+            self.assertEquals(int(response["Content-Length"]), len(self.data), "Has its length")
+            self.assertEquals(response["Accept-Ranges"], "bytes", "Advertises ranges")
+            self.assertEquals(response["Content-type"], "image/jpeg", "Has its content type")
+
+    def test_ranges(self):
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR):
+            c = Client()
+            size = len(self.data)
+
+            response = c.get(self.url, HTTP_RANGE="bytes=10-19")
+            self.assertEquals(response.status_code, 206, "Partial content")
+            self.assertEquals(response.content, self.data[10:20], "The bytes asked for")
+            self.assertEquals(response["Content-Range"], "bytes 10-19/{0}".format(size), "Says which bytes")
+            self.assertEquals(int(response["Content-Length"]), 10, "Length of the range")
+
+            response = c.get(self.url, HTTP_RANGE="bytes=100-")
+            self.assertEquals(response.content, self.data[100:], "Resumed from a byte")
+
+            response = c.get(self.url, HTTP_RANGE="bytes=-50")
+            self.assertEquals(response.content, self.data[-50:], "Last bytes")
+
+            response = c.get(self.url, HTTP_RANGE="bytes={0}-".format(size))
+            self.assertEquals(response.status_code, 416, "Range past the end")
+            self.assertEquals(response["Content-Range"], "bytes */{0}".format(size), "Says how big the file is")
+
+            response = c.get(self.url, HTTP_RANGE="bytes=0-1,5-6")
+            self.assertEquals(response.status_code, 200, "Several ranges get the whole file")
+
+            etag = response["ETag"]
+            response = c.get(self.url, HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE=etag)
+            self.assertEquals(response.status_code, 206, "Range of the current version")
+            response = c.get(self.url, HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE="old")
+            self.assertEquals(response.status_code, 200, "Whole file when the version has changed")
+
+    def test_x_sendfile(self):
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR, SPOTSEEKER_FILE_DELIVERY="x-sendfile"):
+            response = Client().get(self.url)
+            self.assertEquals(response["X-Sendfile"], self.jpeg.image.path, "Web server sends the file")
+            self.assertEquals(response.content, "", "Django doesn't")
+            self.assertEquals(response["Content-type"], "image/jpeg", "Has its content type")
+
+    def test_x_accel_redirect(self):
+        media_root = self.jpeg.image.path[:-len(self.jpeg.image.name)]
+        locations = {media_root: "/protected/media/", self.CACHE_DIR + "/": "/protected/thumbnails"}
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR, SPOTSEEKER_FILE_DELIVERY="x-accel-redirect", SPOTSEEKER_X_ACCEL_LOCATIONS=locations,
+                           SPOTSEEKER_THUMBNAIL_CACHE_DIR=self.CACHE_DIR):
+            c = Client()
+            response = c.get(self.url)
+            self.assertEquals(response["X-Accel-Redirect"], "/protected/media/" + self.jpeg.image.name, "Sent from the internal location")
+            self.assertEquals(response.content, "", "Django doesn't send it")
+
+            thumb_url = "{0}/thumb/{1}x{2}".format(self.url, 20, 20)
+            response = c.get(thumb_url)
+            self.assertFalse("X-Accel-Redirect" in response, "A thumbnail is sent by django while it's rendered")
+            response = c.get(thumb_url)
+            self.assertEquals(response["X-Accel-Redirect"], "/protected/thumbnails/{0}/20x20".format(self.jpeg.content_hash),
+                              "Cached thumbnails are sent by the web server")
+
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR, SPOTSEEKER_FILE_DELIVERY="x-accel-redirect", SPOTSEEKER_X_ACCEL_LOCATIONS={}):
+            response = Client().get(self.url)
+            self.assertEquals(response.content, self.data, "Files outside the locations are sent by django")
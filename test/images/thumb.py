@@ -25,6 +25,10 @@ from django.test.utils import override_settings
 from mock import patch
 from django.core import cache
 from spotseeker_server import models
+from spotseeker_server.views.thumbnail import render_thumbnail
+import os
+import shutil
+import tempfile
 
 TEST_ROOT = abspath(dirname(__file__))
 
@@ -438,3 +442,41 @@ class ImageThumbTest(TestCase):
             ratio = im.size[1] / im.size[0]
             self.assertEquals(ratio, orig_ratio, "Ratio on constrained gif thumbnail is the same")
             self.assertEquals(im.format, 'GIF', "Actual type of same size thumbnail is still a gif")
+
+    def test_fast_resize(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            c = Client()
+            f = open("%s/../resources/test_jpeg.jpg" % TEST_ROOT)
+            response = c.post(self.url, {"description": "This is a jpeg", "image": f})
+            f.close()
+            new_base_location = response["Location"]
+
+            response = c.get("{0}/thumb/{1}x{2}?resize=fast".format(new_base_location, 10, 20))
+            im = Image.open(StringIO(response.content))
+            self.assertEquals(im.size, (10, 20), "Fast jpeg thumbnail is the size asked for")
+            self.assertEquals(im.format, 'JPEG', "Fast thumbnail is still a jpeg")
+            self.assertTrue(response["ETag"].endswith("-fast"), "Fast thumbnails have their own ETag")
+
+            quality = c.get("{0}/thumb/{1}x{2}".format(new_base_location, 10, 20))
+            self.assertNotEquals(quality["ETag"], response["ETag"], "Quality thumbnails have their own ETag")
+
+            with self.settings(SPOTSEEKER_THUMBNAIL_RESIZE="fast"):
+                response = c.get("{0}/thumb/constrain/width:{1}".format(new_base_location, 10))
+                self.assertTrue(response["ETag"].endswith("-fast"), "Fast by default")
+                self.assertEquals(Image.open(StringIO(response.content)).size[0], 10, "Constrained fast thumbnail is the right width")
+
+            response = c.get("{0}/thumb/{1}x{2}?resize=fastest".format(new_base_location, 10, 20))
+            self.assertEquals(response.status_code, 400, "Unknown resize modes are rejected")
+
+    def test_fast_resize_large_jpeg(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "large.jpg")
+            Image.new("RGB", (1600, 1200), (200, 120, 40)).save(path, "JPEG")
+            for constrain in [False, True]:
+                im = Image.open(StringIO(render_thumbnail(path, 100, 75, constrain, "fast")))
+                self.assertEquals(im.size, (100, 75), "Decoded at a reduced scale, then resized to the exact size")
+                self.assertEquals(im.getpixel((50, 37))[0] // 10, 20, "Still the same picture")
+        finally:
+            shutil.rmtree(directory)
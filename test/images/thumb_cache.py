@@ -0,0 +1,173 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.test.client import Client
+from django.core.files import File
+from django.test.utils import override_settings
+from django.core.exceptions import ImproperlyConfigured
+from spotseeker_server.models import Spot, SpotImage
+from spotseeker_server.thumbnail_cache import ThumbnailCache
+from spotseeker_server import thumbnail_cache
+from spotseeker_server.views import thumbnail
+from cStringIO import StringIO
+from PIL import Image
+from os.path import abspath, dirname
+from mock import patch
+import os
+import tempfile
+import shutil
+
+TEST_ROOT = abspath(dirname(__file__))
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok')
+class ThumbnailCacheTest(TestCase):
+    """ Tests keeping rendered thumbnails on disk, and rendering presets ahead of time.
+    """
+
+    def setUp(self):
+        self.TEMP_DIR = tempfile.mkdtemp()
+        self.CACHE_DIR = tempfile.mkdtemp()
+        thumbnail_cache.thumbnail_cache.size = None
+
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR):
+            self.spot = Spot.objects.create(name="This is to test caching thumbnails")
+            f = open("%s/../resources/test_jpeg.jpg" % TEST_ROOT)
+            self.jpeg = self.spot.spotimage_set.create(description="This is the JPEG test", image=File(f))
+            f.close()
+        self.url = "/api/v1/spot/{0}/image/{1}".format(self.spot.pk, self.jpeg.pk)
+
+    def tearDown(self):
+        shutil.rmtree(self.TEMP_DIR)
+        shutil.rmtree(self.CACHE_DIR)
+        thumbnail_cache.thumbnail_cache.size = None
+
+    def test_served_from_disk(self):
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR, SPOTSEEKER_THUMBNAIL_CACHE_DIR=self.CACHE_DIR):
+            c = Client()
+            first = c.get("{0}/thumb/{1}x{2}".format(self.url, 50, 40))
+            self.assertEquals(int(first["Content-Length"]), len(first.content), "Rendered thumbnail has its length")
+
+            with patch.object(thumbnail, 'render_thumbnail') as render:
+                second = c.get("{0}/thumb/{1}x{2}".format(self.url, 50, 40))
+                self.assertFalse(render.called, "Second request isn't rendered again")
+            self.assertEquals(second.content, first.content, "Same thumbnail from disk")
+            self.assertEquals(int(second["Content-Length"]), len(first.content), "Cached thumbnail has its length")
+            self.assertEquals(second["ETag"], first["ETag"], "Same ETag")
+            self.assertEquals(second["Content-type"], "image/jpeg", "Same content type")
+
+            other = c.get("{0}/thumb/constrain/width:{1}".format(self.url, 30))
+            self.assertEquals(Image.open(StringIO(other.content)).size[0], 30, "Other sizes are cached separately")
+
+    def test_invalidated(self):
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR, SPOTSEEKER_THUMBNAIL_CACHE_DIR=self.CACHE_DIR):
+            c = Client()
+            thumb_url = "{0}/thumb/{1}x{2}".format(self.url, 50, 40)
+            first = c.get(thumb_url)
+            hash_dir = os.path.join(self.CACHE_DIR, self.jpeg.content_hash)
+            self.assertEquals(os.listdir(hash_dir), ["50x40"], "Thumbnail is on disk, under the image's content hash")
+
+            f = open("%s/../resources/test_jpeg2.jpg" % TEST_ROOT)
+            response = c.put(self.url, {"description": "New image", "image": f}, If_Match=self.jpeg.etag)
+            f.close()
+            self.assertEquals(response.status_code, 200, "Image is replaced")
+            self.assertFalse(os.path.exists(hash_dir), "PUT removes the thumbnails of content no image has any more")
+
+            second = c.get(thumb_url)
+            self.assertNotEquals(second.content, first.content, "Thumbnail of the new image")
+
+            new_hash_dir = os.path.join(self.CACHE_DIR, Spot.objects.get(pk=self.spot.pk).spotimage_set.get().content_hash)
+            self.assertTrue(os.path.exists(new_hash_dir), "Thumbnail of the new image is on disk")
+            response = c.delete(self.url, If_Match=second["ETag"].split("-")[0])
+            self.assertEquals(response.status_code, 200, "Image is deleted")
+            self.assertFalse(os.path.exists(new_hash_dir), "DELETE removes the cached thumbnails")
+
+    def test_legacy_images(self):
+        # Stored before images were stored by content
+        SpotImage.objects.filter(pk=self.jpeg.pk).update(content_hash="")
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR, SPOTSEEKER_THUMBNAIL_CACHE_DIR=self.CACHE_DIR):
+            c = Client()
+            response = c.get("{0}/thumb/{1}x{2}".format(self.url, 50, 40))
+            image_dir = os.path.join(self.CACHE_DIR, str(self.jpeg.pk))
+            self.assertEquals(os.listdir(image_dir), [response["ETag"]], "Cached by image id and ETag")
+
+            response = c.put(self.url, {"description": "New description"}, If_Match=self.jpeg.etag)
+            self.assertFalse(os.path.exists(image_dir), "PUT removes the cached thumbnails")
+
+    def test_presets_on_upload(self):
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR, SPOTSEEKER_THUMBNAIL_CACHE_DIR=self.CACHE_DIR,
+                           SPOTSEEKER_THUMBNAIL_PRESETS=["50x40", "constrain/width:30"], SPOTSEEKER_THUMBNAIL_WORKERS=0):
+            c = Client()
+            f = open("%s/../resources/test_png.png" % TEST_ROOT)
+            response = c.post("/api/v1/spot/{0}/image".format(self.spot.pk), {"description": "This is a png", "image": f})
+            f.close()
+            image_url = response["Location"]
+
+            with patch.object(thumbnail, 'render_thumbnail') as render:
+                response = c.get("{0}/thumb/{1}x{2}".format(image_url, 50, 40))
+                response = c.get("{0}/thumb/constrain/width:{1}".format(image_url, 30))
+                self.assertFalse(render.called, "Preset thumbnails are already rendered")
+            self.assertEquals(Image.open(StringIO(response.content)).size[0], 30, "Preset is the right size")
+
+            f = open("%s/../resources/test_png2.png" % TEST_ROOT)
+            response = c.put(image_url, {"image": f}, If_Match=c.get(image_url)["ETag"])
+            f.close()
+            with patch.object(thumbnail, 'render_thumbnail') as render:
+                response = c.get("{0}/thumb/{1}x{2}".format(image_url, 50, 40))
+                self.assertFalse(render.called, "Presets of the new image are rendered on PUT")
+
+    def test_presets_in_background(self):
+        with self.settings(MEDIA_ROOT=self.TEMP_DIR, SPOTSEEKER_THUMBNAIL_CACHE_DIR=self.CACHE_DIR,
+                           SPOTSEEKER_THUMBNAIL_PRESETS=["20x20", "constrain/height:10,width:10"]):
+            result = thumbnail.generate_presets(self.jpeg)
+            result.wait(10)
+            self.assertTrue(result.successful(), "Presets are rendered")
+            self.assertEquals(sorted(os.listdir(os.path.join(self.CACHE_DIR, self.jpeg.content_hash))),
+                              ["10x10-constrain", "20x20"], "Cached under the image's content hash")
+
+    def test_bad_preset(self):
+        with self.settings(SPOTSEEKER_THUMBNAIL_PRESETS=["big"]):
+            self.assertRaises(ImproperlyConfigured, thumbnail.thumbnail_presets)
+
+    def test_lru_eviction(self):
+        with self.settings(SPOTSEEKER_THUMBNAIL_CACHE_DIR=self.CACHE_DIR, SPOTSEEKER_THUMBNAIL_CACHE_SIZE=250):
+            lru = ThumbnailCache()
+            lru.set(1, "1-10x10", "a" * 100)
+            lru.set(2, "1-10x10", "b" * 100)
+            os.utime(lru.path(1, "1-10x10"), (1000, 1000))
+            os.utime(lru.path(2, "1-10x10"), (2000, 2000))
+            lru.open(1, "1-10x10").close()
+            lru.set(3, "1-10x10", "c" * 100)
+
+            self.assertIsNone(lru.open(2, "1-10x10"), "Least recently used thumbnail is removed")
+            self.assertEquals(lru.open(1, "1-10x10").read(), "a" * 100, "Recently used thumbnail is kept")
+            self.assertEquals(lru.open(3, "1-10x10").read(), "c" * 100, "New thumbnail is kept")
+
+    def test_overwrite_size(self):
+        with self.settings(SPOTSEEKER_THUMBNAIL_CACHE_DIR=self.CACHE_DIR, SPOTSEEKER_THUMBNAIL_CACHE_SIZE=250):
+            lru = ThumbnailCache()
+            lru.set(1, "1-10x10", "a" * 100)
+            lru.set(2, "1-10x10", "b" * 100)
+            for i in range(5):
+                lru.set(2, "1-10x10", "c" * 120)
+
+            self.assertEquals(lru.size, 220, "A rewritten thumbnail is only counted once")
+            self.assertEquals(lru.open(1, "1-10x10").read(), "a" * 100, "Nothing is evicted for a rewrite")
+
+    def test_disabled(self):
+        lru = ThumbnailCache()
+        lru.set(1, "1-10x10", "a")
+        self.assertIsNone(lru.open(1, "1-10x10"), "Nothing is cached without a directory")
@@ -0,0 +1,171 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.core import cache
+from spotseeker_server.models import Spot
+from spotseeker_server import models
+from spotseeker_server.views.thumbnail import render_thumbnail, encode_thumbnail, webp_supported
+from spotseeker_server.thumbnail_cache import thumbnail_cache
+from cStringIO import StringIO
+from PIL import Image
+from os.path import abspath, dirname
+from mock import patch
+from unittest import skipUnless
+import os
+import shutil
+import tempfile
+
+TEST_ROOT = abspath(dirname(__file__))
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok')
+class ThumbnailEncodingTest(TestCase):
+
+    def setUp(self):
+        self.dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', self.dummy_cache):
+            self.spot = Spot.objects.create(name="This is to test thumbnail encodings")
+            self.url = '/api/v1/spot/{0}/image'.format(self.spot.pk)
+
+    def upload(self, name):
+        with patch.object(models, 'cache', self.dummy_cache):
+            f = open("%s/../resources/%s" % (TEST_ROOT, name))
+            response = Client().post(self.url, {"description": "This is an image", "image": f})
+            f.close()
+            return response["Location"]
+
+    def test_default_encoding(self):
+        location = self.upload("test_jpeg.jpg")
+        response = Client().get("{0}/thumb/50x50".format(location))
+        im = Image.open(StringIO(response.content))
+        self.assertEquals(im.format, "JPEG", "Still in the image's format")
+        self.assertFalse(im.info.get("progressive"), "Encoded as before profiles, not progressive")
+        self.assertTrue(response["ETag"].endswith("-50x50"), "Same ETag as before profiles")
+        self.assertTrue("Accept" in response["Vary"], "Varies by Accept")
+
+    def test_profiles(self):
+        location = self.upload("test_jpeg.jpg")
+        c = Client()
+        fast = c.get("{0}/thumb/100x100?profile=fast".format(location))
+        balanced = c.get("{0}/thumb/100x100?profile=balanced".format(location))
+
+        self.assertEquals(Image.open(StringIO(fast.content)).size, (100, 100), "Right size with a profile")
+        self.assertTrue(fast["ETag"].endswith("-fast.jpg"), "Profiles have their own ETag")
+        self.assertNotEquals(fast["ETag"], balanced["ETag"], "Each profile has its own ETag")
+
+        with self.settings(SPOTSEEKER_THUMBNAIL_PROFILE="balanced"):
+            response = c.get("{0}/thumb/100x100".format(location))
+            self.assertEquals(response["ETag"], balanced["ETag"], "Default profile from settings")
+
+        response = c.get("{0}/thumb/100x100?profile=tiny".format(location))
+        self.assertEquals(response.status_code, 400, "Unknown profiles are rejected")
+
+    def test_png_as_jpeg(self):
+        location = self.upload("test_png.png")
+        c = Client()
+        response = c.get("{0}/thumb/100x100?profile=balanced".format(location), HTTP_ACCEPT="image/jpeg,image/png")
+        self.assertEquals(response["Content-type"], "image/jpeg", "Opaque PNG sent as a JPEG")
+        self.assertEquals(Image.open(StringIO(response.content)).format, "JPEG", "Actually a JPEG")
+
+        response = c.get("{0}/thumb/100x100".format(location), HTTP_ACCEPT="image/jpeg,image/png")
+        self.assertEquals(response["Content-type"], "image/png", "The archive profile keeps PNGs lossless")
+
+        response = c.get("{0}/thumb/100x100?profile=balanced".format(location), HTTP_ACCEPT="image/*")
+        self.assertEquals(response["Content-type"], "image/png", "Only converted for clients that list JPEG")
+
+        response = c.get("{0}/thumb/100x100?profile=balanced".format(location), HTTP_ACCEPT="image/png,image/jpeg;q=0")
+        self.assertEquals(response["Content-type"], "image/png", "Not for clients that refuse JPEG")
+
+    def test_transparent_png_stays_png(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "transparent.png")
+            Image.new("RGBA", (20, 20), (10, 20, 30, 0)).save(path, "PNG")
+            with patch.object(models, 'cache', self.dummy_cache):
+                f = open(path)
+                location = Client().post(self.url, {"description": "Transparent", "image": f})["Location"]
+                f.close()
+
+            response = Client().get("{0}/thumb/10x10?profile=fast".format(location), HTTP_ACCEPT="image/jpeg,image/png")
+            self.assertEquals(response["Content-type"], "image/png", "Transparency would be lost in a JPEG")
+        finally:
+            shutil.rmtree(directory)
+
+    @skipUnless(webp_supported(), "PIL was built without WebP")
+    def test_webp(self):
+        location = self.upload("test_jpeg.jpg")
+        c = Client()
+        response = c.get("{0}/thumb/100x100?profile=balanced".format(location), HTTP_ACCEPT="image/webp,*/*;q=0.8")
+        self.assertEquals(response["Content-type"], "image/webp", "WebP for clients that accept it")
+        self.assertEquals(Image.open(StringIO(response.content)).format, "WEBP", "Actually WebP")
+        self.assertTrue(response["ETag"].endswith("-balanced.webp"), "WebP has its own ETag")
+
+        jpeg = c.get("{0}/thumb/100x100?profile=balanced".format(location))
+        self.assertTrue(len(response.content) < len(jpeg.content), "WebP is smaller")
+
+        location = self.upload("test_gif.gif")
+        response = c.get("{0}/thumb/50x50".format(location), HTTP_ACCEPT="image/webp")
+        self.assertEquals(Image.open(StringIO(response.content)).size, (50, 50), "Palette images convert to WebP")
+
+    def test_cached_by_encoding(self):
+        directory = tempfile.mkdtemp()
+        thumbnail_cache.size = None
+        try:
+            with self.settings(SPOTSEEKER_THUMBNAIL_CACHE_DIR=directory):
+                location = self.upload("test_png.png")
+                c = Client()
+                png = c.get("{0}/thumb/40x40".format(location), HTTP_ACCEPT="image/jpeg")
+                jpeg = c.get("{0}/thumb/40x40?profile=fast".format(location), HTTP_ACCEPT="image/jpeg")
+                again = c.get("{0}/thumb/40x40?profile=fast".format(location), HTTP_ACCEPT="image/jpeg")
+
+                self.assertEquals(png["Content-type"], "image/png", "Archive stays a PNG")
+                self.assertEquals(again["Content-type"], "image/jpeg", "Cached JPEG is sent as one")
+                self.assertEquals(again.content, jpeg.content, "Each encoding is cached on its own")
+                self.assertNotEquals(png.content, jpeg.content, "Each encoding is cached on its own")
+        finally:
+            thumbnail_cache.size = None
+            shutil.rmtree(directory)
+
+    def test_profile_sizes(self):
+        directory = tempfile.mkdtemp()
+        try:
+            # Enough detail that the quality makes a difference
+            path = os.path.join(directory, "photo.jpg")
+            tile = Image.new("RGB", (16, 12))
+            tile.putdata([((i * 37) % 256, (i * 91) % 256, (i * 53) % 256) for i in range(16 * 12)])
+            tile.resize((800, 600), Image.BICUBIC).save(path, "JPEG", quality=90)
+
+            sizes = dict((profile, len(render_thumbnail(path, 200, 150, False, profile=profile)))
+                         for profile in ["fast", "balanced", "archive"])
+            self.assertTrue(sizes["fast"] < sizes["balanced"] < sizes["archive"], "Lower quality profiles are smaller")
+        finally:
+            shutil.rmtree(directory)
+
+    def test_archive_unchanged(self):
+        thumb = Image.open("%s/../resources/test_jpeg.jpg" % TEST_ROOT)
+        thumb.thumbnail((100, 100))
+        before = StringIO()
+        thumb.save(before, "JPEG", quality=95)
+        self.assertEquals(encode_thumbnail(thumb, "JPEG", "JPEG", "archive"), before.getvalue(), "Same bytes as before profiles")
+
+    def test_render_encodings(self):
+        path = "%s/../resources/test_gif.gif" % TEST_ROOT
+        im = Image.open(StringIO(render_thumbnail(path, 30, 30, False, output_format="JPEG", profile="fast")))
+        self.assertEquals((im.format, im.mode), ("JPEG", "RGB"), "Palette image converted for JPEG")
+        im = Image.open(StringIO(render_thumbnail(path, 30, 30, False)))
+        self.assertEquals(im.format, "GIF", "Image's own format by default")
@@ -0,0 +1,123 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from spotseeker_server.models import Spot, SpotImage
+from spotseeker_server.image_storage import sniff_image
+from spotseeker_server.auth import all_ok
+from os.path import abspath, dirname
+from mock import patch
+from PIL import Image
+import simplejson as json
+import random
+import tempfile
+
+TEST_ROOT = abspath(dirname(__file__))
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok')
+class ImageUploadCheckTest(TestCase):
+    """ Tests checking images as they're uploaded, and scaling down large ones.
+    """
+
+    def setUp(self):
+        self.spot = Spot.objects.create(name="This is to test checking image uploads")
+        self.url = "/api/v1/spot/{0}/image".format(self.spot.pk)
+
+    def upload(self, name):
+        f = open("%s/../resources/%s" % (TEST_ROOT, name))
+        response = Client().post(self.url, {"description": "Upload check", "image": f})
+        f.close()
+        return response
+
+    def test_auth_reads_post(self):
+        def authenticate_user(view, request, *args, **kwargs):
+            # Like an OAuth check, which reads the parameters from the body too
+            request.POST
+
+        with self.settings(SPOTSEEKER_MAX_IMAGE_BYTES=300):
+            with patch.object(all_ok, 'authenticate_user', side_effect=authenticate_user):
+                response = self.upload("test_jpeg.jpg")
+                self.assertEquals(response.status_code, 413, "Checked even when auth reads the body first")
+
+                f = open("%s/../resources/test_gif.gif" % TEST_ROOT)
+                image = SpotImage.objects.create(spot=self.spot, image=File(f))
+                f.close()
+                url = "{0}/{1}".format(self.url, image.pk)
+                f = open("%s/../resources/test_jpeg.jpg" % TEST_ROOT)
+                response = Client().put(url, {"image": f}, If_Match=image.etag)
+                f.close()
+                self.assertEquals(response.status_code, 413, "A PUT is checked too")
+
+    def test_sniff(self):
+        data = open("%s/../resources/test_jpeg2.jpg" % TEST_ROOT, 'rb').read()
+        self.assertIsNone(sniff_image(data[:10]), "Not enough of the header")
+        self.assertEquals(sniff_image(data[:len(data) / 2]), ("JPEG", (100, 200)), "Format and size from the header")
+
+    def test_byte_limit(self):
+        with self.settings(SPOTSEEKER_MAX_IMAGE_BYTES=300):
+            response = self.upload("test_jpeg.jpg")
+            self.assertEquals(response.status_code, 413, "Too many bytes")
+            self.assertTrue("bytes" in json.loads(response.content)["error"], "Says why")
+
+            # Big enough that the request is refused before any of it is read
+            im = Image.new("RGB", (300, 300))
+            im.putdata([(random.randint(0, 255), 0, 0) for i in range(300 * 300)])
+            data = tempfile.NamedTemporaryFile(suffix=".png")
+            im.save(data, "PNG")
+            data.seek(0)
+            response = Client().post(self.url, {"image": data})
+            data.close()
+            self.assertEquals(response.status_code, 413, "Body too big")
+            self.assertEquals(SpotImage.objects.filter(spot=self.spot).count(), 0, "Nothing stored")
+
+        self.assertEquals(self.upload("test_jpeg.jpg").status_code, 201, "Under the default limit")
+
+    def test_pixel_limit(self):
+        with self.settings(SPOTSEEKER_MAX_IMAGE_PIXELS=100 * 150):
+            self.assertEquals(self.upload("test_jpeg.jpg").status_code, 201, "Under the limit")
+            response = self.upload("test_jpeg2.jpg")
+            self.assertEquals(response.status_code, 413, "Too many pixels")
+            self.assertTrue("pixels" in json.loads(response.content)["error"], "Says why")
+
+            # Saved some other way, before anything decodes it
+            f = open("%s/../resources/test_png2.png" % TEST_ROOT)
+            self.assertRaises(ValidationError, self.spot.spotimage_set.create, image=File(f))
+            f.close()
+
+    def test_format(self):
+        response = self.upload("test_bmp.bmp")
+        self.assertEquals(response.status_code, 400, "BMP is turned away from its header")
+        response = self.upload("fake_jpeg.jpg")
+        self.assertEquals(response.status_code, 400, "Not an image at all")
+
+    def test_normalized(self):
+        with self.settings(SPOTSEEKER_MAX_IMAGE_DIMENSION=50):
+            for name, size in [("test_jpeg2.jpg", (25, 50)), ("test_png2.png", (25, 50)), ("test_gif.gif", (100, 100))]:
+                response = self.upload(name)
+                self.assertEquals(response.status_code, 201, "Stored")
+                img = SpotImage.objects.get(pk=response["Location"].split("/")[-1])
+                self.assertEquals((img.width, img.height), size, "Scaled down to the limit, except for GIFs")
+                self.assertEquals(Image.open(img.image.path).size, size, "Stored scaled down")
+                img.delete()
+
+        response = self.upload("test_jpeg2.jpg")
+        img = SpotImage.objects.get(pk=response["Location"].split("/")[-1])
+        self.assertEquals((img.width, img.height), (100, 200), "Kept as it is by default")
+        img.delete()
@@ -0,0 +1,120 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.core import cache
+from mock import patch, Mock
+from spotseeker_server.models import Spot
+from spotseeker_server.local_cache import LocalCache
+from spotseeker_server import local_cache
+from spotseeker_server import models
+import simplejson as json
+import time
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok')
+class LocalCacheTest(TestCase):
+    """ Tests the per-process cache in front of django's cache.
+    """
+
+    def setUp(self):
+        local_cache.spot_cache.clear()
+
+    def tearDown(self):
+        local_cache.spot_cache.clear()
+
+    def test_versions(self):
+        lru = LocalCache()
+        lru.set(1, "etag1", "value")
+        self.assertEquals(lru.get(1, "etag1"), "value", "Same version is a hit")
+        self.assertIsNone(lru.get(1, "etag2"), "Other version is a miss")
+        self.assertEquals(lru.stats()["hits"], 1, "1 hit counted")
+        self.assertEquals(lru.stats()["misses"], 1, "1 miss counted")
+
+    def test_lru_eviction(self):
+        with self.settings(SPOTSEEKER_LOCAL_CACHE_SIZE=2):
+            lru = LocalCache()
+            lru.set(1, "v", "one")
+            lru.set(2, "v", "two")
+            lru.get(1, "v")
+            lru.set(3, "v", "three")
+            self.assertIsNone(lru.get(2, "v"), "Least recently used entry is evicted")
+            self.assertEquals(lru.get(1, "v"), "one", "Recently used entry is kept")
+            self.assertEquals(lru.stats()["size"], 2, "Bounded size")
+
+    def test_timeout(self):
+        with self.settings(SPOTSEEKER_LOCAL_CACHE_TIMEOUT=-1):
+            lru = LocalCache()
+            lru.set(1, "v", "one")
+            self.assertIsNone(lru.get(1, "v"), "Expired entries are misses")
+
+    def test_disabled(self):
+        with self.settings(SPOTSEEKER_LOCAL_CACHE_SIZE=0):
+            lru = LocalCache()
+            lru.set(1, "v", "one")
+            self.assertIsNone(lru.get(1, "v"), "Nothing is cached")
+
+    def test_spot_served_locally(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            spot = Spot.objects.create(name="Local cache spot")
+            spot = Spot.objects.get(pk=spot.pk)
+            first = spot.json_fragment()
+            # Only the query for the spot itself
+            with self.assertNumQueries(1):
+                response = Client().get("/api/v1/spot/%s" % spot.pk)
+            self.assertEquals(response.content, first, "Served from the local cache")
+
+            spot.name = "Local cache spot - changed"
+            spot.save()
+            response = Client().get("/api/v1/spot/%s" % spot.pk)
+            self.assertEquals(json.loads(response.content)["name"], "Local cache spot - changed", "New ETag, so the old entry isn't used")
+
+    def test_one_read_per_cache(self):
+        locmem = cache.get_cache('django.core.cache.backends.locmem.LocMemCache')
+        locmem.clear()
+        counted = Mock(wraps=locmem)
+        with patch.object(models, 'cache', counted):
+            spot = Spot.objects.create(name="Read once")
+            for cache_format in ["dict", "json"]:
+                with self.settings(SPOTSEEKER_SPOT_CACHE_FORMAT=cache_format):
+                    local_cache.spot_cache.clear()
+                    locmem.clear()
+                    counted.reset_mock()
+                    spot.json_fragment()
+                    self.assertEquals(counted.get.call_count, 1, "One read of django's cache on a miss")
+
+                    local_cache.spot_cache.clear()
+                    counted.reset_mock()
+                    self.assertEquals(json.loads(spot.json_fragment())["name"], "Read once", "Read from django's cache")
+                    self.assertEquals(counted.get.call_count, 1, "One read of django's cache on a hit")
+
+            counted.reset_mock()
+            spot.save()
+            self.assertFalse(counted.get.called, "Saving drops the cached spot without reading it first")
+        locmem.clear()
+
+    def test_cached_json_is_copied(self):
+        spot = Spot.objects.create(name="Local cache copy")
+        spot.json_data_structure()["name"] = "Changed by a caller"
+        self.assertEquals(spot.json_data_structure()["name"], "Local cache copy", "Callers get their own copy")
+
+    def test_stats_view(self):
+        response = Client().get("/api/v1/cache_stats")
+        stats = json.loads(response.content)
+        self.assertEquals(response.status_code, 200, "Stats are available")
+        self.assertTrue("hits" in stats and "misses" in stats, "Hits and misses are reported")
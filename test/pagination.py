@@ -0,0 +1,120 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.core import cache
+from mock import patch
+from spotseeker_server.models import Spot
+from spotseeker_server.views.pagination import encode_cursor, decode_cursor, InvalidCursor
+from spotseeker_server import models
+from decimal import Decimal
+import simplejson as json
+import re
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok')
+class SpotPaginationTest(TestCase):
+    """ Tests paging through spots with a cursor.
+    """
+
+    def setUp(self):
+        self.spots = []
+        for i in range(5):
+            self.spots.append(Spot.objects.create(name="Paged spot %s" % i, capacity=i))
+
+    def next_url(self, response):
+        if 'Link' not in response:
+            return None
+        return re.match('<http://testserver(.*)>; rel="next"', response['Link']).group(1)
+
+    def fetch_all(self, url):
+        ids = []
+        pages = 0
+        while url:
+            response = Client().get(url)
+            self.assertEquals(response.status_code, 200, "Got a page")
+            ids.extend([spot["id"] for spot in json.loads(response.content)])
+            pages += 1
+            url = self.next_url(response)
+        return ids, pages
+
+    def test_cursor_round_trip(self):
+        cursor = encode_cursor("id", None, 1234)
+        self.assertEquals(decode_cursor(cursor), ("id", None, 1234), "Cursor holds the order and last id")
+        cursor = encode_cursor("distance", 0.1 + 0.2, 1234)
+        self.assertEquals(decode_cursor(cursor), ("distance", 0.1 + 0.2, 1234), "Distances are kept exactly")
+        self.assertRaises(InvalidCursor, decode_cursor, "not a cursor")
+        self.assertRaises(InvalidCursor, decode_cursor, encode_cursor("distance", None, 1234))
+
+    def test_all_spots_pages(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            ids, pages = self.fetch_all("/api/v1/spot/all?page_size=2")
+            self.assertEquals(ids, [spot.pk for spot in self.spots], "Every spot, once, in order")
+            self.assertEquals(pages, 3, "Fixed size pages")
+
+    def test_search_pages(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            ids, pages = self.fetch_all("/api/v1/spot?capacity=1&page_size=2")
+            self.assertEquals(ids, [spot.pk for spot in self.spots[1:]], "Every matching spot, once, in order")
+            self.assertEquals(pages, 2, "Fixed size pages")
+
+    def test_distance_pages(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            # Further away the later they're made, but the nearest has the highest id
+            for spot, offset in zip(self.spots, ['0.0004', '0.0005', '0.0006', '0.0007', '0.0001']):
+                spot.latitude = Decimal('47.6530') + Decimal(offset)
+                spot.longitude = Decimal('-122.3070')
+                spot.save()
+            nearest_first = [self.spots[4].pk] + [spot.pk for spot in self.spots[:4]]
+
+            url = "/api/v1/spot?center_latitude=47.6530&center_longitude=-122.3070&distance=1000&page_size=2"
+            ids, pages = self.fetch_all(url)
+            self.assertEquals(ids, nearest_first, "Every spot, once, nearest first")
+            self.assertEquals(pages, 3, "Fixed size pages")
+
+            response = Client().get(url)
+            # A spot on the next page moves nearer than the ones already seen
+            self.spots[2].latitude = Decimal('47.6530')
+            self.spots[2].save()
+            ids, pages = self.fetch_all(self.next_url(response))
+            self.assertEquals(ids, [self.spots[1].pk, self.spots[3].pk], "The next page carries on from the last distance seen")
+
+            response = Client().get("/api/v1/spot/all?page_size=2")
+            response = Client().get(url + "&cursor=" + re.search("cursor=([^&>]*)", response['Link']).group(1))
+            self.assertEquals(response.status_code, 400, "An id order cursor isn't good for a distance search")
+
+    def test_new_spots_while_paging(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            response = Client().get("/api/v1/spot/all?page_size=3")
+            self.spots[0].delete()
+            ids, pages = self.fetch_all(self.next_url(response))
+            self.assertEquals(ids, [spot.pk for spot in self.spots[3:]], "Deleting an earlier spot doesn't shift the next page")
+
+    def test_bad_cursor(self):
+        response = Client().get("/api/v1/spot/all?cursor=garbage")
+        self.assertEquals(response.status_code, 400, "Invalid cursors are rejected")
+        response = Client().get("/api/v1/spot/all?page_size=0")
+        self.assertEquals(response.status_code, 400, "Invalid page sizes are rejected")
+
+    def test_max_page_size(self):
+        with self.settings(SPOTSEEKER_MAX_PAGE_SIZE=4):
+            response = Client().get("/api/v1/spot/all?page_size=100")
+            self.assertEquals(len(json.loads(response.content)), 4, "Page size is capped")
@@ -0,0 +1,107 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.test.client import Client, RequestFactory
+from django.test.utils import override_settings
+from django.core import cache
+from django.contrib import admin
+from mock import patch
+from spotseeker_server.models import Spot, SpotExtendedInfo, write_transaction
+from spotseeker_server import models
+from spotseeker_server import admin as spot_admin
+import simplejson as json
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok')
+class SpotSearchExtendedInfoIndexTest(TestCase):
+    """ Tests the (key, value) -> spot ids index behind the extended_info search filters.
+    """
+
+    def setUp(self):
+        self.cache = cache.get_cache('django.core.cache.backends.locmem.LocMemCache')
+        self.cache.clear()
+        self.quiet = Spot.objects.create(name="Quiet with outlets")
+        self.loud = Spot.objects.create(name="Loud with outlets")
+        self.info = SpotExtendedInfo.objects.create(spot=self.quiet, key="noise_level", value="quiet")
+        SpotExtendedInfo.objects.create(spot=self.quiet, key="has_outlets", value="true")
+        SpotExtendedInfo.objects.create(spot=self.loud, key="noise_level", value="loud")
+        SpotExtendedInfo.objects.create(spot=self.loud, key="has_outlets", value="true")
+
+    def tearDown(self):
+        self.cache.clear()
+
+    def test_spot_ids(self):
+        with patch.object(models, 'cache', self.cache):
+            self.assertEquals(SpotExtendedInfo.spot_ids("has_outlets", ["true"]), set([self.quiet.pk, self.loud.pk]), "Both spots have outlets")
+            self.assertEquals(SpotExtendedInfo.spot_ids("noise_level", ["quiet", "silent"]), set([self.quiet.pk]), "Any of the values match")
+            self.assertEquals(SpotExtendedInfo.spot_ids("noise_level", ["QUIET"], ignore_case=True), set([self.quiet.pk]), "Case insensitive match")
+            self.assertEquals(SpotExtendedInfo.spot_ids("has_whiteboards", ["true"]), set(), "Unknown keys match nothing")
+
+    def test_index_is_cached(self):
+        with patch.object(models, 'cache', self.cache):
+            SpotExtendedInfo.spot_ids("noise_level", ["quiet"])
+            self.assertIsNotNone(self.cache.get(SpotExtendedInfo.index_cache_key("noise_level")), "Index is cached")
+
+    def test_value_change(self):
+        with patch.object(models, 'cache', self.cache):
+            SpotExtendedInfo.spot_ids("noise_level", ["quiet"])
+            self.info.value = "silent"
+            self.info.save()
+            self.assertEquals(SpotExtendedInfo.spot_ids("noise_level", ["quiet"]), set(), "Old value is gone")
+            self.assertEquals(SpotExtendedInfo.spot_ids("noise_level", ["silent"]), set([self.quiet.pk]), "New value is found")
+
+    def test_key_change(self):
+        with patch.object(models, 'cache', self.cache):
+            SpotExtendedInfo.spot_ids("noise_level", ["quiet"])
+            SpotExtendedInfo.spot_ids("ambience", ["quiet"])
+            self.info.key = "ambience"
+            self.info.save()
+            self.assertEquals(SpotExtendedInfo.spot_ids("noise_level", ["quiet"]), set(), "Old key is gone")
+            self.assertEquals(SpotExtendedInfo.spot_ids("ambience", ["quiet"]), set([self.quiet.pk]), "New key is found")
+
+    def test_delete(self):
+        with patch.object(models, 'cache', self.cache):
+            SpotExtendedInfo.spot_ids("noise_level", ["quiet"])
+            self.info.delete()
+            self.assertEquals(SpotExtendedInfo.spot_ids("noise_level", ["quiet"]), set(), "Deleted value is gone")
+
+    def test_admin_delete_action(self):
+        with patch.object(models, 'cache', self.cache):
+            SpotExtendedInfo.spot_ids("noise_level", ["quiet"])
+            etag = Spot.objects.get(pk=self.quiet.pk).etag
+            info_admin = spot_admin.SpotExtendedInfoAdmin(SpotExtendedInfo, admin.site)
+            self.assertFalse('delete_selected' in info_admin.get_actions(RequestFactory().get("/admin/")), "No bulk delete that skips the index")
+            info_admin.delete_model(None, SpotExtendedInfo.objects.filter(spot=self.quiet))
+            self.assertEquals(SpotExtendedInfo.spot_ids("noise_level", ["quiet"]), set(), "Deleted in the admin is gone")
+            self.assertNotEquals(Spot.objects.get(pk=self.quiet.pk).etag, etag, "Spot has a new ETag")
+
+    def test_multiple_filters(self):
+        with patch.object(models, 'cache', self.cache):
+            c = Client()
+            response = c.get("/api/v1/spot", {'extended_info:has_outlets': 'true', 'extended_info:noise_level': 'quiet'})
+            spots = json.loads(response.content)
+            self.assertEquals(len(spots), 1, "Only the quiet spot matches")
+            self.assertEquals(spots[0]['id'], self.quiet.pk, "Got the quiet spot")
+
+    def test_dropped_after_commit(self):
+        with patch.object(models, 'cache', self.cache):
+            SpotExtendedInfo.spot_ids("noise_level", ["quiet"])
+            with write_transaction():
+                self.info.value = "silent"
+                self.info.save()
+                # Anything rebuilt from here on could have been read before the commit
+                self.assertIsNotNone(self.cache.get(SpotExtendedInfo.index_cache_key("noise_level")), "Kept until the transaction is over")
+            self.assertIsNone(self.cache.get(SpotExtendedInfo.index_cache_key("noise_level")), "Dropped once it's over")
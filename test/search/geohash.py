@@ -0,0 +1,94 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.core import cache
+from mock import patch
+from spotseeker_server.models import Spot
+from spotseeker_server import models
+from spotseeker_server import geohash
+from decimal import Decimal
+import simplejson as json
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok')
+class SpotSearchGeohashTest(TestCase):
+
+    def test_encode(self):
+        self.assertEquals(geohash.encode(42.6, -5.6), "ezs42e44yx96", "Matches the reference geohash")
+        self.assertEquals(geohash.encode(42.6, -5.6, 5), "ezs42", "Shorter precision is a prefix")
+        self.assertEquals(geohash.encode(Decimal('47.653811'), Decimal('-122.307815'), 6), "c23p0g", "Handles Decimal coordinates")
+
+    def test_covering_prefixes(self):
+        prefixes = geohash.covering_prefixes(47.6530, -122.3090, 47.6546, -122.3066)
+        self.assertTrue(len(prefixes) <= geohash.MAX_COVERING_CELLS, "Stays under the cell limit")
+        for lat, lon in [(47.6530, -122.3090), (47.6546, -122.3066), (47.6538, -122.3078)]:
+            point = geohash.encode(lat, lon)
+            self.assertTrue(any(point.startswith(p) for p in prefixes), "Every point in the box is covered")
+
+    def test_covering_prefixes_empty_box(self):
+        self.assertEquals(geohash.covering_prefixes(10, 10, 5, 20), [], "Inverted box covers nothing")
+
+    def test_covering_prefixes_antimeridian(self):
+        prefixes = geohash.covering_prefixes(-1, 179.5, 1, -179.5)
+        self.assertTrue(len(prefixes) <= geohash.MAX_COVERING_CELLS, "Stays under the cell limit")
+        for lat, lon in [(0, 179.9), (0, -179.9), (0.5, 179.6), (-0.5, -179.6)]:
+            point = geohash.encode(lat, lon)
+            self.assertTrue(any(point.startswith(p) for p in prefixes), "Both sides of the antimeridian are covered")
+
+    def test_distance_search_across_antimeridian(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            east = Spot.objects.create(name="East of the line", latitude=Decimal('0.0'), longitude=Decimal('179.9995'))
+            west = Spot.objects.create(name="West of the line", latitude=Decimal('0.0'), longitude=Decimal('-179.9995'))
+            Spot.objects.create(name="Far away", latitude=Decimal('0.0'), longitude=Decimal('0.0'))
+
+            response = Client().get("/api/v1/spot", {'center_latitude': '0.0', 'center_longitude': '-179.9999', 'distance': '1000'})
+            spots = json.loads(response.content)
+            self.assertEquals(sorted(spot['id'] for spot in spots), sorted([east.pk, west.pk]), "Spots on both sides of the line are found")
+
+    def test_spot_save_sets_geohash(self):
+        spot = Spot.objects.create(name="Geohash spot", latitude=Decimal('47.653811'), longitude=Decimal('-122.307815'))
+        self.assertEquals(spot.geohash, geohash.encode(Decimal('47.653811'), Decimal('-122.307815')), "Geohash set on create")
+
+        spot.latitude = Decimal('47.655')
+        spot.save()
+        self.assertEquals(Spot.objects.get(pk=spot.pk).geohash, geohash.encode(Decimal('47.655'), Decimal('-122.307815')), "Geohash follows the location")
+
+        spot.latitude = None
+        spot.save()
+        self.assertEquals(Spot.objects.get(pk=spot.pk).geohash, '', "No location, no geohash")
+
+    def test_distance_search_uses_geohash(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            inner = Spot.objects.create(name="Inner", latitude=Decimal('47.653811'), longitude=Decimal('-122.307815'))
+            outer = Spot.objects.create(name="Outer", latitude=Decimal('47.663811'), longitude=Decimal('-122.307815'))
+
+            # Stale location columns with a current geohash - only the index should find it
+            Spot.objects.filter(pk=outer.pk).update(geohash=inner.geohash, latitude=inner.latitude)
+
+            c = Client()
+            response = c.get("/api/v1/spot", {'center_latitude': '47.653811', 'center_longitude': '-122.307815', 'distance': '100'})
+            spots = json.loads(response.content)
+            self.assertEquals(len(spots), 2, "Both spots in the geohash cell are found")
+
+            Spot.objects.filter(pk=outer.pk).update(geohash='')
+            response = c.get("/api/v1/spot", {'center_latitude': '47.653811', 'center_longitude': '-122.307815', 'distance': '100'})
+            spots = json.loads(response.content)
+            self.assertEquals(len(spots), 1, "Spots outside the geohash cells are skipped")
+            self.assertEquals(spots[0]['id'], inner.pk, "The right spot is returned")
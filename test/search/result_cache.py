@@ -0,0 +1,110 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.test.client import Client, RequestFactory
+from django.test.utils import override_settings
+from django.core import cache
+from mock import patch
+from spotseeker_server.models import Spot, SpotExtendedInfo, SpotAvailableHours, write_transaction
+from spotseeker_server.views.search import SearchView
+from spotseeker_server import models
+import simplejson as json
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok')
+class SpotSearchResultCacheTest(TestCase):
+    """ Tests caching of search results, and dropping them when spot data changes.
+    """
+
+    def setUp(self):
+        self.cache = cache.get_cache('django.core.cache.backends.locmem.LocMemCache')
+        self.cache.clear()
+        self.spot = Spot.objects.create(name="Cached search spot", capacity=10)
+
+    def tearDown(self):
+        self.cache.clear()
+
+    def search(self, params):
+        response = Client().get("/api/v1/spot", params)
+        return [spot['name'] for spot in json.loads(response.content)]
+
+    def test_repeated_search_is_cached(self):
+        with patch.object(models, 'cache', self.cache):
+            self.assertEquals(self.search({'capacity': '5', 'name': 'Cached'}), ["Cached search spot"], "Found the spot")
+
+            # Changes that skip Spot.save aren't seen until something else is written
+            Spot.objects.filter(pk=self.spot.pk).update(capacity=1)
+            self.assertEquals(self.search({'name': 'Cached', 'capacity': '5', 'oauth_nonce': '1234'}), ["Cached search spot"], "Same search in another order, from the cache")
+
+            Spot.objects.create(name="Some other spot")
+            self.assertEquals(self.search({'capacity': '5', 'name': 'Cached'}), [], "Cache dropped after a write")
+
+    def test_related_writes_drop_cache(self):
+        with patch.object(models, 'cache', self.cache):
+            self.assertEquals(self.search({'extended_info:has_outlets': 'true'}), [], "Nothing with outlets yet")
+            info = SpotExtendedInfo.objects.create(spot=self.spot, key="has_outlets", value="true")
+            self.assertEquals(self.search({'extended_info:has_outlets': 'true'}), ["Cached search spot"], "Extended info save drops the cache")
+            info.delete()
+            self.assertEquals(self.search({'extended_info:has_outlets': 'true'}), [], "Extended info delete drops the cache")
+
+            hours = SpotAvailableHours.objects.create(spot=self.spot, day="m", start_time="09:00", end_time="17:00")
+            self.assertEquals(self.search({'open_at': 'Monday,10:00'}), ["Cached search spot"], "Open on monday")
+            hours.delete()
+            self.assertEquals(self.search({'open_at': 'Monday,10:00'}), [], "Hours delete drops the cache")
+
+    def test_version_bumped_after_commit(self):
+        with patch.object(models, 'cache', self.cache):
+            version = models.data_version()
+            with write_transaction():
+                self.spot.capacity = 1
+                self.spot.save()
+                self.assertEquals(models.data_version(), version, "Same version until the transaction is over")
+            self.assertNotEquals(models.data_version(), version, "New version once it's over")
+
+    def test_snapped_coordinates(self):
+        with self.settings(SPOTSEEKER_SEARCH_CACHE_GRID=0.001):
+            view = SearchView()
+            factory = RequestFactory()
+            first = factory.get("/api/v1/spot", {'center_latitude': '47.65381', 'center_longitude': '-122.30781', 'distance': '100'})
+            second = factory.get("/api/v1/spot", {'center_latitude': '47.65409', 'center_longitude': '-122.30769', 'distance': '100'})
+            view.snap_coordinates(first)
+            view.snap_coordinates(second)
+            self.assertEquals(first.GET['center_latitude'], "47.65400000", "Latitude on the grid")
+            self.assertEquals(first.GET['center_longitude'], "-122.30800000", "Longitude on the grid")
+            self.assertEquals(view.search_cache_key(first), view.search_cache_key(second), "Nearby searches share a cache entry")
+
+    def test_exact_coordinates_without_cache(self):
+        with self.settings(SPOTSEEKER_SEARCH_CACHE_TIMEOUT=0, SPOTSEEKER_SEARCH_CACHE_GRID=0.001):
+            request = RequestFactory().get("/api/v1/spot", {'center_latitude': '47.65381', 'center_longitude': '-122.30781', 'distance': '100'})
+            SearchView().snap_coordinates(request)
+            self.assertEquals(request.GET['center_latitude'], "47.65381", "Latitude left as is")
+            self.assertEquals(request.GET['center_longitude'], "-122.30781", "Longitude left as is")
+
+            with patch.object(models, 'cache', self.cache):
+                # 33m from the search center, which a snap to the grid would bring 30m closer
+                Spot.objects.create(name="Just outside", latitude='47.6541', longitude='-122.30781')
+                self.assertEquals(self.search({'center_latitude': '47.65381', 'center_longitude': '-122.30781', 'distance': '20'}), [],
+                                  "Same results as searching from the exact center")
+
+    def test_open_now_timeout(self):
+        view = SearchView()
+        request = RequestFactory().get("/api/v1/spot", {'open_now': '1'})
+        self.assertTrue(0 < view.search_cache_timeout(request) <= 60, "open_now results expire by the next minute")
+
+    def test_disabled(self):
+        with self.settings(SPOTSEEKER_SEARCH_CACHE_TIMEOUT=0):
+            request = RequestFactory().get("/api/v1/spot", {'capacity': '5'})
+            self.assertIsNone(SearchView().search_cache_key(request), "No caching with a 0 timeout")
@@ -15,6 +15,8 @@
 
 from django.utils import unittest
 from spotseeker_server.views.search import SearchView
+from spotseeker_server.models import Spot
+from decimal import *
 
 
 class SpotSearchViewMethodsTest(unittest.TestCase):
@@ -54,3 +56,22 @@ class SpotSearchViewMethodsTest(unittest.TestCase):
         self.assertEquals(days[4], "m", "Monday is 5")
         self.assertEquals(days[5], "t", "Tuesday is 6")
         self.assertEquals(days[6], "w", "Wednesday is 7")
+
+    def test_distances(self):
+        view = SearchView()
+        near = Spot(latitude=Decimal('47.653811'), longitude=Decimal('-122.307815'))
+        far = Spot(latitude=Decimal('47.663811'), longitude=Decimal('-122.307815'))
+        nowhere = Spot()
+        distances = view.distances([far, nowhere, near], '-122.307815', '47.653811')
+        self.assertEquals(len(distances), 3, "One distance per spot")
+        self.assertAlmostEquals(distances[0], view.distance(far, '-122.307815', '47.653811'), 3, "Batched distance matches the single one")
+        self.assertEquals(distances[1], float('inf'), "Spots without a location sort last")
+        self.assertAlmostEquals(distances[2], 0, 3, "Spot at the center is 0m away")
+
+    def test_nearest_spots(self):
+        view = SearchView()
+        spots = []
+        for offset in [5, 1, 4, 2, 3]:
+            spots.append(Spot(name=str(offset), latitude=Decimal('47.65') + Decimal(offset) / 1000, longitude=Decimal('-122.30')))
+        nearest = view.nearest_spots(spots, '-122.30', '47.65', 3)
+        self.assertEquals([spot.name for spot in nearest], ['1', '2', '3'], "The 3 closest spots, nearest first")
@@ -0,0 +1,128 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.test.client import Client
+from django.test.utils import override_settings
+from django.core import cache
+from django.core.management import call_command
+from mock import patch
+from spotseeker_server.models import Spot, SpotDocument, SpotExtendedInfo, SpotAvailableHours, SpotType
+from spotseeker_server import local_cache
+from spotseeker_server import models
+from cStringIO import StringIO
+import simplejson as json
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok',
+                   SPOTSEEKER_SPOT_FORM='spotseeker_server.default_forms.spot.DefaultSpotForm',
+                   SPOTSEEKER_MATERIALIZED_SPOTS=True)
+class SpotDocumentTest(TestCase):
+    """ Tests the SpotDocument kept for each spot with SPOTSEEKER_MATERIALIZED_SPOTS.
+    """
+
+    def setUp(self):
+        local_cache.spot_cache.clear()
+        self.dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+
+    def tearDown(self):
+        local_cache.spot_cache.clear()
+
+    def test_written_with_spot(self):
+        with patch.object(models, 'cache', self.dummy_cache):
+            spot = Spot.objects.create(name="Document spot", capacity=4)
+            SpotExtendedInfo.objects.create(spot=spot, key="has_outlets", value="true")
+            SpotAvailableHours.objects.create(spot=spot, day="m", start_time="08:00", end_time="17:00")
+            spot = Spot.objects.get(pk=spot.pk)
+
+            document = SpotDocument.objects.get(spot=spot)
+            self.assertEquals(document.etag, spot.etag, "Document is for the latest version")
+            self.assertEquals(json.loads(document.content), json.loads(json.dumps(spot.query_json_data_structure())), "Document matches the spot's rows")
+
+            spot.delete()
+            self.assertFalse(SpotDocument.objects.filter(spot=spot.pk).exists(), "Document is deleted with the spot")
+
+    def test_cold_read(self):
+        with patch.object(models, 'cache', self.dummy_cache):
+            spot = Spot.objects.create(name="Cold document spot")
+            SpotExtendedInfo.objects.create(spot=spot, key="noise_level", value="quiet")
+            spot = Spot.objects.get(pk=spot.pk)
+            local_cache.spot_cache.clear()
+
+            # The spot and its document
+            with self.assertNumQueries(2):
+                response = Client().get("/api/v1/spot/%s" % spot.pk)
+            self.assertEquals(json.loads(response.content)["extended_info"], {"noise_level": "quiet"}, "Read from the document")
+
+    def test_cold_list(self):
+        with patch.object(models, 'cache', self.dummy_cache):
+            spots = [Spot.objects.create(name="Listed document spot %s" % i) for i in range(5)]
+            spots = list(Spot.objects.filter(pk__in=[spot.pk for spot in spots]))
+            local_cache.spot_cache.clear()
+            with self.assertNumQueries(1):
+                structures = Spot.bulk_json_data_structure(spots)
+            self.assertEquals([spot_json["name"] for spot_json in structures], [spot.name for spot in spots], "Read from the documents")
+
+    def test_stale_document_ignored(self):
+        with patch.object(models, 'cache', self.dummy_cache):
+            spot = Spot.objects.create(name="Stale document spot")
+            # A change that doesn't go through Spot.save
+            Spot.objects.filter(pk=spot.pk).update(name="Changed behind its back", etag="100")
+            spot = Spot.objects.get(pk=spot.pk)
+            self.assertEquals(spot.json_data_structure()["name"], "Changed behind its back", "Document for an old ETag isn't used")
+            self.assertEquals(Spot.bulk_json_data_structure([spot])[0]["name"], "Changed behind its back", "Or in bulk")
+
+    def test_put_updates_document(self):
+        with patch.object(models, 'cache', self.dummy_cache):
+            spot = Spot.objects.create(name="PUT document spot", latitude=55, longitude=30)
+            new_name = "PUT document spot - changed"
+            response = Client().put("/api/v1/spot/%s" % spot.pk,
+                                    '{"name":"%s","capacity":"10","location":{"latitude":"55","longitude":"30"},"extended_info":{"has_whiteboards":"true"}}' % new_name,
+                                    content_type="application/json", If_Match=spot.etag)
+            spot = Spot.objects.get(pk=spot.pk)
+            document = json.loads(SpotDocument.objects.get(spot=spot).content)
+            self.assertEquals(document["name"], new_name, "Fields are in the document")
+            self.assertEquals(document["extended_info"], {"has_whiteboards": "true"}, "Extended info is in the document")
+
+            response = Client().post("/api/v1/spot/",
+                                     '{"name":"POST document spot","capacity":"10","location":{"latitude":"55","longitude":"30"},"extended_info":{"has_outlets":"true"}}',
+                                     content_type="application/json")
+            spot_id = int(response["Location"].split("/")[-1])
+            document = json.loads(SpotDocument.objects.get(spot=spot_id).content)
+            self.assertEquals(document["extended_info"], {"has_outlets": "true"}, "New spots get all their rows in the document")
+
+    def test_types_update_document(self):
+        with patch.object(models, 'cache', self.dummy_cache):
+            spot = Spot.objects.create(name="Typed document spot")
+            study_room, created = SpotType.objects.get_or_create(name="study_room")
+            etag = spot.etag
+
+            spot.spottypes.add(study_room)
+            self.assertEquals(Spot.objects.get(pk=spot.pk).json_data_structure()["type"], ["study_room"], "Added type is served")
+            self.assertNotEquals(Spot.objects.get(pk=spot.pk).etag, etag, "Adding a type is a new version")
+
+            spot.spottypes.clear()
+            self.assertEquals(Spot.objects.get(pk=spot.pk).json_data_structure()["type"], [], "Cleared types are served")
+
+            study_room.spots.add(spot)
+            study_room.spots.clear()
+            self.assertEquals(Spot.objects.get(pk=spot.pk).json_data_structure()["type"], [], "Types changed from the other side too")
+
+    def test_command(self):
+        with self.settings(SPOTSEEKER_MATERIALIZED_SPOTS=False):
+            spots = [Spot.objects.create(name="Unmaterialized spot %s" % i) for i in range(3)]
+        self.assertEquals(SpotDocument.objects.filter(spot__in=spots).count(), 0, "No documents while it's off")
+        call_command('materialize_spots', batch_size=2, stdout=StringIO())
+        self.assertEquals(SpotDocument.objects.filter(spot__in=spots).count(), 3, "Every spot gets a document")
@@ -0,0 +1,123 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.test.client import Client, FakePayload
+from django.test.utils import override_settings
+from django.core import cache
+from mock import patch
+from spotseeker_server.models import Spot, SpotExtendedInfo, SpotAvailableHours
+from spotseeker_server.views.spot import SpotView, merge_patch
+from spotseeker_server import models
+import simplejson as json
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok',
+                   SPOTSEEKER_SPOT_FORM='spotseeker_server.default_forms.spot.DefaultSpotForm')
+class SpotPATCHTest(TestCase):
+    """ Tests partial updates to a Spot via PATCH.
+    """
+
+    def setUp(self):
+        self.spot = Spot.objects.create(name="This is for testing PATCH", capacity=10, latitude=55, longitude=30, floor="2")
+        SpotExtendedInfo.objects.create(spot=self.spot, key="has_outlets", value="true")
+        SpotExtendedInfo.objects.create(spot=self.spot, key="noise_level", value="quiet")
+        SpotAvailableHours.objects.create(spot=self.spot, day="m", start_time="08:00", end_time="17:00")
+        self.spot = Spot.objects.get(pk=self.spot.pk)
+        self.url = "/api/v1/spot/%s" % self.spot.pk
+
+    def patch(self, body, etag):
+        return Client().request(**{
+            'REQUEST_METHOD': 'PATCH',
+            'PATH_INFO': self.url,
+            'CONTENT_TYPE': 'application/merge-patch+json',
+            'CONTENT_LENGTH': len(body),
+            'HTTP_IF_MATCH': etag,
+            'wsgi.input': FakePayload(body),
+        })
+
+    def test_merge_patch(self):
+        document = {"name": "a", "location": {"floor": "1", "room_number": "2"}, "type": ["x"]}
+        merged = merge_patch(document, {"location": {"floor": None, "building_name": "b"}, "type": ["y"]})
+        self.assertEquals(merged, {"name": "a", "location": {"room_number": "2", "building_name": "b"}, "type": ["y"]}, "RFC 7386 merge")
+        self.assertEquals(document["location"], {"floor": "1", "room_number": "2"}, "Document isn't changed")
+
+    def test_patch_extended_info(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            outlets = SpotExtendedInfo.objects.get(spot=self.spot, key="has_outlets")
+            response = self.patch('{"extended_info": {"noise_level": "loud", "has_whiteboards": "true", "has_outlets": null}}', self.spot.etag)
+            self.assertEquals(response.status_code, 200, "PATCH accepted")
+
+            spot_json = json.loads(response.content)
+            self.assertEquals(spot_json["extended_info"], {"noise_level": "loud", "has_whiteboards": "true"}, "Extended info is merged")
+            self.assertEquals(spot_json["name"], "This is for testing PATCH", "Other fields are left alone")
+            self.assertEquals(spot_json["capacity"], 10, "Other fields are left alone")
+            self.assertEquals(spot_json["available_hours"]["monday"], [["08:00", "17:00"]], "Hours are left alone")
+            self.assertFalse(SpotExtendedInfo.objects.filter(pk=outlets.pk).exists(), "null removes extended info")
+            self.assertNotEquals(response["ETag"], self.spot.etag, "New ETag")
+
+    def test_patch_fields(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            response = self.patch('{"name": "Patched name", "location": {"floor": null}}', self.spot.etag)
+            spot = Spot.objects.get(pk=self.spot.pk)
+            self.assertEquals(spot.name, "Patched name", "Name is changed")
+            self.assertEquals(spot.floor, "", "null clears the floor")
+            self.assertEquals(spot.capacity, 10, "Capacity is left alone")
+            self.assertEquals(SpotExtendedInfo.objects.filter(spot=spot).count(), 2, "Extended info is left alone")
+
+    def test_cache_updated_in_place(self):
+        locmem_cache = cache.get_cache('django.core.cache.backends.locmem.LocMemCache')
+        locmem_cache.clear()
+        with patch.object(models, 'cache', locmem_cache):
+            self.spot.json_data_structure()
+            response = self.patch('{"capacity": 20}', self.spot.etag)
+            spot = Spot.objects.get(pk=self.spot.pk)
+            cached = locmem_cache.get(spot.pk)
+            self.assertIsNotNone(cached, "The cached json is replaced, not dropped")
+            self.assertEquals(cached["capacity"], 20, "The cached json is updated")
+            self.assertEquals(cached, spot.build_json_data_structure(SpotExtendedInfo.objects.filter(spot=spot),
+                                                                     SpotAvailableHours.objects.filter(spot=spot),
+                                                                     [], []), "Same json as building it again")
+        locmem_cache.clear()
+
+    def test_write_after_patch(self):
+        locmem_cache = cache.get_cache('django.core.cache.backends.locmem.LocMemCache')
+        locmem_cache.clear()
+        with patch.object(models, 'cache', locmem_cache):
+            self.spot.json_data_structure()
+            save_changes = SpotView.save_changes
+
+            def other_writer(view, changes_list):
+                save_changes(view, changes_list)
+                # Another write, that lands before the patch's json is cached
+                SpotExtendedInfo.objects.create(spot=self.spot, key="has_whiteboards", value="true")
+
+            with patch.object(SpotView, 'save_changes', autospec=True, side_effect=other_writer):
+                self.patch('{"capacity": 20}', self.spot.etag)
+            cached = locmem_cache.get(self.spot.pk)
+            self.assertTrue(cached is None or "has_whiteboards" in cached["extended_info"], "The patch's json doesn't replace a later write's")
+            self.assertEquals(Spot.objects.get(pk=self.spot.pk).json_data_structure()["extended_info"]["has_whiteboards"], "true", "Later write is served")
+        locmem_cache.clear()
+
+    def test_conflict(self):
+        response = self.patch('{"capacity": 20}', "not the etag")
+        self.assertEquals(response.status_code, 409, "PATCH needs the current ETag")
+        response = self.patch('{"name": null}', self.spot.etag)
+        self.assertEquals(response.status_code, 400, "The patched spot still has to be valid")
+        self.assertTrue(Spot.objects.filter(pk=self.spot.pk).exists(), "An invalid PATCH doesn't delete the spot")
+        response = self.patch('["not", "a", "patch"]', self.spot.etag)
+        self.assertEquals(response.status_code, 400, "Patches are JSON objects")
@@ -16,7 +16,7 @@
 from django.test import TestCase
 from django.conf import settings
 from django.test.client import Client
-from spotseeker_server.models import Spot
+from spotseeker_server.models import Spot, SpotTombstone
 import simplejson as json
 import random
 from django.test.utils import override_settings
@@ -84,3 +84,17 @@ class SpotPOSTTest(TestCase):
             spot_json = json.loads(get_response.content)
             extended_info = {"has_outlets": "true"}
             self.assertEquals(spot_json["extended_info"], extended_info, "extended_info was succesffuly POSTed")
+
+    def test_invalid_input_saves_nothing(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            c = Client()
+            json_string = '{"name":"Bad info POST", "location": {"latitude": 50, "longitude": -30},"extended_info":{"has_outlets":"%s"}}' % ("x" * 300)
+            response = c.post('/api/v1/spot/', json_string, content_type="application/json", follow=False)
+            self.assertEquals(response.status_code, 400, "Rejects a value too long for extended info")
+
+            response = c.post('/api/v1/spot/', '{"name":"No location"}', content_type="application/json", follow=False)
+            self.assertEquals(response.status_code, 400, "Rejects a spot without a location")
+
+            self.assertEquals(Spot.objects.count(), 0, "No spot was made")
+            self.assertEquals(SpotTombstone.objects.count(), 0, "Nothing was deleted either")
@@ -16,7 +16,7 @@
 from django.test import TestCase
 from django.conf import settings
 from django.test.client import Client
-from spotseeker_server.models import Spot
+from spotseeker_server.models import Spot, SpotExtendedInfo, SpotAvailableHours
 import simplejson as json
 import random
 from django.test.utils import override_settings
@@ -211,3 +211,62 @@ class SpotPUTTest(TestCase):
             spot_json = json.loads(response.content)
             extended_info = {"has_outlets": "true"}
             self.assertEquals(spot_json["extended_info"], extended_info, "extended_info was successfully PUT")
+
+    def test_unchanged_put(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            c = Client()
+            json_string = '{"name":"Unchanged PUT","capacity":"10", "location": {"latitude": 55, "longitude": 30}, "extended_info":{"has_outlets":"true"}, "available_hours":{"monday":[["08:00","17:00"]]}}'
+            etag = c.get(self.url)["ETag"]
+            c.put(self.url, json_string, content_type="application/json", If_Match=etag)
+            etag = c.get(self.url)["ETag"]
+
+            response = c.put(self.url, json_string, content_type="application/json", If_Match=etag)
+            self.assertEquals(response.status_code, 200, "Accepts the same spot again")
+            self.assertEquals(response["ETag"], etag, "Nothing changed, so nothing was saved")
+
+    def test_only_changed_rows_written(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            c = Client()
+            etag = c.get(self.url)["ETag"]
+            c.put(self.url, '{"name":"Diff PUT", "location": {"latitude": 55, "longitude": 30}, "extended_info":{"has_outlets":"true", "noise_level":"quiet"}, "available_hours":{"monday":[["08:00","12:00"]], "tuesday":[["08:00","12:00"]]}}', content_type="application/json", If_Match=etag)
+            outlets = SpotExtendedInfo.objects.get(spot=self.spot, key="has_outlets")
+            monday = SpotAvailableHours.objects.get(spot=self.spot, day="m")
+
+            etag = c.get(self.url)["ETag"]
+            response = c.put(self.url, '{"name":"Diff PUT", "location": {"latitude": 55, "longitude": 30}, "extended_info":{"has_outlets":"true", "noise_level":"loud"}, "available_hours":{"monday":[["08:00","12:00"]], "tuesday":[["09:00","10:00"], ["09:30","12:00"]]}}', content_type="application/json", If_Match=etag)
+            self.assertNotEquals(response["ETag"], etag, "Changes get a new ETag")
+
+            self.assertEquals(SpotExtendedInfo.objects.get(spot=self.spot, key="has_outlets").pk, outlets.pk, "Unchanged extended info is kept")
+            self.assertEquals(SpotExtendedInfo.objects.get(spot=self.spot, key="noise_level").value, "loud", "Changed extended info is updated")
+            self.assertEquals(SpotAvailableHours.objects.get(spot=self.spot, day="m").pk, monday.pk, "Unchanged hours are kept")
+            self.assertEquals(json.loads(response.content)["available_hours"]["tuesday"], [["09:00", "12:00"]], "Overlapping hours are merged")
+            self.assertEquals(self.spot.spotopeninterval_set.count(), 2, "Open intervals are rebuilt")
+
+    def test_other_spots_info_kept(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            other_spot = Spot.objects.create(name="Not being PUT")
+            SpotExtendedInfo.objects.create(spot=other_spot, key="has_whiteboards", value="true")
+
+            c = Client()
+            etag = c.get(self.url)["ETag"]
+            c.put(self.url, '{"name":"Info PUT", "location": {"latitude": 55, "longitude": 30}, "extended_info":{"has_outlets":"true"}}', content_type="application/json", If_Match=etag)
+            etag = c.get(self.url)["ETag"]
+            c.put(self.url, '{"name":"Info PUT", "location": {"latitude": 55, "longitude": 30}}', content_type="application/json", If_Match=etag)
+
+            self.assertEquals(other_spot.spotextendedinfo_set.count(), 1, "Only the PUT spot's extended info is removed")
+
+    def test_invalid_extended_info_keeps_spot(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            c = Client()
+            etag = c.get(self.url)["ETag"]
+            json_string = '{"name":"Bad info PUT", "location": {"latitude": 55, "longitude": 30}, "extended_info":{"has_outlets":"%s"}}' % ("x" * 300)
+            response = c.put(self.url, json_string, content_type="application/json", If_Match=etag)
+            self.assertEquals(response.status_code, 400, "Rejects a value too long for extended info")
+
+            spot = Spot.objects.get(pk=self.spot.pk)
+            self.assertEquals(spot.name, "This is for testing PUT", "The spot is still there, unchanged")
+            self.assertEquals(spot.etag, etag, "Nothing was saved")
@@ -0,0 +1,111 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from django.test import TestCase
+from django.test.client import Client, RequestFactory
+from django.test.utils import override_settings
+from django.core import cache
+from mock import patch
+from spotseeker_server.models import Spot
+from spotseeker_server.views.streaming import StreamingJSONResponse, spot_json_chunks
+from spotseeker_server.logger.oauth import LogMiddleware
+from spotseeker_server import models
+import simplejson as json
+import StringIO
+import logging
+
+
+@override_settings(SPOTSEEKER_AUTH_MODULE='spotseeker_server.auth.all_ok')
+@override_settings(SPOTSEEKER_STREAMING_RESPONSES=True)
+@override_settings(SPOTSEEKER_STREAMING_CHUNK_SIZE=2)
+class SpotStreamingTest(TestCase):
+    """ Tests streaming long lists of spots.
+    """
+
+    def setUp(self):
+        self.spots = []
+        for i in range(5):
+            self.spots.append(Spot.objects.create(name="Streaming spot %s" % i, capacity=i))
+
+    def test_chunks(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            chunks = list(spot_json_chunks(Spot.objects.all(), chunk_size=2))
+            # The brackets, then 3 chunks of spots
+            self.assertEquals(len(chunks), 5, "Spots are sent a few at a time")
+            spots = json.loads("".join(chunks))
+            self.assertEquals([spot["id"] for spot in spots], [spot.pk for spot in self.spots], "Every spot, once, in order")
+
+    def test_empty(self):
+        self.assertEquals("".join(spot_json_chunks(Spot.objects.none())), "[]", "No spots is an empty list")
+
+    def test_all_spots(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            response = Client().get("/api/v1/spot/all")
+            self.assertEquals(response.status_code, 200, "Streamed all spots")
+            self.assertTrue(getattr(response, 'streaming', False), "Streaming response")
+            self.assertEquals(len(json.loads(response.content)), 5, "All the spots are in the list")
+
+    def test_unlimited_search(self):
+        dummy_cache = cache.get_cache('django.core.cache.backends.dummy.DummyCache')
+        with patch.object(models, 'cache', dummy_cache):
+            response = Client().get("/api/v1/spot", {'capacity': '2', 'limit': '0'})
+            self.assertTrue(getattr(response, 'streaming', False), "Streaming response")
+            capacities = sorted([spot["capacity"] for spot in json.loads(response.content)])
+            self.assertEquals(capacities, [2, 3, 4], "Streamed the matching spots")
+
+    def test_completion_size(self):
+        sizes = []
+        response = StreamingJSONResponse(iter(["[", "1,2", "]"]))
+        response.on_complete(sizes.append)
+        self.assertEquals(sizes, [], "Nothing sent yet")
+        self.assertEquals(response.content, "[1,2]", "All the chunks are sent")
+        self.assertEquals(sizes, [5], "Size is given once everything is sent")
+
+    def test_logged_after_sending(self):
+        stream = StringIO.StringIO()
+        handler = logging.StreamHandler(stream)
+        log = logging.getLogger('spotseeker_server.logger.oauth')
+        log.setLevel(logging.INFO)
+        log.addHandler(handler)
+        try:
+            request = RequestFactory().get("/api/v1/spot/all")
+            response = StreamingJSONResponse(iter(["[", "]"]))
+            LogMiddleware().process_response(request, response)
+            self.assertEquals(stream.getvalue(), "", "Not logged before the response is sent")
+            "".join(response)
+            self.assertTrue(stream.getvalue().strip().endswith('"GET /api/v1/spot/all" 200 2'), "Logged with the streamed size")
+        finally:
+            log.removeHandler(handler)
+
+    def test_disconnect_logged(self):
+        stream = StringIO.StringIO()
+        handler = logging.StreamHandler(stream)
+        log = logging.getLogger('spotseeker_server.views.streaming')
+        log.setLevel(logging.INFO)
+        log.addHandler(handler)
+        try:
+            sizes = []
+            response = StreamingJSONResponse(iter(["[", "1,2", "]"]))
+            response.on_complete(sizes.append)
+            chunks = iter(response)
+            chunks.next()
+            # What the server does when the client goes away
+            response.close()
+            self.assertTrue("disconnected after 1 bytes" in stream.getvalue(), "The disconnect is logged")
+            self.assertEquals(sizes, [], "Not complete")
+        finally:
+            log.removeHandler(handler)
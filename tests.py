@@ -22,6 +22,7 @@ from spotseeker_server.test.spot_put import SpotPUTTest
 from spotseeker_server.test.spot_delete import SpotDELETETest
 from spotseeker_server.test.spot_post import SpotPOSTTest
 from spotseeker_server.test.spot_get import SpotGETTest
+from spotseeker_server.test.bulk_json import SpotBulkJsonTest
 from spotseeker_server.test.no_rest_methods import NoRESTMethodsTest
 from spotseeker_server.test.schema import SpotSchemaTest
 from spotseeker_server.test.images.get import SpotImageGETTest
@@ -29,6 +30,11 @@ from spotseeker_server.test.images.post import SpotImagePOSTTest
 from spotseeker_server.test.images.put import SpotImagePUTTest
 from spotseeker_server.test.images.delete import SpotImageDELETETest
 from spotseeker_server.test.images.thumb import ImageThumbTest
+from spotseeker_server.test.images.thumb_cache import ThumbnailCacheTest
+from spotseeker_server.test.images.thumb_encoding import ThumbnailEncodingTest
+from spotseeker_server.test.images.delivery import ImageDeliveryTest
+from spotseeker_server.test.images.content_storage import ContentStorageTest
+from spotseeker_server.test.images.upload_checks import ImageUploadCheckTest
 from spotseeker_server.test.images.spot_info import SpotResourceImageTest
 from spotseeker_server.test.images.oauth_spot_info import SpotResourceOAuthImageTest
 from spotseeker_server.test.search.buildings import BuildingSearchTest
@@ -37,6 +43,9 @@ from spotseeker_server.test.search.distance import SpotSearchDistanceTest
 from spotseeker_server.test.search.fields import SpotSearchFieldTest
 from spotseeker_server.test.search.distance_fields import SpotSearchDistanceFieldTest
 from spotseeker_server.test.search.view_methods import SpotSearchViewMethodsTest
+from spotseeker_server.test.search.geohash import SpotSearchGeohashTest
+from spotseeker_server.test.search.extended_info_index import SpotSearchExtendedInfoIndexTest
+from spotseeker_server.test.search.result_cache import SpotSearchResultCacheTest
 from spotseeker_server.test.hours.model import SpotHoursModelTest
 from spotseeker_server.test.hours.get import SpotHoursGETTest
 from spotseeker_server.test.hours.put import SpotHoursPUTTest
@@ -48,6 +57,7 @@ from spotseeker_server.test.hours.open_now_location import SpotHoursOpenNowLocat
 from spotseeker_server.test.hours.open_now_location_attributes import SpotHoursOpenNowLocationAttributesTest
 from spotseeker_server.test.hours.overlap import SpotHoursOverlapTest
 from spotseeker_server.test.hours.modify import SpotHoursModifyTest
+from spotseeker_server.test.hours.open_interval import SpotOpenIntervalTest
 from spotseeker_server.test.auth.all_ok import SpotAuthAllOK
 from spotseeker_server.test.auth.oauth import SpotAuthOAuth
 from spotseeker_server.test.auth.oauth_logger import SpotAuthOAuthLogger
@@ -56,3 +66,13 @@ from spotseeker_server.test.uw_spot.spot_post import UWSpotPOSTTest
 from spotseeker_server.test.uw_spot.spot_put import UWSpotPUTTest
 from spotseeker_server.test.uw_spot.schema import UWSpotSchemaTest
 from spotseeker_server.test.cache_test import JsonCachingTest
+from spotseeker_server.test.local_cache import LocalCacheTest
+from spotseeker_server.test.streaming import SpotStreamingTest
+from spotseeker_server.test.pagination import SpotPaginationTest
+from spotseeker_server.test.bulk_import import SpotBulkImportTest
+from spotseeker_server.test.batched_saves import SpotBatchedSavesTest
+from spotseeker_server.test.conditional_get import ConditionalGETTest
+from spotseeker_server.test.changes import SpotChangesTest
+from spotseeker_server.test.concurrent_writes import ConcurrentWritesTest
+from spotseeker_server.test.spot_patch import SpotPATCHTest
+from spotseeker_server.test.spot_document import SpotDocumentTest
@@ -0,0 +1,167 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+
+A cache of rendered thumbnails on disk, shared by every process on a server.
+
+Thumbnails are stored under a directory per group, in a file named for the
+thumbnail's key.  Images stored by content hash use the hash as their group,
+so images with the same bytes share thumbnails, and a key that's just the
+size, constrain and resize mode.  Other images use their id, with their
+ETag in the key, so a thumbnail of an older version is never served.  The
+directory of an image id is removed when the image is changed or deleted,
+and the directory of a hash when the last image with it is deleted.
+
+When the files add up to more than the size limit, the least recently used
+ones are removed.  Turn it on in your settings.py with:
+
+SPOTSEEKER_THUMBNAIL_CACHE_DIR = '/var/cache/spotseeker/thumbnails'
+SPOTSEEKER_THUMBNAIL_CACHE_SIZE = 256 * 1024 * 1024  # Bytes
+"""
+
+from django.conf import settings
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+DEFAULT_SIZE = 256 * 1024 * 1024
+
+# Removing a few more than needed, so a full cache isn't scanned on every write
+EVICT_TO = 0.9
+
+
+class ThumbnailCache(object):
+    """ Thumbnail files on disk, keyed by group and key, with a bounded total size.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        # This process's idea of the cache size - other processes write to it too
+        self.size = None
+
+    def directory(self):
+        return getattr(settings, 'SPOTSEEKER_THUMBNAIL_CACHE_DIR', None)
+
+    def max_size(self):
+        return getattr(settings, 'SPOTSEEKER_THUMBNAIL_CACHE_SIZE', DEFAULT_SIZE)
+
+    def enabled(self):
+        return bool(self.directory()) and self.max_size() > 0
+
+    def group_directory(self, group):
+        return os.path.join(self.directory(), safe_name(group))
+
+    def path(self, group, key):
+        return os.path.join(self.group_directory(group), safe_name(key))
+
+    def open(self, group, key):
+        """ Returns the cached thumbnail, as an open file, or None.
+        """
+        if not self.enabled():
+            return None
+        path = self.path(group, key)
+        try:
+            thumbnail = open(path, 'rb')
+        except IOError:
+            return None
+        try:
+            # The modification time marks when it was last used
+            os.utime(path, None)
+        except OSError:
+            pass
+        return thumbnail
+
+    def set(self, group, key, data):
+        """ Stores a thumbnail.  The file is written under a temporary name and then
+        renamed, so no process reads a partly written thumbnail.
+        """
+        if not self.enabled():
+            return
+        directory = self.group_directory(group)
+        path = self.path(group, key)
+        try:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            handle, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp')
+            with os.fdopen(handle, 'wb') as tmp:
+                tmp.write(data)
+            try:
+                # A thumbnail written over another one doesn't add the old one's size again
+                replaced = os.stat(path).st_size
+            except OSError:
+                replaced = 0
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            # The image was changed or deleted while this was written, or the disk is full
+            return
+
+        with self.lock:
+            if self.size is None:
+                self.size = self.total_size()
+            else:
+                self.size += len(data) - replaced
+            over = self.size > self.max_size()
+        if over:
+            self.evict()
+
+    def invalidate(self, group):
+        """ Removes every thumbnail in a group.
+        """
+        if not self.enabled():
+            return
+        shutil.rmtree(self.group_directory(group), ignore_errors=True)
+
+    def files(self):
+        """ Returns (last used, size, path) for each thumbnail in the cache.
+        """
+        files = []
+        for root, directories, names in os.walk(self.directory()):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def total_size(self):
+        return sum(size for used, size, path in self.files())
+
+    def evict(self):
+        """ Removes the least recently used thumbnails, until the cache is back under its size limit.
+        """
+        files = sorted(self.files())
+        size = sum(file_size for used, file_size, path in files)
+        limit = self.max_size() * EVICT_TO
+        for used, file_size, path in files:
+            if size <= limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= file_size
+
+        with self.lock:
+            self.size = size
+
+
+def safe_name(name):
+    # Groups and keys are ids, hashes and ETags, but keep anything else out of the path
+    return re.sub(r'[^\w.-]', '_', str(name))
+
+
+thumbnail_cache = ThumbnailCache()
@@ -22,14 +22,20 @@ from spotseeker_server.views.image import ImageView
 from spotseeker_server.views.thumbnail import ThumbnailView
 from spotseeker_server.views.null import NullView
 from spotseeker_server.views.all_spots import AllSpotsView
+from spotseeker_server.views.bulk_import import BulkImportView
+from spotseeker_server.views.changes import ChangesView
+from spotseeker_server.views.cache_stats import CacheStatsView
 
 urlpatterns = patterns('',
     url(r'v1/null$', NullView().run),
     url(r'v1/spot/(?P<spot_id>\d+)$', SpotView().run),
     url(r'v1/spot/?$', SearchView().run),
     url(r'v1/spot/all$', AllSpotsView().run),
+    url(r'v1/spot/bulk$', BulkImportView().run),
+    url(r'v1/spot/changes$', ChangesView().run),
     url(r'v1/buildings/?$', BuildingListView().run),
     url(r'v1/schema$', 'spotseeker_server.views.schema_gen.schema_gen'),
+    url(r'v1/cache_stats$', CacheStatsView().run),
     url(r'v1/spot/(?P<spot_id>\d+)/image$', AddImageView().run),
     url(r'v1/spot/(?P<spot_id>\d+)/image/(?P<image_id>\d+)$', ImageView().run),
     url(r'v1/spot/(?P<spot_id>\d+)/image/(?P<image_id>\d+)/thumb/constrain/width:(?P<thumb_width>\d+)(?:,height:(?P<thumb_height>\d+))?$', ThumbnailView().run, {'constrain': True}),
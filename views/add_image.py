@@ -18,12 +18,16 @@ from spotseeker_server.models import SpotImage, Spot
 from django.http import HttpResponse
 from django.core.exceptions import ValidationError
 from spotseeker_server.require_auth import *
+from spotseeker_server.views.thumbnail import generate_presets
+from spotseeker_server.image_storage import prepares_uploads, upload_error
 from PIL import Image
+import simplejson as json
 
 
 class AddImageView(RESTDispatch):
     """ Saves a SpotImage for a particular Spot on POST to /api/v1/spot/<spot id>/image.
     """
+    @prepares_uploads
     @user_auth_required
     def POST(self, request, spot_id):
         try:
@@ -33,6 +37,12 @@ class AddImageView(RESTDispatch):
             response.status_code = 404
             return response
 
+        error = upload_error(request)
+        if error:
+            response = HttpResponse(json.dumps({"error": error.message}))
+            response.status_code = error.status
+            return response
+
         if not "image" in request.FILES:
             response = HttpResponse('"error":"No image"}')
             response.status_code = 400
@@ -58,6 +68,8 @@ class AddImageView(RESTDispatch):
         if "description" in request.POST:
             image.description = request.POST["description"]
 
+        generate_presets(image)
+
         response = HttpResponse()
         response.status_code = 201
         response["Location"] = image.rest_url()
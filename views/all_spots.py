@@ -14,6 +14,8 @@
 """
 
 from spotseeker_server.views.rest_dispatch import RESTDispatch
+from spotseeker_server.views.pagination import paged_response, paging_requested
+from spotseeker_server.views.streaming import StreamingJSONResponse, spot_json_chunks, streaming_enabled
 from spotseeker_server.forms.spot import SpotForm
 from spotseeker_server.models import *
 from django.http import HttpResponse
@@ -26,7 +28,8 @@ class AllSpotsView(RESTDispatch):
     @app_auth_required
     def GET(self, request):
         spots = Spot.objects.all()
-        response = []
-        for spot in spots:
-            response.append(spot.json_data_structure())
-        return HttpResponse(json.dumps(response))
+        if paging_requested(request):
+            return paged_response(request, spots)
+        if streaming_enabled():
+            return StreamingJSONResponse(spot_json_chunks(spots))
+        return HttpResponse("[{0}]".format(",".join(Spot.bulk_json_fragments(spots))))
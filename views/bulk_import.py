@@ -0,0 +1,173 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+
+Creates and updates many spots in one request.  The body is either a JSON
+list of spot documents, or JSON lines - one spot document per line.  A
+document with an "id" updates that spot, and needs an "eTag" that's the
+spot's current ETag, like the If-Match header of a PUT.  A document without
+an id creates a new spot.
+
+Documents are checked the same way as a POST or PUT of a single spot, and
+written in batches of SPOTSEEKER_BULK_IMPORT_BATCH_SIZE, a transaction each.
+The response is a list with the status of each document, in order.
+"""
+
+from spotseeker_server.views.rest_dispatch import RESTDispatch
+from spotseeker_server.views.spot import SpotView, SpotInputError
+from spotseeker_server.forms.spot import SpotForm
+from spotseeker_server.models import Spot, ETagConflict, lock_version, write_transaction
+from spotseeker_server.require_auth import *
+from django.http import HttpResponse
+from django.conf import settings
+import simplejson as json
+
+DEFAULT_BATCH_SIZE = 200
+
+JSON_LINES_TYPES = ["application/x-ndjson", "application/jsonl", "application/x-jsonlines"]
+
+
+class BulkImportView(RESTDispatch):
+    """ Creates and updates spots at /api/v1/spot/bulk.
+    POST with a list of spot documents returns 200, with a status for each document.
+    """
+    @user_auth_required
+    def POST(self, request):
+        try:
+            documents = self.parse_documents(request)
+        except ValueError:
+            response = HttpResponse('{"error":"Unable to parse JSON"}')
+            response.status_code = 400
+            return response
+
+        batch_size = getattr(settings, 'SPOTSEEKER_BULK_IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        results = []
+        for start in range(0, len(documents), batch_size):
+            results.extend(self.import_batch(documents[start:start + batch_size], start))
+
+        response = HttpResponse(json.dumps(results))
+        response["Content-type"] = "application/json"
+        return response
+
+    def parse_documents(self, request):
+        """ Returns the spot documents in the request body.  A JSON lines document that
+        can't be parsed is kept as None, and gets an error status of its own.
+        """
+        body = request.read()
+        content_type = request.META.get("CONTENT_TYPE", "").split(";")[0].strip()
+        if content_type not in JSON_LINES_TYPES and body.lstrip().startswith("["):
+            documents = json.loads(body)
+            if not isinstance(documents, list):
+                raise ValueError("Not a list of spots")
+            return documents
+
+        documents = []
+        for line in body.splitlines():
+            if line.strip():
+                try:
+                    documents.append(json.loads(line))
+                except ValueError:
+                    documents.append(None)
+        return documents
+
+    @write_transaction()
+    def import_batch(self, documents, first_index):
+        """ Checks and saves a batch of spot documents, returning their statuses.
+        """
+        spot_view = SpotView()
+        ids = [self.spot_id(document) for document in documents]
+        spots = Spot.objects.in_bulk([spot_id for spot_id in ids if spot_id is not None])
+        # A spot updated twice in a batch has the same ETag in both documents
+        etags = dict((spot_id, spot.etag) for spot_id, spot in spots.items())
+        locked = set()
+
+        results = []
+        pending = []
+        pending_ids = set()
+        for index, (document, spot_id) in enumerate(zip(documents, ids), first_index):
+            result = {"index": index}
+            results.append(result)
+
+            if not isinstance(document, dict):
+                result.update(status=400, error="Unable to parse JSON")
+                continue
+
+            if "id" in document:
+                if spot_id not in spots:
+                    result.update(status=404, error="Spot not found")
+                    continue
+                spot = spots[spot_id]
+                if "eTag" not in document:
+                    result.update(status=409, error="eTag required")
+                    continue
+                if document["eTag"] != etags[spot_id]:
+                    result.update(status=409, error="Invalid ETag")
+                    continue
+                if spot_id not in locked:
+                    # Another write could have got in since the spots were read
+                    try:
+                        lock_version(spot, document["eTag"])
+                    except ETagConflict:
+                        result.update(status=409, error="Invalid ETag")
+                        continue
+                    locked.add(spot_id)
+                if spot.pk in pending_ids:
+                    # Another change to the same spot - it has to be diffed against the first
+                    spot_view.save_changes(pending)
+                    pending = []
+                    pending_ids = set()
+                status = 200
+            else:
+                spot = Spot()
+                status = 201
+
+            form = SpotForm(document)
+            if not form.is_valid():
+                result.update(status=400, error=form.errors)
+                continue
+
+            try:
+                changes = spot_view.changes_from_input(spot, document)
+            except SpotInputError as e:
+                if spot.pk:
+                    # Put back the fields the document changed
+                    spots[spot.pk] = Spot.objects.get(pk=spot.pk)
+                result.update(status=400, error=e.errors)
+                continue
+
+            pending.append(changes)
+            if spot.pk:
+                changes.expected_etag = spot.etag
+                pending_ids.add(spot.pk)
+            result.update(status=status, spot=changes)
+
+        spot_view.save_changes(pending)
+
+        # The spots have ids and ETags once they're saved
+        for result in results:
+            if "spot" in result:
+                spot = result.pop("spot").spot
+                result.update(id=spot.pk, uri=spot.rest_url(), eTag=spot.etag)
+        return results
+
+    def spot_id(self, document):
+        """ Returns the id of the spot a document updates, or None if it doesn't have
+        one that could be a spot's id.
+        """
+        if not isinstance(document, dict) or "id" not in document:
+            return None
+        try:
+            return int(document["id"])
+        except (ValueError, TypeError):
+            return None
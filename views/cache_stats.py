@@ -0,0 +1,30 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+
+from spotseeker_server.views.rest_dispatch import RESTDispatch
+from spotseeker_server.require_auth import *
+from spotseeker_server import local_cache
+from django.http import HttpResponse
+import simplejson as json
+
+
+class CacheStatsView(RESTDispatch):
+    """ Returns 200 with the hit and miss counts of this process's local spot cache, for monitoring.
+    """
+    @app_auth_required
+    def GET(self, request):
+        response = HttpResponse(json.dumps(local_cache.spot_cache.stats()))
+        response["Content-type"] = "application/json"
+        return response
@@ -0,0 +1,89 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+
+A feed of the spots changed since a client last synced, at
+/api/v1/spot/changes?since=<token>.  The response looks like:
+
+{"spots": [<spots changed since the token>], "deleted": [<ids of spots deleted since>], "next": <token>}
+
+The first sync leaves out since, and gets every spot.  After that, clients
+send the next token from their last sync.  Tokens are opaque to clients.
+
+Spots saved in a transaction that was still open at the last sync can have
+a last_modified from before it, so each sync goes back an extra
+SPOTSEEKER_CHANGES_OVERLAP seconds (60 by default).  A few spots can come
+back twice, but none are missed.
+"""
+
+from spotseeker_server.views.rest_dispatch import RESTDispatch
+from spotseeker_server.models import Spot, SpotTombstone
+from spotseeker_server.require_auth import *
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.conf import settings
+from datetime import datetime, timedelta
+import simplejson as json
+import base64
+
+DEFAULT_OVERLAP = 60
+
+TOKEN_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def encode_token(when):
+    return base64.urlsafe_b64encode(when.strftime(TOKEN_FORMAT)).rstrip("=")
+
+
+def decode_token(token):
+    """ Returns the time in a changes token, or raises InvalidToken.
+    """
+    try:
+        token = str(token)
+        return datetime.strptime(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)), TOKEN_FORMAT)
+    except (TypeError, ValueError, UnicodeEncodeError):
+        raise InvalidToken(token)
+
+
+class ChangesView(RESTDispatch):
+    """ Returns the spots changed and deleted since a sync token.
+    """
+    @app_auth_required
+    def GET(self, request):
+        # Taken before the queries, so nothing written during them is skipped next time
+        now = datetime.now()
+
+        spots = Spot.objects.all()
+        # A first sync has nothing to delete
+        deleted = SpotTombstone.objects.none()
+        if "since" in request.GET:
+            try:
+                since = decode_token(request.GET["since"])
+            except InvalidToken:
+                return HttpResponseBadRequest('{"error":"invalid since token"}')
+
+            since -= timedelta(seconds=getattr(settings, 'SPOTSEEKER_CHANGES_OVERLAP', DEFAULT_OVERLAP))
+            spots = spots.filter(last_modified__gte=since)
+            deleted = SpotTombstone.objects.filter(deleted__gte=since)
+
+        deleted_ids = sorted(set(deleted.values_list('spot_id', flat=True)))
+        content = '{{"spots": [{0}], "deleted": {1}, "next": {2}}}'.format(",".join(Spot.bulk_json_fragments(spots)),
+                                                                           json.dumps(deleted_ids),
+                                                                           json.dumps(encode_token(now)))
+        response = HttpResponse(content)
+        response["Content-type"] = "application/json"
+        return response
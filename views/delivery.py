@@ -0,0 +1,153 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+
+Responses that send a file from disk - images, and cached thumbnails.
+
+By default the file is sent by django, with support for single byte ranges
+so an interrupted download can be resumed.  The web server in front of
+django can send it instead, leaving the django process free for other
+requests.  For Apache's mod_xsendfile, or lighttpd, in your settings.py:
+
+SPOTSEEKER_FILE_DELIVERY = "x-sendfile"
+
+For nginx, which needs an internal location for each directory files are
+sent from:
+
+SPOTSEEKER_FILE_DELIVERY = "x-accel-redirect"
+SPOTSEEKER_X_ACCEL_LOCATIONS = {
+    "/var/www/media/": "/protected/media/",
+    "/var/cache/spotseeker/thumbnails/": "/protected/thumbnails/",
+}
+
+A file outside all of those locations is sent by django.
+"""
+
+from django.http import HttpResponse
+from django.conf import settings
+from django.utils.http import urlquote
+import os
+import re
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_response(request, path, content_type, etag=None, handle=None):
+    """ Returns a response that sends the file at path, through the configured
+    delivery backend.  A caller that already has the file open can pass it as
+    handle.  Raises IOError if the file can't be read.
+    """
+    delivery = getattr(settings, 'SPOTSEEKER_FILE_DELIVERY', None)
+    response = None
+    if delivery == "x-sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = path
+    elif delivery == "x-accel-redirect":
+        location = x_accel_location(path)
+        if location is not None:
+            response = HttpResponse(content_type=content_type)
+            response["X-Accel-Redirect"] = location
+
+    if response is not None:
+        if handle is not None:
+            handle.close()
+        return response
+
+    if handle is None:
+        handle = open(path, 'rb')
+    return range_response(request, handle, content_type, etag)
+
+
+def x_accel_location(path):
+    """ Returns the nginx internal location of a file, or None if it isn't in one.
+    """
+    path = os.path.abspath(path)
+    for directory, location in getattr(settings, 'SPOTSEEKER_X_ACCEL_LOCATIONS', {}).items():
+        directory = os.path.join(os.path.abspath(directory), "")
+        if path.startswith(directory):
+            return location.rstrip("/") + "/" + urlquote(path[len(directory):])
+    return None
+
+
+def requested_range(request, size, etag):
+    """ Returns the (first, last) byte of a single range the request asks for,
+    None for the whole file, or False if the range can't be satisfied.
+    """
+    header = request.META.get("HTTP_RANGE")
+    if not header:
+        return None
+
+    # A range of a version of the file the client doesn't have any more is no use to it
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if if_range is not None and (etag is None or if_range.strip('"') != etag):
+        return None
+
+    # Several ranges at once aren't supported - the whole file does for those
+    match = RANGE_PATTERN.match(header.replace(" ", ""))
+    if not match or match.groups() == ("", ""):
+        return None
+
+    first, last = match.groups()
+    if first == "":
+        # The last N bytes
+        if int(last) == 0 or size == 0:
+            return False
+        return max(size - int(last), 0), size - 1
+
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        return False
+    return first, min(int(last), size - 1) if last else size - 1
+
+
+def range_response(request, handle, content_type, etag=None):
+    """ Returns a response sending the open file handle, or the part of it the request's Range header asks for.
+    """
+    size = os.fstat(handle.fileno()).st_size
+    byte_range = requested_range(request, size, etag)
+
+    if byte_range is False:
+        handle.close()
+        response = HttpResponse(content_type=content_type)
+        response.status_code = 416
+        response["Content-Range"] = "bytes */{0}".format(size)
+    elif byte_range is None:
+        response = HttpResponse(file_chunks(handle, 0, size), content_type=content_type)
+        response["Content-Length"] = size
+    else:
+        first, last = byte_range
+        response = HttpResponse(file_chunks(handle, first, last + 1 - first), content_type=content_type)
+        response.status_code = 206
+        response["Content-Range"] = "bytes {0}-{1}/{2}".format(first, last, size)
+        response["Content-Length"] = last + 1 - first
+
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def file_chunks(handle, start, length):
+    try:
+        handle.seek(start)
+        while length > 0:
+            chunk = handle.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        handle.close()
@@ -16,9 +16,12 @@
 from spotseeker_server.views.rest_dispatch import RESTDispatch
 from django.http import HttpResponse
 from django.utils.http import http_date
-from django.core.servers.basehttp import FileWrapper
 from spotseeker_server.require_auth import *
+from spotseeker_server.views.thumbnail import generate_presets
+from spotseeker_server.views.delivery import file_response
+from spotseeker_server.image_storage import prepares_uploads, upload_error
 from spotseeker_server.models import *
+import simplejson as json
 
 
 class ImageView(RESTDispatch):
@@ -31,24 +34,25 @@ class ImageView(RESTDispatch):
     def GET(self, request, spot_id, image_id):
         try:
             img = SpotImage.objects.get(pk=image_id)
-            spot = img.spot
-
-            if int(spot.pk) != int(spot_id):
+            if int(img.spot_id) != int(spot_id):
                 raise Exception("Image Spot ID doesn't match spot id in url")
 
-            response = HttpResponse(FileWrapper(img.image))
-            response["ETag"] = img.etag
+            not_modified = self.not_modified(request, img.etag, img.modification_date)
+            if not_modified:
+                return not_modified
+
+            response = file_response(request, img.image.path, img.content_type, img.etag)
+            self.set_validators(response, img.etag, img.modification_date)
 
             # 7 day timeout?
             response['Expires'] = http_date(time.time() + 60 * 60 * 24 * 7)
-            response["Content-length"] = img.image.size
-            response["Content-type"] = img.content_type
             return response
         except Exception as e:
             response = HttpResponse('{"error":"Bad Image URL"}')
             response.status_code = 404
             return response
 
+    @prepares_uploads
     @user_auth_required
     def PUT(self, request, spot_id, image_id):
         try:
@@ -68,21 +72,36 @@ class ImageView(RESTDispatch):
             return response
 
         # This trick was taken from piston
+        if hasattr(request, '_files'):
+            # Something before the view read it as a PUT, which has no files
+            del request._post, request._files
         request.method = "POST"
         request._load_post_and_files()
         request.method = "PUT"
 
-        if "image" in request.FILES:
+        error = upload_error(request)
+        if error:
+            response = HttpResponse(json.dumps({"error": error.message}))
+            response.status_code = error.status
+            return response
+
+        if "image" in request.FILES or "description" in request.POST:
+            if "description" in request.POST:
+                img.description = request.POST["description"]
+
             try:
-                img.image = request.FILES["image"]
-                img.save()
+                if "image" in request.FILES:
+                    img.image = request.FILES["image"]
+                with write_transaction():
+                    img.save(expected_etag=request.META["If_Match"])
+            except ETagConflict:
+                return self.etag_conflict()
             except Exception:
                 response = HttpResponse('{"error":"Not an accepted image format"}')
                 response.status_code = 400
                 return response
 
-        if "description" in request.POST:
-            img.description = request.POST["description"]
+            generate_presets(img)
 
         return self.GET(request, spot_id, image_id)
 
@@ -104,7 +123,11 @@ class ImageView(RESTDispatch):
             response.status_code = 404
             return response
 
-        img.delete()
+        try:
+            with write_transaction():
+                img.delete(expected_etag=request.META["If_Match"])
+        except ETagConflict:
+            return self.etag_conflict()
 
         response = HttpResponse("")
         response.status_code = 200
@@ -119,6 +142,9 @@ class ImageView(RESTDispatch):
             return response
 
         if request.META["If_Match"] != img.etag:
-            response = HttpResponse('{"error":"Invalid ETag"}')
-            response.status_code = 409
-            return response
+            return self.etag_conflict()
+
+    def etag_conflict(self):
+        response = HttpResponse('{"error":"Invalid ETag"}')
+        response.status_code = 409
+        return response
@@ -0,0 +1,140 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+
+Cursor pagination for lists of spots.  A client asks for a page with
+page_size=N, and if there are more spots the response has a Link header:
+
+Link: <http://.../api/v1/spot/all?page_size=N&cursor=...>; rel="next"
+
+The cursor is opaque to clients.  It holds the sort key of the last spot on
+the page, so the next page starts right after it, however deep into the list
+it is.  Pages are in id order, or for a search around a point, nearest first
+with ties in id order.  A spot that's deleted, or moves, doesn't shift the
+spots after the cursor onto another page.
+
+Id order is read from the database a page at a time.  Distances aren't in the
+database, so each page of a distance order still ranks every spot the search
+matched - only their ids and locations, with just the page's spots loaded.
+A search's distance or bounding box keeps that to the spots nearby.
+
+The page size can be capped in your settings.py with:
+
+SPOTSEEKER_MAX_PAGE_SIZE = 500
+"""
+
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.conf import settings
+from spotseeker_server.models import Spot
+import base64
+import heapq
+import re
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_MAX_PAGE_SIZE = 500
+ORDERS = ["id", "distance"]
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def paging_requested(request):
+    return 'page_size' in request.GET or 'cursor' in request.GET
+
+
+def encode_cursor(order, last_value, last_id):
+    """ Returns a cursor for the page after a spot - last_value is the spot's
+    distance in a distance order, and None in id order.
+    """
+    value = "" if last_value is None else repr(float(last_value))
+    return base64.urlsafe_b64encode("{0}:{1}:{2}".format(order, value, last_id)).rstrip("=")
+
+
+def decode_cursor(cursor):
+    """ Returns the (order, last value, last id) in a cursor, or raises InvalidCursor.
+    """
+    try:
+        cursor = str(cursor)
+        decoded = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        order, value, last_id = decoded.split(":")
+        if order not in ORDERS or (value == "") != (order == "id"):
+            raise ValueError(order)
+        return order, float(value) if value else None, int(last_id)
+    except (TypeError, ValueError, UnicodeEncodeError):
+        raise InvalidCursor(cursor)
+
+
+def page_size(request):
+    size = int(request.GET.get('page_size', DEFAULT_PAGE_SIZE))
+    if size < 1:
+        raise ValueError(size)
+    return min(size, getattr(settings, 'SPOTSEEKER_MAX_PAGE_SIZE', DEFAULT_MAX_PAGE_SIZE))
+
+
+def paged_response(request, query, distances=None):
+    """ Returns the page of spots in query that the request asks for, with a Link
+    to the next page if there is one.  With distances, a function that returns
+    the distance of each of a list of spots, the pages are nearest first.
+    """
+    try:
+        size = page_size(request)
+    except ValueError:
+        return HttpResponseBadRequest('{"error":"page_size must be a positive number"}')
+
+    order = "id" if distances is None else "distance"
+    cursor = None
+    if 'cursor' in request.GET:
+        try:
+            cursor = decode_cursor(request.GET['cursor'])
+        except InvalidCursor:
+            return HttpResponseBadRequest('{"error":"invalid cursor"}')
+        if cursor[0] != order:
+            return HttpResponseBadRequest('{"error":"invalid cursor"}')
+
+    # One extra, to tell if there's a next page
+    if distances is None:
+        query = query.distinct().order_by('pk')
+        if cursor is not None:
+            query = query.filter(pk__gt=cursor[2])
+        keyed = [(None, spot.pk, spot) for spot in query[:size + 1]]
+    else:
+        # Distances aren't in the database, so every match is ranked for each page, from
+        # just its location, and only the page's spots are loaded
+        located = list(query.distinct().only('id', 'latitude', 'longitude'))
+        ranked = zip(distances(located), [spot.pk for spot in located])
+        if cursor is not None:
+            ranked = [entry for entry in ranked if entry > cursor[1:]]
+        ranked = heapq.nsmallest(size + 1, ranked)
+        spots = Spot.objects.in_bulk([pk for value, pk in ranked])
+        keyed = [(value, pk, spots[pk]) for value, pk in ranked if pk in spots]
+
+    has_next = len(keyed) > size
+    keyed = keyed[:size]
+
+    response = HttpResponse("[{0}]".format(",".join(Spot.bulk_json_fragments([spot for value, pk, spot in keyed]))))
+    if has_next:
+        last_value, last_id, last_spot = keyed[-1]
+        response['Link'] = '<{0}>; rel="next"'.format(next_page_url(request, encode_cursor(order, last_value, last_id)))
+    return response
+
+
+def next_page_url(request, cursor):
+    params = request.GET.copy()
+    for key in params.keys():
+        # The signature is for this request, the client signs its own for the next
+        if re.search('^oauth_', key):
+            del params[key]
+    params['cursor'] = cursor
+    return request.build_absolute_uri("{0}?{1}".format(request.path, params.urlencode()))
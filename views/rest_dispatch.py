@@ -13,7 +13,9 @@
     limitations under the License.
 """
 
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
+import time
 
 
 class RESTDispatch:
@@ -36,6 +38,11 @@ class RESTDispatch:
                 return self.PUT(*args, **named_args)
             else:
                 return self.invalid_method(*args, **named_args)
+        elif "PATCH" == request.META['REQUEST_METHOD']:
+            if hasattr(self, "PATCH"):
+                return self.PATCH(*args, **named_args)
+            else:
+                return self.invalid_method(*args, **named_args)
         elif "DELETE" == request.META['REQUEST_METHOD']:
             if hasattr(self, "DELETE"):
                 return self.DELETE(*args, **named_args)
@@ -49,3 +56,30 @@ class RESTDispatch:
         response = HttpResponse("Method not allowed")
         response.status_code = 405
         return response
+
+    def not_modified(self, request, etag, last_modified):
+        """ Returns a 304 response if the client's copy, from If-None-Match or
+        If-Modified-Since, is still current.  Otherwise None.
+        """
+        if "HTTP_IF_NONE_MATCH" in request.META:
+            client_etags = [value.strip() for value in request.META["HTTP_IF_NONE_MATCH"].split(",")]
+            # Weak and quoted ETags match too
+            client_etags = [value[2:] if value.startswith("W/") else value for value in client_etags]
+            client_etags = [value.strip('"') for value in client_etags]
+            if etag not in client_etags and "*" not in client_etags:
+                return None
+        elif "HTTP_IF_MODIFIED_SINCE" in request.META:
+            since = parse_http_date_safe(request.META["HTTP_IF_MODIFIED_SINCE"])
+            if since is None or int(time.mktime(last_modified.timetuple())) > since:
+                return None
+        else:
+            return None
+
+        response = HttpResponseNotModified()
+        self.set_validators(response, etag, last_modified)
+        return response
+
+    def set_validators(self, response, etag, last_modified):
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(time.mktime(last_modified.timetuple()))
+
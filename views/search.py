@@ -16,18 +16,34 @@
 from spotseeker_server.views.rest_dispatch import RESTDispatch
 from spotseeker_server.forms.spot_search import SpotSearchForm
 from spotseeker_server.views.spot import SpotView
+from spotseeker_server.views.pagination import paged_response, paging_requested
+from spotseeker_server.views.streaming import StreamingJSONResponse, spot_json_chunks, streaming_enabled
 from django.http import HttpResponse, HttpResponseBadRequest
 from django.db.models import Q
 from spotseeker_server.require_auth import *
-from spotseeker_server.models import Spot, SpotType
+from spotseeker_server.models import Spot, SpotType, SpotExtendedInfo, DAY_OFFSETS, SECONDS_PER_DAY, SECONDS_PER_WEEK, seconds_into_day
+from spotseeker_server import geohash
+from spotseeker_server import models
+from django.conf import settings
+from django.utils.encoding import smart_str
 from pyproj import Geod
 from decimal import *
 import simplejson as json
 import re
 from time import *
 from datetime import datetime
+import hashlib
+import heapq
 import sys
 
+GEOD = Geod(ellps='clrk66')
+
+# Search results are cached for SPOTSEEKER_SEARCH_CACHE_TIMEOUT seconds, or not at all if that's 0
+DEFAULT_SEARCH_CACHE_TIMEOUT = 60 * 5
+
+# Search centers are rounded to a grid this many degrees apart - about 11m
+DEFAULT_SEARCH_CACHE_GRID = 0.0001
+
 
 class SearchView(RESTDispatch):
     """ Handles searching for Spots with particular attributes based on a query string.
@@ -47,8 +63,20 @@ class SearchView(RESTDispatch):
         if len(request.GET) == 0:
             return HttpResponse('[]')
 
+        self.snap_coordinates(request)
+        cache_key = self.search_cache_key(request)
+        if cache_key:
+            cached_response = models.cache.get(cache_key)
+            if cached_response is not None:
+                return HttpResponse(cached_response)
+
         query = Spot.objects.all()
 
+        # extended_info filters are answered from the SpotExtendedInfo index,
+        # and applied as a single id lookup once all the filters are in
+        spot_ids = None
+        excluded_ids = set()
+
         day_dict = {"Sunday": "su",
                     "Monday": "m",
                     "Tuesday": "t",
@@ -70,6 +98,8 @@ class SearchView(RESTDispatch):
                 pass
             elif key == "limit":
                 pass
+            elif key == "page_size" or key == "cursor":
+                pass
             elif key == "open_now":
                 if request.GET["open_now"]:
 
@@ -77,7 +107,12 @@ class SearchView(RESTDispatch):
                     day_num = int(strftime("%w", localtime()))
                     today = day_lookup[day_num]
                     now = datetime.time(datetime.now())
-                    query = query.filter(spotavailablehours__day__iexact=today, spotavailablehours__start_time__lt=now, spotavailablehours__end_time__gt=now)
+                    now_seconds = DAY_OFFSETS[today] * SECONDS_PER_DAY + seconds_into_day(now)
+                    # Open strictly before now - a fraction of a second past the start counts
+                    if now.microsecond:
+                        query = query.filter(spotopeninterval__start__lte=now_seconds, spotopeninterval__end__gt=now_seconds)
+                    else:
+                        query = query.filter(spotopeninterval__start__lt=now_seconds, spotopeninterval__end__gt=now_seconds)
                     has_valid_search_param = True
             elif key == "open_until":
                 if request.GET["open_until"] and request.GET["open_at"]:
@@ -86,19 +121,13 @@ class SearchView(RESTDispatch):
                     until_day = day_dict[until_day]
                     at_day = day_dict[at_day]
 
-                    if until_day == at_day:
-                        query = query.filter(spotavailablehours__day__iexact=until_day, spotavailablehours__start_time__lte=at_time, spotavailablehours__end_time__gte=until_time)
-                    else:
-                        days_to_test = self.get_days_in_range(at_day, until_day)
-                        last_day = days_to_test.pop()
-                        days_to_test.reverse()
-                        first_day = days_to_test.pop()
-
-                        query = query.filter(spotavailablehours__day__iexact=first_day, spotavailablehours__start_time__lte=at_time, spotavailablehours__end_time__gte="23:59")
-                        query = query.filter(spotavailablehours__day__iexact=last_day, spotavailablehours__start_time__lte="00:00", spotavailablehours__end_time__gte=until_time)
+                    at_seconds = DAY_OFFSETS[at_day] * SECONDS_PER_DAY + seconds_into_day(at_time)
+                    until_seconds = DAY_OFFSETS[until_day] * SECONDS_PER_DAY + seconds_into_day(until_time)
+                    if DAY_OFFSETS[until_day] < DAY_OFFSETS[at_day]:
+                        # Runs into next week, e.g. Friday until Monday
+                        until_seconds += SECONDS_PER_WEEK
 
-                        for day in days_to_test:
-                            query = query.filter(spotavailablehours__day__iexact=day, spotavailablehours__start_time__lte="00:00", spotavailablehours__end_time__gte="23:59")
+                    query = query.filter(spotopeninterval__start__lte=at_seconds, spotopeninterval__end__gte=until_seconds)
                     has_valid_search_param = True
             elif key == "open_at":
                 if request.GET["open_at"]:
@@ -107,10 +136,12 @@ class SearchView(RESTDispatch):
                     except:
                         day, time = request.GET['open_at'].split(',')
                         day = day_dict[day]
-                        query = query.filter(spotavailablehours__day__iexact=day, spotavailablehours__start_time__lte=time, spotavailablehours__end_time__gt=time)
+                        at_seconds = DAY_OFFSETS[day] * SECONDS_PER_DAY + seconds_into_day(time)
+                        query = query.filter(spotopeninterval__start__lte=at_seconds, spotopeninterval__end__gt=at_seconds)
                         has_valid_search_param = True
             elif key == "extended_info:reservable":
-                query = query.filter(spotextendedinfo__key="reservable", spotextendedinfo__value__in=['true', 'reservations'])
+                matching_ids = SpotExtendedInfo.spot_ids("reservable", ['true', 'reservations'])
+                spot_ids = matching_ids if spot_ids is None else spot_ids & matching_ids
             elif key == "extended_info:noise_level":
                 noise_levels = request.GET.getlist("extended_info:noise_level")
 
@@ -130,16 +161,19 @@ class SearchView(RESTDispatch):
                         exclude_moderate = False
                         exclude_variable = False
 
+                excluded_levels = []
                 if exclude_silent:
-                    query = query.exclude(spotextendedinfo__key="noise_level", spotextendedinfo__value__iexact="silent")
+                    excluded_levels.append("silent")
                 if exclude_quiet:
-                    query = query.exclude(spotextendedinfo__key="noise_level", spotextendedinfo__value__iexact="quiet")
+                    excluded_levels.append("quiet")
                 if exclude_moderate:
-                    query = query.exclude(spotextendedinfo__key="noise_level", spotextendedinfo__value__iexact="moderate")
+                    excluded_levels.append("moderate")
                 if exclude_loud:
-                    query = query.exclude(spotextendedinfo__key="noise_level", spotextendedinfo__value__iexact="loud")
+                    excluded_levels.append("loud")
                 if exclude_variable:
-                    query = query.exclude(spotextendedinfo__key="noise_level", spotextendedinfo__value__iexact="variable")
+                    excluded_levels.append("variable")
+
+                excluded_ids |= SpotExtendedInfo.spot_ids("noise_level", excluded_levels, ignore_case=True)
 
             elif key == "capacity":
                 try:
@@ -171,11 +205,8 @@ class SearchView(RESTDispatch):
                 query = query.filter(q_obj).distinct()
                 has_valid_search_param = True
             elif re.search('^extended_info:', key):
-                kwargs = {
-                    'spotextendedinfo__key': key[14:],
-                    'spotextendedinfo__value__in': request.GET.getlist(key)
-                }
-                query = query.filter(**kwargs)
+                matching_ids = SpotExtendedInfo.spot_ids(key[14:], request.GET.getlist(key))
+                spot_ids = matching_ids if spot_ids is None else spot_ids & matching_ids
                 has_valid_search_param = True
             elif key == "id":
                 query = query.filter(id__in=request.GET.getlist(key))
@@ -191,6 +222,11 @@ class SearchView(RESTDispatch):
                     if not request.META['SERVER_NAME'] == 'testserver':
                         print >> sys.stderr, "E: ", e
 
+        if spot_ids is not None:
+            query = query.filter(id__in=spot_ids - excluded_ids)
+        elif excluded_ids:
+            query = query.exclude(id__in=excluded_ids)
+
         limit = 20
         if 'limit' in request.GET:
             if request.GET['limit'] == '0':
@@ -200,20 +236,25 @@ class SearchView(RESTDispatch):
 
         if 'distance' in request.GET and 'center_longitude' in request.GET and 'center_latitude' in request.GET:
             try:
-                g = Geod(ellps='clrk66')
-                top = g.fwd(request.GET['center_longitude'], request.GET['center_latitude'], 0, request.GET['distance'])
-                right = g.fwd(request.GET['center_longitude'], request.GET['center_latitude'], 90, request.GET['distance'])
-                bottom = g.fwd(request.GET['center_longitude'], request.GET['center_latitude'], 180, request.GET['distance'])
-                left = g.fwd(request.GET['center_longitude'], request.GET['center_latitude'], 270, request.GET['distance'])
+                top = GEOD.fwd(request.GET['center_longitude'], request.GET['center_latitude'], 0, request.GET['distance'])
+                right = GEOD.fwd(request.GET['center_longitude'], request.GET['center_latitude'], 90, request.GET['distance'])
+                bottom = GEOD.fwd(request.GET['center_longitude'], request.GET['center_latitude'], 180, request.GET['distance'])
+                left = GEOD.fwd(request.GET['center_longitude'], request.GET['center_latitude'], 270, request.GET['distance'])
 
                 top_limit = "%.8f" % top[1]
                 bottom_limit = "%.8f" % bottom[1]
                 left_limit = "%.8f" % left[0]
                 right_limit = "%.8f" % right[0]
 
-                distance_query = query.filter(longitude__gte=left_limit)
-
-                distance_query = distance_query.filter(longitude__lte=right_limit)
+                # The geohash prefixes narrow things down to a few index range scans,
+                # the lat/long limits below trim the cells to the actual bounding box
+                distance_query = query.filter(self.geohash_filter(bottom[1], left[0], top[1], right[0]))
+                if left[0] <= right[0]:
+                    distance_query = distance_query.filter(longitude__gte=left_limit)
+                    distance_query = distance_query.filter(longitude__lte=right_limit)
+                else:
+                    # The box crosses the antimeridian, so it's everything east of its left edge and west of its right
+                    distance_query = distance_query.filter(Q(longitude__gte=left_limit) | Q(longitude__lte=right_limit))
                 distance_query = distance_query.filter(latitude__gte=bottom_limit)
                 distance_query = distance_query.filter(latitude__lte=top_limit)
                 has_valid_search_param = True
@@ -235,28 +276,118 @@ class SearchView(RESTDispatch):
         if not has_valid_search_param:
             return HttpResponse('[]')
 
+        if paging_requested(request):
+            try:
+                center = float(request.GET['center_longitude']), float(request.GET['center_latitude'])
+            except (KeyError, ValueError):
+                return paged_response(request, query)
+            # Nearest first, like limited results
+            return paged_response(request, query, lambda spots: self.distances(spots, *center))
+
         if limit > 0 and limit < len(query):
-            sorted_list = list(query)
             try:
-                sorted_list.sort(lambda x, y: cmp(self.distance(x, request.GET['center_longitude'], request.GET['center_latitude']), self.distance(y, request.GET['center_longitude'], request.GET['center_latitude'])))
-                query = sorted_list[:limit]
+                query = self.nearest_spots(query, request.GET['center_longitude'], request.GET['center_latitude'], limit)
             except KeyError:
                 response = HttpResponse('{"error":"missing required parameters for this type of search"}')
                 response.status_code = 400
                 return response
 
-        response = []
+        if limit == 0 and streaming_enabled():
+            # Unlimited results aren't cached, they could be most of the spots
+            return StreamingJSONResponse(spot_json_chunks(query))
+
+        content = "[{0}]".format(",".join(Spot.bulk_json_fragments(set(query))))
+        if cache_key:
+            models.cache.set(cache_key, content, self.search_cache_timeout(request))
 
-        for spot in set(query):
-            response.append(spot.json_data_structure())
+        return HttpResponse(content)
 
-        return HttpResponse(json.dumps(response))
+    def snap_coordinates(self, request):
+        """ Rounds the search center onto the SPOTSEEKER_SEARCH_CACHE_GRID, so
+        nearby searches share a cache entry and get the same results.  Searches
+        whose results aren't cached keep their exact center.
+        """
+        grid = getattr(settings, 'SPOTSEEKER_SEARCH_CACHE_GRID', DEFAULT_SEARCH_CACHE_GRID)
+        if not grid or not self.search_cache_timeout(request) or paging_requested(request):
+            return
+
+        params = request.GET.copy()
+        for key in ["center_latitude", "center_longitude"]:
+            if key in params:
+                try:
+                    params[key] = "%.8f" % (round(float(params[key]) / grid) * grid)
+                except ValueError:
+                    # Left as is, and rejected by the search itself
+                    pass
+        request.GET = params
+
+    def search_cache_key(self, request):
+        """ Returns the cache key for a search, or None if search results aren't cached.
+        The key is built from the sorted query parameters, without the oauth ones, and
+        the current spot data version.
+        """
+        if not self.search_cache_timeout(request):
+            return None
+
+        if paging_requested(request):
+            # Pages are cheap to fetch, and their Link header isn't cached
+            return None
+
+        params = []
+        for key in sorted(request.GET.keys()):
+            if not re.search('^oauth_', key):
+                params.append((key, sorted(request.GET.getlist(key))))
+
+        if request.GET.get("open_now"):
+            # Lets entries from servers with slightly different clocks go stale together
+            params.append(("open_now_minute", strftime("%Y%m%d%H%M", localtime())))
+
+        digest = hashlib.sha1(smart_str(repr(params))).hexdigest()
+        return "spot_search:{0}:{1}".format(models.data_version(), digest)
+
+    def search_cache_timeout(self, request):
+        timeout = getattr(settings, 'SPOTSEEKER_SEARCH_CACHE_TIMEOUT', DEFAULT_SEARCH_CACHE_TIMEOUT)
+        if timeout and request.GET.get("open_now"):
+            # open_now results are only good until the next minute
+            timeout = min(timeout, 60 - localtime().tm_sec)
+        return timeout
 
     def distance(self, spot, longitude, latitude):
-        g = Geod(ellps='clrk66')
-        az12, az21, dist = g.inv(spot.longitude, spot.latitude, longitude, latitude)
+        az12, az21, dist = GEOD.inv(spot.longitude, spot.latitude, longitude, latitude)
         return dist
 
+    def distances(self, spots, longitude, latitude):
+        """ Returns the distance from each spot to the given point, computed in a
+        single batched call.  Spots without a location are infinitely far away.
+        """
+        distances = [float('inf')] * len(spots)
+        located = [i for i, spot in enumerate(spots) if spot.longitude is not None and spot.latitude is not None]
+        if not located:
+            return distances
+
+        count = len(located)
+        az12, az21, dist = GEOD.inv([float(spots[i].longitude) for i in located],
+                                    [float(spots[i].latitude) for i in located],
+                                    [float(longitude)] * count,
+                                    [float(latitude)] * count)
+        for i, d in zip(located, dist):
+            distances[i] = d
+        return distances
+
+    def nearest_spots(self, spots, longitude, latitude, limit):
+        """ Returns the limit spots closest to the given point, nearest first.
+        """
+        spots = list(spots)
+        distances = self.distances(spots, longitude, latitude)
+        nearest = heapq.nsmallest(limit, range(len(spots)), key=distances.__getitem__)
+        return [spots[i] for i in nearest]
+
+    def geohash_filter(self, south, west, north, east):
+        q_obj = Q()
+        for prefix in geohash.covering_prefixes(south, west, north, east):
+            q_obj |= Q(geohash__gte=prefix, geohash__lt=prefix + geohash.PREFIX_END)
+        return q_obj
+
     def get_days_in_range(self, start_day, until_day):
         day_lookup = ["su", "m", "t", "w", "th", "f", "sa", "su", "m", "t", "w", "th", "f", "sa"]
         matched_days = []
@@ -18,8 +18,72 @@ from spotseeker_server.forms.spot import SpotForm
 from spotseeker_server.models import *
 from django.http import HttpResponse
 from spotseeker_server.require_auth import *
+from django.core.exceptions import ValidationError
 import simplejson as json
-from django.db import transaction
+
+# Rows per INSERT, to stay under SQLite's limit on query parameters
+BULK_INSERT_SIZE = 100
+
+
+def bulk_insert(model, rows):
+    for start in range(0, len(rows), BULK_INSERT_SIZE):
+        model.objects.bulk_create(rows[start:start + BULK_INSERT_SIZE])
+
+
+def merge_patch(document, patch):
+    """ Returns document with a JSON merge patch (RFC 7386) applied.  Objects in the
+    patch are merged into the document, nulls remove keys, and anything else replaces
+    what was there.  The document itself isn't changed.
+    """
+    if not isinstance(patch, dict):
+        return patch
+    if isinstance(document, dict):
+        merged = dict(document)
+    else:
+        merged = {}
+    for key, value in patch.items():
+        if value is None:
+            merged.pop(key, None)
+        else:
+            merged[key] = merge_patch(merged.get(key), value)
+    return merged
+
+
+class SpotInputError(Exception):
+    """ Raised for a spot document with values that can't be saved.
+    """
+    def __init__(self, errors):
+        super(SpotInputError, self).__init__(errors)
+        self.errors = errors
+
+
+class SpotChanges(object):
+    """ The writes that bring a spot in line with a spot document, from SpotView.changes_from_input.
+    """
+    def __init__(self, spot):
+        self.spot = spot
+        self.fields_changed = False
+        self.types_to_add = []
+        self.types_to_remove = []
+        self.info_to_add = []
+        self.info_to_update = []
+        self.info_to_delete = []
+        self.hours_to_add = []
+        self.hours_to_delete = []
+        self.expected_etag = None
+
+    def fields_only(self):
+        return not (self.types_to_add or self.types_to_remove or self.info_to_add or self.info_to_update or
+                    self.info_to_delete or self.hours_to_add or self.hours_to_delete)
+
+    def has_changes(self):
+        return bool(self.spot.pk is None or self.fields_changed or self.types_to_add or self.types_to_remove or
+                    self.info_to_add or self.info_to_update or self.info_to_delete or self.hours_to_add or self.hours_to_delete)
+
+    def attach_rows(self):
+        # New rows made before the spot was saved don't have its id yet
+        for row in self.info_to_add + self.hours_to_add:
+            row.spot = self.spot
 
 
 class SpotView(RESTDispatch):
@@ -27,14 +91,19 @@ class SpotView(RESTDispatch):
     GET returns 200 with Spot details.
     POST to /api/v1/spot with valid JSON returns 200 and creates a new Spot.
     PUT returns 200 and updates the Spot information.
+    PATCH with a JSON merge patch returns 200 and updates just the Spot information in the patch.
     DELETE returns 200 and deletes the Spot.
     """
     @app_auth_required
     def GET(self, request, spot_id):
         try:
             spot = Spot.objects.get(pk=spot_id)
-            response = HttpResponse(json.dumps(spot.json_data_structure()))
-            response["ETag"] = spot.etag
+            not_modified = self.not_modified(request, spot.etag, spot.last_modified)
+            if not_modified:
+                return not_modified
+
+            response = HttpResponse(spot.json_fragment())
+            self.set_validators(response, spot.etag, spot.last_modified)
             response["Content-type"] = "application/json"
             return response
         except:
@@ -44,7 +113,7 @@ class SpotView(RESTDispatch):
 
     @user_auth_required
     def POST(self, request):
-        spot = Spot.objects.create()
+        spot = Spot()
 
         error_response = self.build_and_save_from_input(request, spot)
         if error_response:
@@ -68,12 +137,56 @@ class SpotView(RESTDispatch):
         if error_response:
             return error_response
 
-        error_response = self.build_and_save_from_input(request, spot)
+        try:
+            error_response = self.build_and_save_from_input(request, spot, expected_etag=request.META["HTTP_IF_MATCH"])
+        except ETagConflict:
+            return self.etag_conflict()
         if error_response:
             return error_response
 
         return self.GET(request, spot_id)
 
+    @user_auth_required
+    def PATCH(self, request, spot_id):
+        try:
+            spot = Spot.objects.get(pk=spot_id)
+        except Exception as e:
+            response = HttpResponse('{"error":"Spot not found"}')
+            response.status_code = 404
+            return response
+
+        error_response = self.validate_etag(request, spot)
+        if error_response:
+            return error_response
+
+        try:
+            patch = json.loads(request.read())
+        except Exception as e:
+            patch = None
+        if not isinstance(patch, dict):
+            response = HttpResponse('{"error":"Unable to parse JSON"}')
+            response.status_code = 400
+            return response
+
+        spot_json = spot.json_data_structure()
+        new_values = merge_patch(spot_json, patch)
+        form = SpotForm(new_values)
+        if not form.is_valid():
+            response = HttpResponse(json.dumps(form.errors))
+            response.status_code = 400
+            return response
+
+        try:
+            self.save_patch(spot, spot_json, new_values, patch.keys(), request.META["HTTP_IF_MATCH"])
+        except SpotInputError as e:
+            response = HttpResponse('{"error":"' + str(e.errors) + '"}')
+            response.status_code = 400
+            return response
+        except ETagConflict:
+            return self.etag_conflict()
+
+        return self.GET(request, spot_id)
+
     @user_auth_required
     def DELETE(self, request, spot_id):
         try:
@@ -87,7 +200,12 @@ class SpotView(RESTDispatch):
         if error_response:
             return error_response
 
-        spot.delete()
+        try:
+            with write_transaction():
+                spot.delete(expected_etag=request.META["HTTP_IF_MATCH"])
+        except ETagConflict:
+            return self.etag_conflict()
+
         response = HttpResponse()
         response.status_code = 200
         return response
@@ -103,12 +221,19 @@ class SpotView(RESTDispatch):
                 request.META["HTTP_IF_MATCH"] = request.META["If_Match"]
 
         if request.META["HTTP_IF_MATCH"] != spot.etag:
-            response = HttpResponse('{"error":"Invalid ETag"}')
-            response.status_code = 409
-            return response
+            return self.etag_conflict()
 
-    @transaction.commit_on_success
-    def build_and_save_from_input(self, request, spot):
+    def etag_conflict(self):
+        response = HttpResponse('{"error":"Invalid ETag"}')
+        response.status_code = 409
+        return response
+
+    @write_transaction()
+    def build_and_save_from_input(self, request, spot, expected_etag=None):
+        """ Updates the spot from the JSON document in the request.  With expected_etag,
+        the spot is only saved if it still has that ETag when it's written, otherwise
+        ETagConflict is raised and nothing is saved.
+        """
         body = request.read()
         try:
             new_values = json.loads(body)
@@ -119,140 +244,270 @@ class SpotView(RESTDispatch):
 
         form = SpotForm(new_values)
         if not form.is_valid():
-            if request.method == 'POST':
-                spot.delete()
             response = HttpResponse(json.dumps(form.errors))
             response.status_code = 400
             return response
 
-        existing_info = spot.json_data_structure()
-        for key in spot.json_data_structure():
-            if spot.json_data_structure().get(key) is None or spot.json_data_structure().get(key) == {} or spot.json_data_structure().get(key) == '' or spot.json_data_structure().get(key) == [] or key == 'last_modified' or key == 'eTag':
-                del existing_info[key]
-        if existing_info != new_values:
-            errors = []
-            #Validate the data POST and record errors and don't make the spot
-            if "name" in new_values:
-                if new_values["name"]:
-                    spot.name = new_values["name"]
-                else:
-                    errors.append("Invalid name")
+        try:
+            changes = self.changes_from_input(spot, new_values)
+        except SpotInputError as e:
+            response = HttpResponse('{"error":"' + str(e.errors) + '"}')
+            response.status_code = 400
+            return response
+
+        changes.expected_etag = expected_etag
+        self.save_changes([changes])
+
+    @write_transaction()
+    def save_patch(self, spot, spot_json, new_values, parts, expected_etag):
+        """ Saves a patch of the spot whose json_data_structure was spot_json.  If only the
+        spot's own fields changed, the json is updated in place and cached once the patch
+        is committed, for the version this save wrote.
+        """
+        changes = self.changes_from_input(spot, new_values, parts)
+        changes.expected_etag = expected_etag
+        self.save_changes([changes])
+        if changes.has_changes() and changes.fields_only():
+            # The types, extended info and hours in the cached json are still right
+            spot_json.update(spot.json_fields())
+            after_commit(spot.update_cached_json, spot_json)
+
+    def changes_from_input(self, spot, new_values, parts=None):
+        """ Applies the values in a spot document to the spot's fields, and returns the
+        SpotChanges that bring its types, extended info and hours in line with it.
+        Nothing is written.  Raises SpotInputError for values that can't be saved.
+
+        With parts, the keys of a patch, only the types, extended info and hours
+        named in it are compared.
+        """
+        errors = []
+        original_fields = self.field_values(spot)
+
+        #Validate the data POST and record errors and don't make the spot
+        if "name" in new_values:
+            if new_values["name"]:
+                spot.name = new_values["name"]
             else:
-                error.append("Name not provided")
-
-            if "capacity" in new_values:
-                if new_values["capacity"]:
-                    try:
-                        spot.capacity = int(new_values["capacity"])
-                    except:
-                        pass
-            elif spot.capacity is not None:
-                spot.capacity = None
-
-            if "type" in new_values:
-                for value in new_values["type"]:
-                    try:
-                        value = SpotType.objects.get(name=value)
-                        spot.spottypes.add(value)
-                    except:
-                        pass
-            elif spot.spottypes is not None:
-                spot.spottypes.remove()
-
-            if "location" in new_values:
-                loc_vals = new_values["location"]
-                if "latitude" in loc_vals and "longitude" in loc_vals:
-                    try:
-                        spot.latitude = float(loc_vals["latitude"])
-                        spot.longitude = float(loc_vals["longitude"])
-
-                        # The 2 up there are just to throw the exception below.  They need to not actually be floats
-                        spot.latitude = loc_vals["latitude"]
-                        spot.longitude = loc_vals["longitude"]
-                    except:
-                        pass
-                        errors.append("Invalid latitude and longitude: %s, %s" % (loc_vals["latitude"], loc_vals["longitude"]))
-                else:
-                    errors.append("Latitude and longitude not provided")
-
-                if "height_from_sea_level" in loc_vals:
-                    try:
-                        spot.height_from_sea_level = float(loc_vals["height_from_sea_level"])
-                    except:
-                        pass
-                elif spot.height_from_sea_level is not None:
-                    spot.height_from_sea_level = None
-
-                if "building_name" in loc_vals:
-                    spot.building_name = loc_vals["building_name"]
-                elif spot.building_name != '':
-                    spot.building_name = ''
-                if "floor" in loc_vals:
-                    spot.floor = loc_vals["floor"]
-                elif spot.floor != '':
-                    spot.floor = ''
-                if "room_number" in loc_vals:
-                    spot.room_number = loc_vals["room_number"]
-                elif spot.room_number != '':
-                    spot.room_number = ''
-                if "description" in loc_vals:
-                    spot.description = loc_vals["description"]
-                # TO DO: see if there is a better way of doing the following check
-                else:
-                    try:
-                        if spot.description is not None:
-                            spot.description = None
-                    except:
-                        pass
+                errors.append("Invalid name")
+        else:
+            errors.append("Name not provided")
+
+        if "capacity" in new_values:
+            if new_values["capacity"]:
+                try:
+                    spot.capacity = int(new_values["capacity"])
+                except:
+                    pass
+        elif spot.capacity is not None:
+            spot.capacity = None
+
+        if "location" in new_values:
+            loc_vals = new_values["location"]
+            if "latitude" in loc_vals and "longitude" in loc_vals:
+                try:
+                    spot.latitude = float(loc_vals["latitude"])
+                    spot.longitude = float(loc_vals["longitude"])
+
+                    # The 2 up there are just to throw the exception below.  They need to not actually be floats
+                    spot.latitude = loc_vals["latitude"]
+                    spot.longitude = loc_vals["longitude"]
+                except:
+                    pass
+                    errors.append("Invalid latitude and longitude: %s, %s" % (loc_vals["latitude"], loc_vals["longitude"]))
             else:
-                errors.append("Location data not provided")
-
-            if "organization" in new_values:
-                spot.organization = new_values["organization"]
-            elif spot.organization != '':
-                spot.organization = ''
-            if "manager" in new_values:
-                spot.manager = new_values["manager"]
-            elif spot.manager != '':
-                spot.manager = ''
-
-            if len(errors) == 0:
-                spot.save()
+                errors.append("Latitude and longitude not provided")
+
+            if "height_from_sea_level" in loc_vals:
+                try:
+                    spot.height_from_sea_level = float(loc_vals["height_from_sea_level"])
+                except:
+                    pass
+            elif spot.height_from_sea_level is not None:
+                spot.height_from_sea_level = None
+
+            if "building_name" in loc_vals:
+                spot.building_name = loc_vals["building_name"]
+            elif spot.building_name != '':
+                spot.building_name = ''
+            if "floor" in loc_vals:
+                spot.floor = loc_vals["floor"]
+            elif spot.floor != '':
+                spot.floor = ''
+            if "room_number" in loc_vals:
+                spot.room_number = loc_vals["room_number"]
+            elif spot.room_number != '':
+                spot.room_number = ''
+        else:
+            errors.append("Location data not provided")
+
+        if "organization" in new_values:
+            spot.organization = new_values["organization"]
+        elif spot.organization != '':
+            spot.organization = ''
+        if "manager" in new_values:
+            spot.manager = new_values["manager"]
+        elif spot.manager != '':
+            spot.manager = ''
+
+        if len(errors) == 0:
+            changes = SpotChanges(spot)
+            changes.fields_changed = self.field_values(spot) != original_fields
+            try:
+                if parts is None or "type" in parts:
+                    changes.types_to_add, changes.types_to_remove = self.spot_type_changes(spot, new_values.get("type", []))
+                if parts is None or "extended_info" in parts:
+                    changes.info_to_add, changes.info_to_update, changes.info_to_delete = self.extended_info_changes(spot, new_values.get("extended_info", {}))
+                if parts is None or "available_hours" in parts:
+                    changes.hours_to_add, changes.hours_to_delete = self.available_hours_changes(spot, new_values.get("available_hours", {}))
+            except ValidationError as e:
+                errors.append(e.messages)
+
+        if len(errors) != 0:
+            raise SpotInputError(errors)
+        return changes
+
+    def save_changes(self, changes_list):
+        """ Writes the SpotChanges for one or more spots.  Only the rows that differ
+        are written, with the inserts and deletes for all the spots done together,
+        and then each spot is saved once, for a new ETag and to clear its cached json.
+        Spots with an expected_etag are saved with it, and can raise ETagConflict.
+        """
+        changes_list = [changes for changes in changes_list if changes.has_changes()]
+
+        new_spots = set()
+        for changes in changes_list:
+            if changes.spot.pk is None:
+                changes.spot.save()
+                changes.attach_rows()
+                new_spots.add(changes.spot)
+
+        through = Spot.spottypes.through
+        type_rows = []
+        info_to_add = []
+        info_to_update = []
+        info_to_delete = []
+        hours_to_add = []
+        hours_to_delete = []
+        for changes in changes_list:
+            if changes.types_to_remove:
+                through.objects.filter(spot=changes.spot, spottype__in=changes.types_to_remove).delete()
+            type_rows.extend([through(spot_id=changes.spot.pk, spottype_id=spot_type.pk) for spot_type in changes.types_to_add])
+            info_to_add.extend(changes.info_to_add)
+            info_to_update.extend(changes.info_to_update)
+            info_to_delete.extend(changes.info_to_delete)
+            hours_to_add.extend(changes.hours_to_add)
+            hours_to_delete.extend(changes.hours_to_delete)
+
+        bulk_insert(through, type_rows)
+
+        if info_to_delete:
+            SpotExtendedInfo.objects.filter(pk__in=[info.pk for info in info_to_delete]).delete()
+        for info in info_to_update:
+            SpotExtendedInfo.objects.filter(pk=info.pk).update(value=info.value)
+        bulk_insert(SpotExtendedInfo, info_to_add)
+        SpotExtendedInfo.invalidate_index(*set([info.key for info in info_to_add + info_to_update + info_to_delete]))
+
+        if hours_to_delete:
+            SpotAvailableHours.objects.filter(pk__in=[hours.pk for hours in hours_to_delete]).delete()
+        bulk_insert(SpotAvailableHours, hours_to_add)
+
+        for changes in changes_list:
+            if changes.hours_to_add or changes.hours_to_delete:
+                changes.spot.rebuild_open_intervals()
+            if changes.spot not in new_spots:
+                changes.spot.save(expected_etag=changes.expected_etag)
+            elif materialized_documents():
+                # Its document was stored before it had any of these rows
+                changes.spot.save_document()
+
+    # The Spot fields a PUT or POST can change
+    EDITABLE_FIELDS = ["name", "capacity", "latitude", "longitude", "height_from_sea_level", "building_name",
+                       "floor", "room_number", "organization", "manager"]
+
+    def field_values(self, spot):
+        return [Spot._meta.get_field(name).to_python(getattr(spot, name)) for name in self.EDITABLE_FIELDS]
+
+    def spot_type_changes(self, spot, type_names):
+        """ Returns the SpotTypes to add to and remove from the spot, to leave it with
+        the given types.  Unknown type names are skipped.
+        """
+        if isinstance(type_names, basestring):
+            type_names = [type_names]
+        current = set(spot.spottypes.all()) if spot.pk else set()
+        wanted = set(SpotType.objects.filter(name__in=type_names))
+        return list(wanted - current), list(current - wanted)
+
+    def extended_info_changes(self, spot, extended_info):
+        """ Returns the SpotExtendedInfo to add, to update and to delete, to leave the
+        spot with the given extended info.  Raises ValidationError for bad values.
+        """
+        current = {}
+        to_delete = []
+        stored = SpotExtendedInfo.objects.filter(spot=spot).order_by('pk') if spot.pk else []
+        for info in stored:
+            if info.key in current or info.key not in extended_info:
+                to_delete.append(info)
             else:
-                spot.delete()
-                response = HttpResponse('{"error":"' + str(errors) + '"}')
-                response.status_code = 400
-                return response
-
-            queryset = SpotAvailableHours.objects.filter(spot=spot)
-            queryset.delete()
-
-            if "extended_info" in new_values:
-                for item in new_values["extended_info"]:
-                    try:
-                        info_obj = SpotExtendedInfo.objects.get(spot=spot, key=item)
-                        info_obj.value = new_values["extended_info"][item]
-                        info_obj.save()
-                    except:
-                        SpotExtendedInfo.objects.create(key=item, value=new_values["extended_info"][item], spot=spot)
-                for info in SpotExtendedInfo.objects.values():
-                    if info['key'] not in new_values['extended_info']:
-                        SpotExtendedInfo.objects.filter(key=info['key']).delete()
-            elif "extended_info" not in new_values:
-                SpotExtendedInfo.objects.all().delete()
+                current[info.key] = info
+
+        to_add = []
+        to_update = []
+        for key in extended_info:
+            value = unicode(extended_info[key])
+            if key not in current:
+                info = SpotExtendedInfo(spot=spot, key=key, value=value)
+                to_add.append(info)
+            elif current[key].value != value:
+                info = current[key]
+                info.value = value
+                to_update.append(info)
+            else:
+                continue
+            # The spot is checked by the form, so just the key and value
+            info.clean_fields(exclude=['spot'])
+
+        return to_add, to_update, to_delete
+
+    def available_hours_changes(self, spot, available_hours):
+        """ Returns the SpotAvailableHours to add and to delete, to leave the spot with
+        the given hours.  Overlapping windows are merged, like SpotAvailableHours.save
+        does, and invalid windows are skipped.
+        """
+        time_field = SpotAvailableHours._meta.get_field('start_time')
+        wanted = []
+        for day, day_name in SpotAvailableHours._meta.get_field('day').choices:
+            windows = []
+            for window in available_hours.get(day_name, []):
+                try:
+                    start_time = time_field.to_python(window[0])
+                    end_time = time_field.to_python(window[1])
+                except (ValidationError, IndexError, TypeError):
+                    continue
+                if start_time is not None and end_time is not None and start_time < end_time:
+                    windows.append([start_time, end_time])
+
+            windows.sort()
+            merged = []
+            for window in windows:
+                if merged and window[0] <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], window[1])
+                else:
+                    merged.append(window)
+            wanted.extend([(day, start_time, end_time) for start_time, end_time in merged])
+
+        current = {}
+        stored = SpotAvailableHours.objects.filter(spot=spot) if spot.pk else []
+        for hours in stored:
+            current.setdefault((hours.day, hours.start_time, hours.end_time), []).append(hours)
+
+        to_add = []
+        for window in wanted:
+            if current.get(window):
+                current[window].pop()
+            else:
+                to_add.append(SpotAvailableHours(spot=spot, day=window[0], start_time=window[1], end_time=window[2]))
 
-            try:
-                available_hours = new_values["available_hours"]
-                for day in [["m", "monday"],
-                            ["t", "tuesday"],
-                            ["w", "wednesday"],
-                            ["th", "thursday"],
-                            ["f", "friday"],
-                            ["sa", "saturday"],
-                            ["su", "sunday"]]:
-                    if day[1] in available_hours:
-                        day_hours = available_hours[day[1]]
-                        for window in day_hours:
-                            SpotAvailableHours.objects.create(spot=spot, day=day[0], start_time=window[0], end_time=window[1])
-            except:
-                pass
+        to_delete = []
+        for rows in current.values():
+            to_delete.extend(rows)
+        return to_add, to_delete
@@ -0,0 +1,95 @@
+""" Copyright 2012, 2013 UW Information Technology, University of Washington
+
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+
+
+Streams lists of spots out as JSON, a chunk of spots at a time, instead of
+building the whole response in memory.  Turn it on in your settings.py with:
+
+SPOTSEEKER_STREAMING_RESPONSES = True
+
+Middleware that reads response.content, like django's ETag support in
+CommonMiddleware, will still build the whole response.
+"""
+
+from django.http import HttpResponse
+from django.conf import settings
+from spotseeker_server.models import Spot
+import logging
+
+DEFAULT_CHUNK_SIZE = 200
+
+logger = logging.getLogger(__name__)
+
+
+def streaming_enabled():
+    return getattr(settings, 'SPOTSEEKER_STREAMING_RESPONSES', False)
+
+
+class StreamingJSONResponse(HttpResponse):
+    """ An HttpResponse whose content comes from an iterator of strings.  Since the
+    size isn't known up front, callbacks added with on_complete are given it once
+    the last chunk has gone out.
+    """
+    streaming = True
+
+    def __init__(self, chunks):
+        self.completion_callbacks = []
+        super(StreamingJSONResponse, self).__init__(self.counted(chunks), content_type="application/json")
+
+    def on_complete(self, callback):
+        self.completion_callbacks.append(callback)
+
+    def counted(self, chunks):
+        size = 0
+        try:
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+        except GeneratorExit:
+            # The server closes the response part way through when the client goes away
+            logger.info("Client disconnected after {0} bytes of a streamed response".format(size))
+            raise
+        for callback in self.completion_callbacks:
+            callback(size)
+
+
+def spot_json_chunks(query, chunk_size=None):
+    """ Yields the JSON list of the spots in query, one chunk of spots at a time.
+    Chunks are fetched in id order, each one starting after the last id of the
+    one before, so no chunk needs an OFFSET.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'SPOTSEEKER_STREAMING_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+    yield "["
+    separator = ""
+    last_pk = None
+    while True:
+        chunk_query = query.order_by('pk')
+        if last_pk is not None:
+            chunk_query = chunk_query.filter(pk__gt=last_pk)
+        spots = list(chunk_query[:chunk_size])
+        if not spots:
+            break
+
+        # Joins in the search can return a spot more than once
+        unique = []
+        for spot in spots:
+            if spot.pk != last_pk:
+                unique.append(spot)
+                last_pk = spot.pk
+
+        yield separator + ",".join(Spot.bulk_json_fragments(unique))
+        separator = ","
+    yield "]"
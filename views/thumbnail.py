@@ -11,16 +11,316 @@
     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
     See the License for the specific language governing permissions and
     limitations under the License.
+
+
+Thumbnails of spot images.  With the thumbnail cache on (see
+spotseeker_server.thumbnail_cache), the sizes clients use most can be
+rendered as soon as an image is uploaded or changed, by a pool of background
+threads, so the first request for them is already a cache hit.  List them in
+your settings.py the way they appear after thumb/ in a thumbnail url:
+
+SPOTSEEKER_THUMBNAIL_PRESETS = ["100x100", "constrain/width:300", "constrain/width:800,height:600"]
+SPOTSEEKER_THUMBNAIL_WORKERS = 2  # Threads rendering presets, 0 renders them in the request
+
+A JPEG can be resized the "fast" way, where the decoder only decodes it at
+1/2, 1/4 or 1/8 scale - as small as it can without going under the size of
+the thumbnail - before the usual resample to the final size.  A thumbnail
+much smaller than its image takes a fraction of the time and memory.  The
+other images are resized the same way in both modes.  Clients can ask for a
+mode with ?resize=fast or ?resize=quality, and the default is set with:
+
+SPOTSEEKER_THUMBNAIL_RESIZE = "quality"
+
+manage.py benchmark_thumbnails compares the two.
+
+Thumbnails are encoded with a quality profile - "fast", "balanced" or
+"archive" - picked with ?profile=, or by default with:
+
+SPOTSEEKER_THUMBNAIL_PROFILE = "archive"
+
+"archive" keeps lossless images lossless, and JPEGs at quality 95.  The
+profiles themselves can be replaced with SPOTSEEKER_THUMBNAIL_PROFILES.
+
+The format of a thumbnail is negotiated from the Accept header.  Clients that
+accept image/webp get WebP, if PIL was built with it.  With a profile other
+than "archive", a client that lists image/jpeg gets an opaque PNG as a JPEG,
+which is much smaller for a photo.  Otherwise a thumbnail is in the format of
+its image.  "balanced" JPEGs are optimized and progressive, and "archive" ones
+are encoded just as thumbnails were before there were profiles.  Preset thumbnails are rendered in the
+image's format with the default profile.
 """
 
 from spotseeker_server.views.rest_dispatch import RESTDispatch
 from spotseeker_server.models import SpotImage, Spot
 from django.http import HttpResponse
 from django.utils.http import http_date
+from django.utils.cache import patch_vary_headers
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from spotseeker_server.require_auth import *
+from spotseeker_server.thumbnail_cache import thumbnail_cache
+from spotseeker_server.views.delivery import file_response
+from spotseeker_server.image_storage import CONTENT_TYPES, EXTENSIONS
 from cStringIO import StringIO
 import Image
 import time
+import os
+import re
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+
+DEFAULT_WORKERS = 2
+
+RESIZE_MODES = ["quality", "fast"]
+
+DEFAULT_PROFILE = "archive"
+
+# Options for each encoder, and "lossless" to keep a PNG or GIF lossless
+QUALITY_PROFILES = {
+    "fast": {"quality": 70, "method": 0},
+    "balanced": {"quality": 82, "method": 4, "optimize": True, "progressive": True},
+    # The encoder settings thumbnails had before profiles, byte for byte
+    "archive": {"quality": 95, "lossless": True},
+}
+
+# The profile options each format's encoder takes
+ENCODER_OPTIONS = {
+    "JPEG": ["quality", "optimize", "progressive"],
+    "WEBP": ["quality", "method"],
+    "PNG": ["optimize"],
+    "GIF": [],
+}
+
+OUTPUT_TYPES = dict(CONTENT_TYPES, WEBP="image/webp")
+
+OUTPUT_EXTENSIONS = dict(((image_format, EXTENSIONS[content_type]) for image_format, content_type in CONTENT_TYPES.items()),
+                         WEBP=".webp")
+
+PRESET_PATTERNS = [
+    re.compile(r'^(?P<width>\d+)x(?P<height>\d+)$'),
+    re.compile(r'^constrain/width:(?P<width>\d+)(?:,height:(?P<height>\d+))?$'),
+    re.compile(r'^constrain/height:(?P<height>\d+)(?:,width:(?P<width>\d+))?$'),
+]
+
+logger = logging.getLogger(__name__)
+
+
+def thumbnail_size(img, thumb_width, thumb_height, constrain):
+    """ Returns the (width, height) of a thumbnail, as ints.  A constrained
+    thumbnail without a width or height is bounded by the image's own.
+    """
+    if constrain is True:
+        if thumb_width is None:
+            thumb_width = img.width
+
+        if thumb_height is None:
+            thumb_height = img.height
+
+    return int(thumb_width), int(thumb_height)
+
+
+def default_resize_mode():
+    return getattr(settings, 'SPOTSEEKER_THUMBNAIL_RESIZE', 'quality')
+
+
+def quality_profiles():
+    return getattr(settings, 'SPOTSEEKER_THUMBNAIL_PROFILES', QUALITY_PROFILES)
+
+
+def default_profile():
+    return getattr(settings, 'SPOTSEEKER_THUMBNAIL_PROFILE', DEFAULT_PROFILE)
+
+
+def image_format(img):
+    """ Returns the PIL format of a SpotImage, from its content type.
+    """
+    for name, content_type in CONTENT_TYPES.items():
+        if content_type == img.content_type:
+            return name
+    return None
+
+
+def webp_supported():
+    # The WebP plugin only registers a save handler if PIL was built with libwebp
+    Image.init()
+    return "WEBP" in Image.SAVE
+
+
+def accepted_types(request):
+    """ Returns the media types listed in the request's Accept header, leaving
+    out any refused with q=0.  Wildcards are kept as they are.
+    """
+    types = set()
+    for media_range in request.META.get("HTTP_ACCEPT", "").split(","):
+        params = media_range.split(";")
+        media_type = params[0].strip().lower()
+        quality = 1.0
+        for param in params[1:]:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    pass
+        if media_type and quality > 0:
+            types.add(media_type)
+    return types
+
+
+def is_opaque(path):
+    """ Returns True if the image file at path has no transparency.  Only the header is read.
+    """
+    im = Image.open(path)
+    return im.mode in ("1", "L", "RGB", "CMYK", "YCbCr") and "transparency" not in im.info
+
+
+def thumbnail_format(img, accepted, profile):
+    """ Returns the format to encode a thumbnail of a SpotImage in, for a client
+    that accepts the media types in accepted.
+    """
+    source_format = image_format(img)
+    if "image/webp" in accepted and webp_supported():
+        return "WEBP"
+    lossless = quality_profiles()[profile].get("lossless")
+    if source_format == "PNG" and not lossless and "image/jpeg" in accepted and is_opaque(img.image.path):
+        return "JPEG"
+    return source_format
+
+
+def encoding_variant(source_format, output_format, profile):
+    # Empty for a thumbnail in its image's format with the archive profile - what thumbnails always were
+    if output_format in (None, source_format) and profile == DEFAULT_PROFILE:
+        return ""
+    return "-{0}{1}".format(profile, OUTPUT_EXTENSIONS.get(output_format or source_format, ""))
+
+
+def thumbnail_variant(thumb_width, thumb_height, constrain, resize_mode="quality", encoding=""):
+    return "{0}x{1}{2}{3}{4}".format(thumb_width, thumb_height,
+                                     "-constrain" if constrain is True else "",
+                                     "-fast" if resize_mode == "fast" else "",
+                                     encoding)
+
+
+def thumbnail_etag(img, thumb_width, thumb_height, constrain, resize_mode="quality", encoding=""):
+    # The thumbnail only changes when the image does
+    return "{0}-{1}".format(img.etag, thumbnail_variant(thumb_width, thumb_height, constrain, resize_mode, encoding))
+
+
+def thumbnail_cache_key(img, thumb_width, thumb_height, constrain, resize_mode="quality", encoding=""):
+    """ Returns the (group, key) of a thumbnail in the thumbnail cache.  encoding
+    is the encoding_variant of the thumbnail's format and profile.
+    """
+    variant = thumbnail_variant(thumb_width, thumb_height, constrain, resize_mode, encoding)
+    if img.content_hash:
+        # The same bytes make the same thumbnail, whichever image they're in
+        return img.content_hash, variant
+    return str(img.pk), "{0}-{1}".format(img.etag, variant)
+
+
+def render_thumbnail(path, thumb_width, thumb_height, constrain, resize_mode="quality", output_format=None, profile=DEFAULT_PROFILE):
+    """ Returns the thumbnail of the image file at path, encoded in output_format
+    with a quality profile.  With no output_format it's in the image's own format.
+    """
+    im = Image.open(path)
+    if resize_mode == "fast" and im.format == "JPEG":
+        im.draft(im.mode, (thumb_width, thumb_height))
+
+    if constrain is True:
+        im.thumbnail((thumb_width, thumb_height, Image.ANTIALIAS))
+        thumb = im
+    else:
+        thumb = im.resize((thumb_width, thumb_height), Image.ANTIALIAS)
+
+    return encode_thumbnail(thumb, im.format, output_format or im.format, profile)
+
+
+def encode_thumbnail(thumb, source_format, output_format, profile):
+    options = quality_profiles()[profile]
+    save_options = dict((name, options[name]) for name in ENCODER_OPTIONS.get(output_format, []) if name in options)
+
+    if output_format == "JPEG" and thumb.mode not in ("L", "RGB", "CMYK"):
+        thumb = thumb.convert("RGB")
+    elif output_format == "WEBP":
+        if thumb.mode not in ("RGB", "RGBA"):
+            thumb = thumb.convert("RGBA" if thumb.mode in ("LA", "P") or "transparency" in thumb.info else "RGB")
+        if options.get("lossless") and source_format != "JPEG":
+            save_options["lossless"] = True
+
+    tmp = StringIO()
+    thumb.save(tmp, output_format, **save_options)
+    return tmp.getvalue()
+
+
+def thumbnail_presets():
+    """ Returns the (width, height, constrain) of each SPOTSEEKER_THUMBNAIL_PRESETS
+    entry, with None for a width or height left out of a constrained one.
+    """
+    presets = []
+    for preset in getattr(settings, 'SPOTSEEKER_THUMBNAIL_PRESETS', []):
+        for pattern in PRESET_PATTERNS:
+            match = pattern.match(preset)
+            if match:
+                presets.append((match.group('width'), match.group('height'), pattern is not PRESET_PATTERNS[0]))
+                break
+        else:
+            raise ImproperlyConfigured("Not a thumbnail size: {0}".format(preset))
+    return presets
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def preset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(getattr(settings, 'SPOTSEEKER_THUMBNAIL_WORKERS', DEFAULT_WORKERS))
+        return _pool
+
+
+def generate_presets(img):
+    """ Renders the preset thumbnails of an image into the thumbnail cache, in the
+    background.  Returns the AsyncResult of the job, or None if there's nothing to do.
+    """
+    if not thumbnail_cache.enabled():
+        return None
+
+    resize_mode = default_resize_mode()
+    profile = default_profile()
+    encoding = encoding_variant(image_format(img), None, profile)
+    thumbnails = []
+    for thumb_width, thumb_height, constrain in thumbnail_presets():
+        thumb_width, thumb_height = thumbnail_size(img, thumb_width, thumb_height, constrain)
+        if thumb_width > 0 and thumb_height > 0:
+            group, key = thumbnail_cache_key(img, thumb_width, thumb_height, constrain, resize_mode, encoding)
+            thumbnails.append((thumb_width, thumb_height, constrain, group, key))
+    if not thumbnails:
+        return None
+
+    # The job only gets what it needs from the image, so it never waits on the database
+    args = (img.pk, img.image.path, thumbnails, resize_mode, profile)
+    if not getattr(settings, 'SPOTSEEKER_THUMBNAIL_WORKERS', DEFAULT_WORKERS):
+        render_presets(*args)
+        return None
+    return preset_pool().apply_async(render_presets, args)
+
+
+def render_presets(image_id, path, thumbnails, resize_mode, profile=DEFAULT_PROFILE):
+    for thumb_width, thumb_height, constrain, group, key in thumbnails:
+        cached = thumbnail_cache.open(group, key)
+        if cached is not None:
+            cached.close()
+            continue
+        try:
+            data = render_thumbnail(path, thumb_width, thumb_height, constrain, resize_mode, profile=profile)
+        except Exception as e:
+            # Most likely the image was changed or deleted since the job was queued
+            logger.warning("Unable to render thumbnail {0} of image {1}: {2}".format(key, image_id, e))
+            return
+        thumbnail_cache.set(group, key, data)
 
 
 class ThumbnailView(RESTDispatch):
@@ -30,46 +330,56 @@ class ThumbnailView(RESTDispatch):
     def GET(self, request, spot_id, image_id, thumb_width=None, thumb_height=None, constrain=False):
         try:
             img = SpotImage.objects.get(pk=image_id)
-            spot = img.spot
-
-            if int(spot.pk) != int(spot_id):
+            if int(img.spot_id) != int(spot_id):
                 raise Exception("Image Spot ID doesn't match spot id in url")
 
-            if constrain is True:
-                if thumb_width is None:
-                    thumb_width = img.width
-
-                if thumb_height is None:
-                    thumb_height = img.height
-
+            thumb_width, thumb_height = thumbnail_size(img, thumb_width, thumb_height, constrain)
         except Exception as e:
             response = HttpResponse('{"error":"Bad Image URL"}')
             response.status_code = 404
             return response
 
-        thumb_width = int(thumb_width)
-        thumb_height = int(thumb_height)
-
         if thumb_height <= 0 or thumb_width <= 0:
             response = HttpResponse('{"error":"Bad Image URL"}')
             response.status_code = 404
             return response
 
-        image = img.image
-        im = Image.open(image.path)
+        resize_mode = request.GET.get('resize', default_resize_mode())
+        if resize_mode not in RESIZE_MODES:
+            response = HttpResponse('{"error":"Unknown resize mode"}')
+            response.status_code = 400
+            return response
 
-        if constrain is True:
-            im.thumbnail((thumb_width, thumb_height, Image.ANTIALIAS))
-            thumb = im
-        else:
-            thumb = im.resize((thumb_width, thumb_height), Image.ANTIALIAS)
+        profile = request.GET.get('profile', default_profile())
+        if profile not in quality_profiles():
+            response = HttpResponse('{"error":"Unknown quality profile"}')
+            response.status_code = 400
+            return response
+
+        output_format = thumbnail_format(img, accepted_types(request), profile)
+        content_type = OUTPUT_TYPES.get(output_format, img.content_type)
+        encoding = encoding_variant(image_format(img), output_format, profile)
 
-        tmp = StringIO()
-        thumb.save(tmp, im.format, quality=95)
-        tmp.seek(0)
+        etag = thumbnail_etag(img, thumb_width, thumb_height, constrain, resize_mode, encoding)
+        not_modified = self.not_modified(request, etag, img.modification_date)
+        if not_modified:
+            patch_vary_headers(not_modified, ["Accept"])
+            return not_modified
+
+        group, key = thumbnail_cache_key(img, thumb_width, thumb_height, constrain, resize_mode, encoding)
+        cached = thumbnail_cache.open(group, key)
+        if cached is not None:
+            response = file_response(request, thumbnail_cache.path(group, key), content_type, etag, cached)
+        else:
+            data = render_thumbnail(img.image.path, thumb_width, thumb_height, constrain, resize_mode, output_format, profile)
+            thumbnail_cache.set(group, key, data)
+            response = HttpResponse(data)
+            response["Content-Length"] = len(data)
 
-        response = HttpResponse(tmp.getvalue())
+        self.set_validators(response, etag, img.modification_date)
         # 7 day timeout?
         response['Expires'] = http_date(time.time() + 60 * 60 * 24 * 7)
-        response["Content-type"] = img.content_type
+        response["Content-type"] = content_type
+        # The format depends on the Accept header
+        patch_vary_headers(response, ["Accept"])
         return response